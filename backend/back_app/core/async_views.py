@@ -0,0 +1,46 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+class AsyncViewMixin:
+    """
+    Serves a DRF view whose handlers are coroutines. Authentication,
+    permission and throttle checks and ``finalize_response`` may hit the
+    database or the cache, so they run through ``sync_to_async``; handlers
+    that stay synchronous (such as ``options``) are called as they are.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = await sync_to_async(self.finalize_response)(
+            request, response, *args, **kwargs
+        )
+        return self.response
+
+
+def select_view(sync_view, async_view):
+    """Returns the async variant of a view when ``ASYNC_VIEWS`` is on."""
+    return async_view if settings.ASYNC_VIEWS else sync_view
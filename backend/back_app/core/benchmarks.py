@@ -0,0 +1,83 @@
+import json
+import math
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "runs": len(samples),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+    }
+
+
+def time_call(func, repeat, warmup=1):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def write_report(path, results):
+    with open(path, "w") as report:
+        json.dump(results, report, indent=2, default=str)
+
+
+def describe_environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            timeout=5,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "timestamp": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+    }
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Compares the p50 and p95 of every scenario present in both reports; a
+    scenario regressed when either grew by more than ``threshold`` (0.1 for
+    10%).
+    """
+    comparison = {}
+    for name, result in current.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        entry = {}
+        for key in ("p50_ms", "p95_ms"):
+            if previous.get(key):
+                entry[key] = round(result[key] / previous[key] - 1, 3)
+        entry["regressed"] = any(change > threshold for change in entry.values())
+        comparison[name] = entry
+    return comparison
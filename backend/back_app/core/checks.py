@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+from django.utils.module_loading import import_string
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Throttle buckets and concurrency slots live in the default cache, so a
+    deployment with several processes needs a cache they all share.
+    """
+    limits = any(settings.THROTTLING["RATES"].values())
+    limits = limits or bool(settings.THROTTLING["CONCURRENCY"])
+    backend = import_string(settings.CACHES["default"]["BACKEND"])
+    if limits and issubclass(backend, (LocMemCache, DummyCache)):
+        return [
+            Error(
+                "Throttling and concurrency limits need a cache shared by all "
+                f"processes, but the default cache is {backend.__name__}.",
+                hint="Set CACHE_BACKEND and CACHE_LOCATION, e.g. to Redis.",
+                id="core.E001",
+            )
+        ]
+    return []
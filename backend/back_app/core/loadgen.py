@@ -0,0 +1,157 @@
+import http.client
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlsplit
+
+VIEW_METRIC_LINE = re.compile(r'^(\w+)\{view="([^"]*)"\} (\S+)$')
+
+
+class HTTPTarget:
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        if parts.scheme == "https":
+            self.connection_class = http.client.HTTPSConnection
+        else:
+            self.connection_class = http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+
+    def connect(self):
+        return self.connection_class(self.netloc, timeout=self.timeout)
+
+    def send(self, connection, method, path, params=None, data=None, headers=None):
+        url = self.prefix + path
+        if params:
+            url += "?" + urlencode(params)
+        headers = dict(headers or {})
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers["Content-Type"] = "application/json"
+        connection.request(method, url, body=body, headers=headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def request(self, method, path, **kwargs):
+        connection = self.connect()
+        try:
+            return self.send(connection, method, path, **kwargs)
+        finally:
+            connection.close()
+
+
+def run_load(
+    target, make_request, concurrency, requests=None, duration=None, keep_alive=False
+):
+    """
+    Sends requests from ``concurrency`` threads until ``requests`` have been
+    sent or ``duration`` seconds have passed. ``make_request(i)`` returns the
+    keyword arguments of ``HTTPTarget.send`` for the i-th request.
+
+    Each request opens its own connection unless ``keep_alive`` is set: the
+    development server writes headers and body in separate packets, which
+    over a reused connection adds a ~40 ms delayed-ACK stall to every
+    response.
+    """
+    if requests is None and duration is None:
+        raise ValueError("Either requests or duration is required.")
+    sequence = itertools.count()
+    deadline = None if duration is None else time.monotonic() + duration
+    lock = threading.Lock()
+    samples = []
+    statuses = Counter()
+    errors = Counter()
+
+    def worker():
+        connection = target.connect()
+        local_samples = []
+        local_statuses = Counter()
+        local_errors = Counter()
+        while True:
+            i = next(sequence)
+            if requests is not None and i >= requests:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            started = time.perf_counter()
+            if not keep_alive:
+                connection.close()
+                connection = target.connect()
+            try:
+                status, _ = target.send(connection, **make_request(i))
+            except (OSError, http.client.HTTPException) as exc:
+                local_errors[type(exc).__name__] += 1
+                connection.close()
+                connection = target.connect()
+                continue
+            local_samples.append((time.perf_counter() - started) * 1000)
+            local_statuses[status] += 1
+        connection.close()
+        with lock:
+            samples.extend(local_samples)
+            statuses.update(local_statuses)
+            errors.update(local_errors)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "samples": samples,
+        "statuses": dict(statuses),
+        "errors": dict(errors),
+        "wall_seconds": time.perf_counter() - started,
+    }
+
+
+def parse_view_metric(text, name):
+    """Reads the per-view values of metric ``name`` from a /metrics page."""
+    values = {}
+    for line in text.splitlines():
+        match = VIEW_METRIC_LINE.match(line)
+        if match and match[1] == name:
+            values[match[2]] = float(match[3])
+    return values
+
+
+class SlowUpstreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        title = self.path.rsplit("/", 1)[-1].replace("-", " ").title()
+        body = f"<html><body><h1>{title}</h1></body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowUpstream(ThreadingHTTPServer):
+    """Answers every GET with a book page titled after the path, ``delay`` late."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, delay):
+        super().__init__(("127.0.0.1", 0), SlowUpstreamHandler)
+        self.delay = delay
+        self.url = f"http://127.0.0.1:{self.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
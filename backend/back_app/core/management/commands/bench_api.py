@@ -0,0 +1,322 @@
+import json
+import time
+
+from core.benchmarks import (
+    compare_reports,
+    describe_environment,
+    summarize,
+    write_report,
+)
+from core.loadgen import HTTPTarget, parse_view_metric, run_load
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from library.benchmarks import parse_count, seed_catalogue
+from library.models import Category
+from users.authentication import UserClaimsTokenObtainPairSerializer
+from users.benchmarks import PASSWORD, USERNAME, seed_users
+
+TERMS = ["dragon", "silent garden", "murakami", "kingd"]
+
+
+def book_list(context, i):
+    return {"path": reverse("book-list")}
+
+
+def book_list_filtered(context, i):
+    categories = context["categories"]
+    return {
+        "path": reverse("book-list"),
+        "params": {
+            "category__id": categories[i % len(categories)],
+            "year_from": 1900 + i % 100,
+        },
+    }
+
+
+def book_search(context, i):
+    return {"path": reverse("book-list"), "params": {"search": TERMS[i % len(TERMS)]}}
+
+
+def books_by_category(context, i):
+    categories = context["categories"]
+    category_id = categories[i % len(categories)]
+    return {"path": reverse("books-by-category", args=[category_id])}
+
+
+def export_csv(context, i):
+    return {
+        "path": reverse("export-books"),
+        "params": {"format": "csv"},
+        "auth": "admin",
+    }
+
+
+def login(context, i):
+    return {
+        "method": "POST",
+        "path": reverse("token_obtain_pair"),
+        "data": {"username": USERNAME.format(1), "password": context["password"]},
+    }
+
+
+def refresh(context, i):
+    return {
+        "method": "POST",
+        "path": reverse("token_refresh"),
+        "data": {"refresh": context["refresh"]},
+    }
+
+
+def profile(context, i):
+    return {"path": reverse("user-retrieve"), "auth": "user"}
+
+
+# name: (URL name the requests resolve to, request builder, share of --requests)
+SCENARIOS = {
+    "book-list": ("book-list", book_list, 1),
+    "book-list-filtered": ("book-list", book_list_filtered, 1),
+    "book-search": ("book-list", book_search, 1),
+    "books-by-category": ("books-by-category", books_by_category, 1),
+    "export-csv": ("export-books", export_csv, 0.05),
+    "login": ("token_obtain_pair", login, 0.1),
+    "refresh": ("token_refresh", refresh, 1),
+    "profile": ("user-retrieve", profile, 1),
+}
+
+
+def build_request(context, scenario, i):
+    spec = {"method": "GET", **SCENARIOS[scenario][1](context, i)}
+    auth = spec.pop("auth", None)
+    if auth:
+        spec["headers"] = {"Authorization": f"Bearer {context['tokens'][auth]}"}
+    return spec
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the API endpoints and report throughput, p50/p95/p99 latency and "
+        "queries per request. In client mode the requests go through the Django "
+        "test client against a catalogue of --books seeded inside a transaction "
+        "that is rolled back afterwards. In http mode they are sent to a running "
+        "server at --base-url from --concurrency threads; seed it first with "
+        "seed_benchmark_data and start it with THROTTLE_ANON_RATE= and "
+        "THROTTLE_USER_RATE= so throttling is off. Query counts in http mode "
+        "come from /metrics and need a single-process server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=["client", "http"], default="client")
+        parser.add_argument("--books", default="10k")
+        parser.add_argument("--categories", type=int, default=200)
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--scenario", action="append", choices=list(SCENARIOS), dest="scenarios"
+        )
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear the cache before every request (client mode).",
+        )
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--duration", type=float)
+        parser.add_argument("--keep-alive", action="store_true")
+        parser.add_argument("--password", default=PASSWORD)
+        parser.add_argument("--json", dest="json_path")
+        parser.add_argument("--compare", dest="baseline_path")
+        parser.add_argument("--threshold", type=float, default=0.1)
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args, **options):
+        scenarios = options["scenarios"] or list(SCENARIOS)
+        report = {
+            "environment": describe_environment(),
+            "mode": options["mode"],
+            "options": {
+                key: options[key]
+                for key in (
+                    "books",
+                    "categories",
+                    "requests",
+                    "concurrency",
+                    "keep_alive",
+                    "cold",
+                )
+            },
+        }
+        if options["mode"] == "client":
+            report["scenarios"] = self.run_client(scenarios, options)
+        else:
+            report["scenarios"] = self.run_http(scenarios, options)
+
+        regressed = []
+        if options["baseline_path"]:
+            with open(options["baseline_path"]) as baseline:
+                baseline = json.load(baseline)
+            report["baseline_commit"] = baseline.get("environment", {}).get("commit")
+            report["comparison"] = compare_reports(
+                baseline["scenarios"], report["scenarios"], options["threshold"]
+            )
+            for name, entry in report["comparison"].items():
+                self.stdout.write(f"{name:>20} vs baseline: {entry}")
+                if entry["regressed"]:
+                    regressed.append(name)
+
+        if options["json_path"]:
+            write_report(options["json_path"], report)
+        if regressed and options["fail_on_regression"]:
+            raise CommandError(f"Regressed: {', '.join(regressed)}")
+
+    def summarize_run(self, samples, wall_seconds):
+        return {
+            **summarize(samples),
+            "throughput_rps": round(len(samples) / wall_seconds, 1),
+        }
+
+    def run_client(self, scenarios, options):
+        client = Client()
+        results = {}
+        no_throttling = {**settings.THROTTLING, "RATES": {}}
+        with override_settings(THROTTLING=no_throttling), transaction.atomic():
+            books = parse_count(options["books"])
+            if books:
+                seed_catalogue(books, categories=options["categories"])
+            admin, user = seed_users(2, staff=1, password=options["password"])
+            refresh_token = UserClaimsTokenObtainPairSerializer.get_token(user)
+            context = {
+                "categories": [
+                    str(pk) for pk in Category.objects.values_list("pk", flat=True)
+                ],
+                "password": options["password"],
+                "refresh": str(refresh_token),
+                "tokens": {
+                    "user": str(refresh_token.access_token),
+                    "admin": str(
+                        UserClaimsTokenObtainPairSerializer.get_token(
+                            admin
+                        ).access_token
+                    ),
+                },
+            }
+
+            for scenario in scenarios:
+                runs = max(1, round(options["requests"] * SCENARIOS[scenario][2]))
+                samples = []
+                statuses = {}
+                self.client_request(client, build_request(context, scenario, 0))
+                for i in range(runs):
+                    spec = build_request(context, scenario, i)
+                    if options["cold"]:
+                        cache.clear()
+                    started = time.perf_counter()
+                    status = self.client_request(client, spec)
+                    samples.append((time.perf_counter() - started) * 1000)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+                # Queries are counted on a cache miss.
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    self.client_request(client, build_request(context, scenario, 0))
+                results[scenario] = {
+                    **self.summarize_run(samples, sum(samples) / 1000),
+                    "queries": len(queries.captured_queries),
+                    "statuses": statuses,
+                }
+                self.stdout.write(f"{scenario:>20}: {results[scenario]}")
+            transaction.set_rollback(True)
+        return results
+
+    def client_request(self, client, spec):
+        extra = {}
+        if "headers" in spec:
+            extra["HTTP_AUTHORIZATION"] = spec["headers"]["Authorization"]
+        if spec["method"] == "POST":
+            response = client.post(
+                spec["path"],
+                json.dumps(spec["data"]),
+                content_type="application/json",
+                **extra,
+            )
+        else:
+            response = client.get(spec["path"], spec.get("params"), **extra)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response.status_code
+
+    def run_http(self, scenarios, options):
+        target = HTTPTarget(options["base_url"])
+        context = {"password": options["password"], "tokens": {}}
+        for role, index in (("admin", 0), ("user", 1)):
+            status, content = target.request(
+                "POST",
+                reverse("token_obtain_pair"),
+                data={
+                    "username": USERNAME.format(index),
+                    "password": options["password"],
+                },
+            )
+            if status != 200:
+                raise CommandError(
+                    f"Could not log in as {USERNAME.format(index)} ({status}); "
+                    "run seed_benchmark_data against the server's database first."
+                )
+            tokens = json.loads(content)
+            context["tokens"][role] = tokens["access"]
+            if role == "user":
+                context["refresh"] = tokens["refresh"]
+        _, content = target.request("GET", reverse("category-list"))
+        context["categories"] = [category["id"] for category in json.loads(content)]
+
+        results = {}
+        for scenario in scenarios:
+            view = SCENARIOS[scenario][0]
+            before = self.read_query_metrics(target, context)
+            run = run_load(
+                target,
+                lambda i: build_request(context, scenario, i),
+                options["concurrency"],
+                requests=(
+                    None
+                    if options["duration"]
+                    else max(1, round(options["requests"] * SCENARIOS[scenario][2]))
+                ),
+                duration=options["duration"],
+                keep_alive=options["keep_alive"],
+            )
+            after = self.read_query_metrics(target, context)
+            if not run["samples"]:
+                raise CommandError(f"{scenario}: no responses, errors {run['errors']}")
+
+            queries = None
+            if before is not None and after is not None:
+                count = after[1].get(view, 0) - before[1].get(view, 0)
+                if count:
+                    total = after[0].get(view, 0) - before[0].get(view, 0)
+                    queries = round(total / count, 2)
+            results[scenario] = {
+                **self.summarize_run(run["samples"], run["wall_seconds"]),
+                "queries": queries,
+                "statuses": run["statuses"],
+                "errors": run["errors"],
+            }
+            self.stdout.write(f"{scenario:>20}: {results[scenario]}")
+        return results
+
+    def read_query_metrics(self, target, context):
+        status, content = target.request(
+            "GET",
+            reverse("metrics"),
+            headers={"Authorization": f"Bearer {context['tokens']['admin']}"},
+        )
+        if status != 200:
+            return None
+        text = content.decode()
+        return (
+            parse_view_metric(text, "http_request_db_queries_sum"),
+            parse_view_metric(text, "http_request_db_queries_count"),
+        )
@@ -0,0 +1,79 @@
+import time
+
+from core.benchmarks import describe_environment, summarize, write_report
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request cost of getting a database connection. Each "
+        "simulated request runs --queries queries between the connection "
+        "handling Django does on request_started and request_finished, with a "
+        "new connection per request (CONN_MAX_AGE=0), persistent connections "
+        "with health checks, and psycopg's pool. 'backends' is the number of "
+        "PostgreSQL server processes that served the requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--queries", type=int, default=1)
+        parser.add_argument("--json", dest="json_path")
+
+    def handle(self, *args, **options):
+        base = connections[DEFAULT_DB_ALIAS].settings_dict
+        options_without_pool = {
+            key: value for key, value in base["OPTIONS"].items() if key != "pool"
+        }
+        configurations = {
+            "new-connection": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False},
+            "persistent": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True},
+        }
+        if is_psycopg3:
+            configurations["pool"] = {
+                "CONN_MAX_AGE": 0,
+                "CONN_HEALTH_CHECKS": True,
+                "OPTIONS": {**options_without_pool, "pool": {"min_size": 1}},
+            }
+        else:
+            self.stderr.write("psycopg 3 is not installed, skipping the pool.")
+
+        report = {"environment": describe_environment(), "scenarios": {}}
+        for name, overrides in configurations.items():
+            # Registered on the global handler: connection setup, such as
+            # django.contrib.postgres' type handlers, looks the alias up there.
+            alias = f"bench-{name}"
+            connections.settings[alias] = {
+                **base,
+                "OPTIONS": options_without_pool,
+                **overrides,
+            }
+            connection = connections[alias]
+            try:
+                samples, backends = self.run_requests(connection, options)
+            finally:
+                connection.close()
+                if connection.settings_dict["OPTIONS"].get("pool"):
+                    connection.close_pool()
+                del connections[alias]
+                del connections.settings[alias]
+            report["scenarios"][name] = {**summarize(samples), "backends": backends}
+            self.stdout.write(f"{name:>15}: {report['scenarios'][name]}")
+
+        if options["json_path"]:
+            write_report(options["json_path"], report)
+
+    def run_requests(self, connection, options):
+        samples = []
+        backends = set()
+        for _ in range(options["requests"]):
+            started = time.perf_counter()
+            connection.close_if_unusable_or_obsolete()
+            with connection.cursor() as cursor:
+                for _ in range(options["queries"]):
+                    cursor.execute("SELECT pg_backend_pid()")
+                    backends.add(cursor.fetchone()[0])
+            connection.close_if_unusable_or_obsolete()
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples, len(backends)
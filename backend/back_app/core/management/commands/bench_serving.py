@@ -0,0 +1,155 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from core.benchmarks import describe_environment, summarize, write_report
+from core.loadgen import HTTPTarget, SlowUpstream, run_load
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from library.cache import bump_generation
+from library.models import Book, ScrapedPage
+from users.benchmarks import PASSWORD, USERNAME, seed_users
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync (gunicorn gthread) and async (gunicorn + uvicorn) "
+        "serving modes on the scrape endpoint against an upstream that answers "
+        "after --upstream-delay seconds. Each mode runs gunicorn.conf.py with "
+        "--workers workers (and --threads threads in wsgi mode) and is loaded "
+        "at every --concurrency level; throttling and the scrape concurrency "
+        "limit are lifted so that the server is the bottleneck. The servers "
+        "use this process's database; the scraped books are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mode", action="append", choices=["wsgi", "asgi"], dest="modes"
+        )
+        parser.add_argument(
+            "--concurrency", action="append", type=int, dest="concurrency_levels"
+        )
+        parser.add_argument("--requests", type=int, default=64)
+        parser.add_argument("--upstream-delay", type=float, default=0.5)
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--password", default=PASSWORD)
+        parser.add_argument("--json", dest="json_path")
+
+    def handle(self, *args, **options):
+        modes = options["modes"] or ["wsgi", "asgi"]
+        levels = options["concurrency_levels"] or [4, 16, 64]
+        report = {
+            "environment": describe_environment(),
+            "options": {
+                key: options[key]
+                for key in ("requests", "upstream_delay", "workers", "threads")
+            },
+            "scenarios": {},
+        }
+        seed_users(1, staff=1, password=options["password"])
+        upstream = SlowUpstream(options["upstream_delay"]).start()
+        try:
+            for mode in modes:
+                with self.serve(mode, options) as target:
+                    token = self.log_in(target, options["password"])
+                    for concurrency in levels:
+                        name = f"{mode}-c{concurrency}"
+                        run = run_load(
+                            target,
+                            lambda i: {
+                                "method": "POST",
+                                "path": reverse("scrape-book-info"),
+                                "data": {"url": f"{upstream.url}/books/{name}-{i}"},
+                                "headers": {"Authorization": f"Bearer {token}"},
+                            },
+                            concurrency,
+                            requests=options["requests"],
+                        )
+                        report["scenarios"][name] = {
+                            **summarize(run["samples"]),
+                            "throughput_rps": round(
+                                len(run["samples"]) / run["wall_seconds"], 1
+                            ),
+                            "statuses": run["statuses"],
+                            "errors": run["errors"],
+                        }
+                        self.stdout.write(f"{name:>10}: {report['scenarios'][name]}")
+        finally:
+            upstream.stop()
+            pages = ScrapedPage.objects.filter(url__startswith=upstream.url)
+            Book.objects.filter(pk__in=pages.values("book")).delete()
+            pages.delete()
+            bump_generation(Book)
+
+        if options["json_path"]:
+            write_report(options["json_path"], report)
+
+    @contextmanager
+    def serve(self, mode, options):
+        port = free_port()
+        env = {
+            **os.environ,
+            "SERVER_MODE": mode,
+            "GUNICORN_BIND": f"127.0.0.1:{port}",
+            "WEB_CONCURRENCY": str(options["workers"]),
+            "GUNICORN_THREADS": str(options["threads"]),
+            "GUNICORN_MAX_REQUESTS": "0",
+            "THROTTLE_ANON_RATE": "",
+            "THROTTLE_USER_RATE": "",
+            "SCRAPE_PROCESS_CONCURRENCY": "1000",
+            "SCRAPE_TOTAL_CONCURRENCY": "1000",
+            "SLOW_REQUEST_MS": str(10**6),
+        }
+        with tempfile.TemporaryFile("w+") as log:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+                cwd=settings.BASE_DIR,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=log,
+            )
+            try:
+                target = HTTPTarget(f"http://127.0.0.1:{port}")
+                self.wait_until_ready(target, process, log)
+                yield target
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    def wait_until_ready(self, target, process, log, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                log.seek(0)
+                raise CommandError(f"gunicorn exited:\n{log.read()}")
+            try:
+                status, _ = target.request("GET", reverse("category-list"))
+            except OSError:
+                status = None
+            if status == 200:
+                return
+            time.sleep(0.2)
+        raise CommandError(f"gunicorn did not answer within {timeout} s.")
+
+    def log_in(self, target, password):
+        status, content = target.request(
+            "POST",
+            reverse("token_obtain_pair"),
+            data={"username": USERNAME.format(0), "password": password},
+        )
+        if status != 200:
+            raise CommandError(f"Could not log in as {USERNAME.format(0)} ({status}).")
+        return json.loads(content)["access"]
@@ -0,0 +1,73 @@
+import os
+import re
+import subprocess
+import sys
+
+from core.benchmarks import summarize, write_report
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SETUP_SCRIPT = (
+    "import os, time\n"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')\n"
+    "started = time.perf_counter()\n"
+    "import django\n"
+    "django.setup()\n"
+    "print((time.perf_counter() - started) * 1000)\n"
+)
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Time django.setup() in fresh interpreters and list the slowest imports "
+        "reported by python -X importtime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--json", dest="json_path")
+
+    def run_setup(self, *flags):
+        process = subprocess.run(
+            [sys.executable, *flags, "-c", SETUP_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode:
+            raise CommandError(process.stderr)
+        return float(process.stdout.strip().splitlines()[-1]), process.stderr
+
+    def handle(self, *args, **options):
+        samples = [self.run_setup()[0] for _ in range(options["repeat"])]
+        results = {"django_setup": summarize(samples)}
+        self.stdout.write(f"django.setup(): {results['django_setup']}")
+
+        _, report = self.run_setup("-X", "importtime")
+        imports = []
+        for line in report.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                own, cumulative, indent, module = match.groups()
+                imports.append(
+                    {
+                        "module": module,
+                        "depth": len(indent) // 2,
+                        "self_ms": int(own) / 1000,
+                        "cumulative_ms": int(cumulative) / 1000,
+                    }
+                )
+        top = sorted(
+            (item for item in imports if item["depth"] == 0),
+            key=lambda item: item["cumulative_ms"],
+            reverse=True,
+        )[: options["top"]]
+        results["slowest_imports"] = top
+        for item in top:
+            self.stdout.write(f"{item['cumulative_ms']:>10.1f} ms  {item['module']}")
+
+        if options["json_path"]:
+            write_report(options["json_path"], results)
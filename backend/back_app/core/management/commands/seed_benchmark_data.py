@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from library.benchmarks import clear_catalogue, parse_count, seed_catalogue
+from users.benchmarks import PASSWORD, clear_users, seed_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic catalogue (--books accepts 10k, 100k or 1m) and "
+        "benchmark users bench-user-0 (staff) to bench-user-N for bench_api "
+        "--mode http. The data is committed; --clear removes it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", default="10k")
+        parser.add_argument("--categories", type=int, default=200)
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--staff", type=int, default=1)
+        parser.add_argument("--password", default=PASSWORD)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--clear", action="store_true")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            clear_catalogue()
+            clear_users()
+        if options["clear"]:
+            self.stdout.write("Benchmark data removed.")
+            return
+
+        books = parse_count(options["books"])
+        with transaction.atomic():
+            seed_catalogue(
+                books,
+                categories=options["categories"],
+                batch_size=options["batch_size"],
+                seed=options["seed"],
+            )
+            seed_users(options["users"], options["staff"], options["password"])
+        self.stdout.write(
+            f"Seeded {books} books in {options['categories']} categories and "
+            f"{options['users']} users."
+        )
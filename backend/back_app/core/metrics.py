@@ -0,0 +1,392 @@
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils.crypto import constant_time_compare
+from rest_framework import serializers
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+slow_request_logger = logging.getLogger("core.metrics")
+profile_logger = logging.getLogger("core.profiling")
+
+DEFAULTS = {
+    "SLOW_REQUEST_MS": 500,
+    "MAX_CAPTURED_QUERIES": 100,
+    "PROFILE_HEADER": "HTTP_X_PROFILE",
+    "PROFILE_SAMPLE_RATE": 0,
+    "PROFILE_DIR": None,
+    "PROFILE_TOP": 30,
+    "TOKEN": None,
+}
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_setting(name):
+    return getattr(settings, "METRICS", {}).get(name, DEFAULTS[name])
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, view, value):
+        with self.lock:
+            series = self.series.get(view)
+            if series is None:
+                series = self.series[view] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, view):
+        with self.lock:
+            return self.series[view][2] if view in self.series else 0
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            series = {
+                view: (counts[:], *rest)
+                for view, (counts, *rest) in self.series.items()
+            }
+        for view, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                labels = format_labels((("view", view), ("le", bound)))
+                lines.append(f"{self.name}_bucket{{{labels}}} {cumulative}")
+            labels = format_labels((("view", view),))
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class LabeledCounter:
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.lock = threading.Lock()
+        self.values = Counter()
+
+    def inc(self, *labels):
+        with self.lock:
+            self.values[labels] += 1
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            labels = format_labels(zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+def render_counter(name, documentation, label_name, values):
+    counter = LabeledCounter(name, documentation, (label_name,))
+    counter.values.update({(key,): value for key, value in values.items()})
+    return counter.render()
+
+
+REQUESTS = LabeledCounter(
+    "http_requests_total",
+    "Requests by view, method and status.",
+    ("view", "method", "status"),
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Wall time until the response is returned.",
+    DURATION_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "http_request_db_queries", "Database queries per request.", QUERY_BUCKETS
+)
+DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in database queries.",
+    DURATION_BUCKETS,
+)
+SERIALIZER_DURATION = Histogram(
+    "http_request_serializer_duration_seconds",
+    "Time spent producing serializer data.",
+    DURATION_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Size of non-streamed response bodies.", SIZE_BUCKETS
+)
+REGISTRY = (REQUESTS, REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZER_DURATION)
+REGISTRY += (RESPONSE_SIZE,)
+
+
+def render_metrics():
+    return [line for metric in REGISTRY for line in metric.render()]
+
+
+def reset_metrics():
+    for metric in REGISTRY:
+        metric.reset()
+
+
+class RequestMetrics:
+    """
+    Collects the timings of one request; called for every query through
+    ``record_query``, it also keeps the SQL of the first ``MAX_CAPTURED_QUERIES``
+    queries for the slow request log.
+    """
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0
+        self.queries = []
+        self.max_queries = metrics_setting("MAX_CAPTURED_QUERIES")
+        self.phases = Counter()
+        self.active = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.query_count += 1
+            self.db_time += duration
+            if len(self.queries) < self.max_queries:
+                self.queries.append((duration, sql))
+
+
+_current = ContextVar("request_metrics", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_recorder():
+    """
+    Puts ``record_query`` in front of the execute wrappers of this thread's
+    connections for good. It reports to the request of the current context,
+    which ``sync_to_async`` carries into the thread the ORM runs in under ASGI.
+    """
+    for connection in connections.all():
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def timed(phase):
+    """Adds the time spent in the block to ``phase`` of the current request."""
+    metrics = _current.get()
+    if metrics is None or phase in metrics.active:
+        yield
+        return
+    metrics.active.add(phase)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phases[phase] += time.perf_counter() - started
+        metrics.active.discard(phase)
+
+
+class TimedSerializerMixin:
+    @property
+    def data(self):
+        with timed("serializer"):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+def is_staff_request(request):
+    """Authenticates ``request`` with the API authenticators ahead of the view."""
+    drf_request = Request(request)
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(drf_request)
+        except APIException:
+            return False
+        if result is not None:
+            return bool(result[0].is_staff)
+    return False
+
+
+def has_metrics_token(request):
+    token = metrics_setting("TOKEN")
+    return bool(token) and constant_time_compare(
+        request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}"
+    )
+
+
+class MetricsMiddleware:
+    """
+    Records wall time, database query count and time, serializer time and
+    response size per URL name. Requests slower than ``SLOW_REQUEST_MS`` are
+    logged with their SQL.
+
+    A request is profiled with cProfile when a staff user sends the
+    ``X-Profile`` header, or at random with ``PROFILE_SAMPLE_RATE``; one
+    request per process is profiled at a time; under ASGI only the event loop
+    thread is profiled. Streamed bodies are produced after the middleware
+    returns, so only the time to the first byte counts.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.profile_lock = threading.Lock()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        install_query_recorder()
+        profiler = self.start_profiler(request, self.wants_profile(request))
+        with self.measuring(profiler) as metrics:
+            response = self.get_response(request)
+        self.finish(request, response, profiler, metrics)
+        return response
+
+    async def __acall__(self, request):
+        wants_profile = request.META.get(metrics_setting("PROFILE_HEADER")) and (
+            await sync_to_async(self.wants_profile)(request)
+        )
+        await sync_to_async(install_query_recorder)()
+        profiler = self.start_profiler(request, wants_profile)
+        with self.measuring(profiler) as metrics:
+            response = await self.get_response(request)
+        self.finish(request, response, profiler, metrics)
+        return response
+
+    @contextmanager
+    def measuring(self, profiler):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            metrics.duration = time.perf_counter() - started
+            _current.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                self.profile_lock.release()
+
+    def finish(self, request, response, profiler, metrics):
+        view = self.get_view_name(request)
+        if profiler is not None:
+            self.report_profile(request, view, profiler)
+        self.observe(request, response, view, metrics, metrics.duration)
+
+    def get_view_name(self, request):
+        match = getattr(request, "resolver_match", None)
+        return match.view_name if match else "unresolved"
+
+    def wants_profile(self, request):
+        return bool(
+            request.META.get(metrics_setting("PROFILE_HEADER"))
+            and is_staff_request(request)
+        )
+
+    def start_profiler(self, request, wants_profile):
+        rate = metrics_setting("PROFILE_SAMPLE_RATE")
+        if not (rate and random.random() < rate) and not wants_profile:
+            return None
+        if not self.profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def report_profile(self, request, view, profiler):
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output).sort_stats("cumulative")
+        stats.print_stats(metrics_setting("PROFILE_TOP"))
+        profile_logger.info(
+            "Profile of %s %s (%s)\n%s",
+            request.method,
+            request.path,
+            view,
+            output.getvalue(),
+        )
+        directory = metrics_setting("PROFILE_DIR")
+        if directory:
+            name = view.replace(":", "-").replace("/", "-")
+            stats.dump_stats(Path(directory) / f"{name}-{time.time_ns()}.prof")
+
+    def observe(self, request, response, view, metrics, duration):
+        REQUESTS.inc(view, request.method, response.status_code)
+        REQUEST_DURATION.observe(view, duration)
+        DB_QUERIES.observe(view, metrics.query_count)
+        DB_DURATION.observe(view, metrics.db_time)
+        if "serializer" in metrics.phases:
+            SERIALIZER_DURATION.observe(view, metrics.phases["serializer"])
+        if not response.streaming:
+            RESPONSE_SIZE.observe(view, len(response.content))
+
+        if duration * 1000 >= metrics_setting("SLOW_REQUEST_MS"):
+            queries = sorted(metrics.queries, key=lambda query: query[0], reverse=True)
+            slow_request_logger.warning(
+                "Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms\n%s",
+                request.method,
+                request.path,
+                view,
+                duration * 1000,
+                metrics.query_count,
+                metrics.db_time * 1000,
+                "\n".join(
+                    f"{seconds * 1000:.1f} ms: {sql}" for seconds, sql in queries
+                ),
+            )
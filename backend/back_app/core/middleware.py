@@ -0,0 +1,22 @@
+from urllib.parse import urlsplit
+
+from core.utils import get_public_url
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.functional import cached_property
+
+
+class PublicURLCsrfViewMiddleware(CsrfViewMiddleware):
+    """
+    Trusts the public URL as a CSRF origin on top of ``CSRF_TRUSTED_ORIGINS``,
+    looking it up on the first request that checks an origin.
+    """
+
+    @cached_property
+    def csrf_trusted_origins_hosts(self):
+        hosts = CsrfViewMiddleware.csrf_trusted_origins_hosts.func(self)
+        return [*hosts, urlsplit(get_public_url()).netloc]
+
+    @cached_property
+    def allowed_origins_exact(self):
+        origins = CsrfViewMiddleware.allowed_origins_exact.func(self)
+        return {*origins, get_public_url()}
@@ -0,0 +1,214 @@
+import itertools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "REPLICAS": [],
+    "STICKY_SECONDS": 10,
+    "MAX_LAG_SECONDS": 5,
+    "HEALTH_CHECK_INTERVAL": 5,
+    "COOKIE_NAME": "db_primary_until",
+}
+
+# Replay lag in seconds; 0 when everything received has been replayed (an idle
+# primary sends nothing to replay) and on a server that is not a replica.
+LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replication_setting(name):
+    return getattr(settings, "DATABASE_REPLICATION", {}).get(name, DEFAULTS[name])
+
+
+class RoutingState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica_reads = False
+        self.replica = None
+        self.wrote = False
+
+
+_state = ContextVar("database_routing", default=None)
+
+
+class ReplicaSet:
+    """
+    Picks the replica for a request, round-robin over ``REPLICAS``, skipping
+    those that could not be reached or lag more than ``MAX_LAG_SECONDS``. Each
+    replica is checked at most once per ``HEALTH_CHECK_INTERVAL`` per process;
+    without a healthy replica reads stay on the primary.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.turns = itertools.count()
+        self.health = {}
+
+    def choose(self):
+        replicas = replication_setting("REPLICAS")
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        start = next(self.turns)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if self.is_healthy(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            healthy, checked_at = self.health.get(alias, (None, None))
+            if healthy is not None and (
+                now - checked_at < replication_setting("HEALTH_CHECK_INTERVAL")
+            ):
+                return healthy
+            # Other threads keep the last result while this one checks.
+            self.health[alias] = (bool(healthy), now)
+        healthy = self.check(alias)
+        with self.lock:
+            self.health[alias] = (healthy, now)
+        return healthy
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = cursor.fetchone()[0]
+        except DatabaseError as exc:
+            logger.warning("Database replica %s is unavailable: %s", alias, exc)
+            connection.close()
+            return False
+        if lag > replication_setting("MAX_LAG_SECONDS"):
+            logger.warning("Database replica %s lags %.1f s behind.", alias, lag)
+            return False
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.health.clear()
+
+
+replica_set = ReplicaSet()
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a replica only in requests that allowed it (see
+    ``ReplicaReadMixin``), and not once the request or, within
+    ``STICKY_SECONDS``, the same client wrote. Everything else uses the
+    primary. One replica serves all reads of a request.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads or state.pinned or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = replica_set.choose()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary.
+        return True
+
+
+def read_from_replica():
+    """Whether the reads of the current request went to a replica."""
+    state = _state.get()
+    return state is not None and state.replica not in (None, DEFAULT_DB_ALIAS)
+
+
+def reads_own_writes():
+    """
+    Whether the current request must see the client's own writes: it wrote,
+    or the client wrote within ``STICKY_SECONDS``.
+    """
+    state = _state.get()
+    return state is not None and (state.pinned or state.wrote)
+
+
+class ReplicaReadMixin:
+    """Lets the reads of a view's safe requests go to a replica."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        state = _state.get()
+        if state is not None and request.method in SAFE_METHODS:
+            state.replica_reads = True
+
+
+class PrimaryPinMiddleware:
+    """
+    Tracks database routing per request. A response to a request that wrote
+    sets a cookie holding the time until which the client's requests read
+    from the primary, so that it sees its own writes while the replicas catch
+    up; ``STICKY_SECONDS`` should cover ``MAX_LAG_SECONDS``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(self.is_pinned(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState(self.is_pinned(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(response, state)
+
+    def is_pinned(self, request):
+        try:
+            until = float(request.COOKIES[replication_setting("COOKIE_NAME")])
+        except (KeyError, ValueError):
+            return False
+        return until > time.time()
+
+    def finish(self, response, state):
+        if state.wrote:
+            sticky = replication_setting("STICKY_SECONDS")
+            response.set_cookie(
+                replication_setting("COOKIE_NAME"),
+                str(int(time.time() + sticky)),
+                max_age=sticky,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,7 @@
+from core.utils import get_public_url
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+
+class PublicURLSchemaGenerator(OpenAPISchemaGenerator):
+    def __init__(self, info, version="", url=None, patterns=None, urlconf=None):
+        super().__init__(info, version, url or get_public_url(), patterns, urlconf)
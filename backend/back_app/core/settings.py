@@ -1,8 +1,10 @@
+import copy
 import os
 from datetime import timedelta
 from pathlib import Path
 
-from core.utils import get_ngrok_url
+from core.utils import get_public_url
+from django.utils.functional import lazy
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -12,9 +14,11 @@ DEBUG = os.environ.get("DEBUG")
 
 ALLOWED_HOSTS = ["*"]
 
-URL_NGROK_HOST = get_ngrok_url()
+URL_NGROK_HOST = lazy(get_public_url, str)()
 
-CSRF_TRUSTED_ORIGINS = [URL_NGROK_HOST]
+CSRF_TRUSTED_ORIGINS = [
+    origin for origin in os.environ.get("CSRF_TRUSTED_ORIGINS", "").split(",") if origin
+]
 
 AUTH_USER_MODEL = "users.User"
 
@@ -25,6 +29,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "django_filters",
     "core",
     "users",
@@ -37,10 +42,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.metrics.MetricsMiddleware",
+    "core.replicas.PrimaryPinMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.csrf.CsrfViewMiddleware",
+    "core.middleware.PublicURLCsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -65,18 +72,104 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "core.wsgi.application"
+ASGI_APPLICATION = "core.asgi.application"
+
+# "wsgi" or "asgi"; gunicorn.conf.py picks the worker class from it.
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+# Serves the I/O-bound endpoints with their async views; on by default under ASGI.
+ASYNC_VIEWS = (
+    os.environ.get("ASYNC_VIEWS", "1" if SERVER_MODE == "asgi" else "0") == "1"
+)
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "django.db.backends.postgresql",
         "NAME": os.environ.get("POSTGRES_NAME"),
         "USER": os.environ.get("POSTGRES_USER"),
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("POSTGRES_HOST"),
         "PORT": os.environ.get("POSTGRES_PORT"),
+        # Seconds a connection is reused across requests. ASGI requests do not
+        # share threads, so persistent connections are off there; use DB_POOL.
+        "CONN_MAX_AGE": int(
+            os.environ.get("DB_CONN_MAX_AGE", 0 if SERVER_MODE == "asgi" else 60)
+        ),
+        "CONN_HEALTH_CHECKS": True,
+        # Transaction-mode pgbouncer cannot keep a cursor open across
+        # transactions.
+        "DISABLE_SERVER_SIDE_CURSORS": os.environ.get("DB_DISABLE_SERVER_SIDE_CURSORS")
+        == "1",
+        "OPTIONS": {},
     }
 }
 
+if os.environ.get("DB_POOL") == "1":
+    # psycopg's pool keeps connections itself; Django requires CONN_MAX_AGE=0.
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+        "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+        "timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    }
+
+# Read-only copies of "default" that serve the public read endpoints, e.g.
+# DB_REPLICA_HOSTS=replica-1,replica-2:5433. A replica that cannot be reached
+# gives up after DB_REPLICA_CONNECT_TIMEOUT seconds instead of the OS TCP
+# timeout. The test runner mirrors these aliases to "default"; the replica
+# tests set up a database of their own.
+for index, address in enumerate(
+    filter(None, os.environ.get("DB_REPLICA_HOSTS", "").split(","))
+):
+    host, _, port = address.partition(":")
+    DATABASES[f"replica_{index}"] = {
+        **copy.deepcopy(DATABASES["default"]),
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASES[f"replica_{index}"]["OPTIONS"]["connect_timeout"] = int(
+        os.environ.get("DB_REPLICA_CONNECT_TIMEOUT", 2)
+    )
+
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+
+DATABASE_REPLICATION = {
+    "REPLICAS": [alias for alias in DATABASES if alias != "default"],
+    # Clients read from the primary for this long after they wrote; keep it
+    # above the replica lag that is tolerated.
+    "STICKY_SECONDS": int(os.environ.get("DB_STICKY_SECONDS", 10)),
+    "MAX_LAG_SECONDS": float(os.environ.get("DB_REPLICA_MAX_LAG", 5)),
+    "HEALTH_CHECK_INTERVAL": float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", 5)),
+}
+
+# LocMem suits one process; the production compose service points this at
+# Redis so that throttles, slots and generations are shared by its workers.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "library"),
+    }
+}
+
+# Seconds a process keeps its category table without seeing the Category
+# generation move; bounds how stale names are when the bump is missed.
+CATEGORY_CACHE_MAX_AGE = int(os.environ.get("CATEGORY_CACHE_MAX_AGE", 30))
+
+SCRAPER = {
+    "CONNECT_TIMEOUT": float(os.environ.get("SCRAPER_CONNECT_TIMEOUT", 3.05)),
+    "READ_TIMEOUT": float(os.environ.get("SCRAPER_READ_TIMEOUT", 10)),
+    "RETRIES": int(os.environ.get("SCRAPER_RETRIES", 2)),
+    "MAX_WORKERS": int(os.environ.get("SCRAPER_MAX_WORKERS", 16)),
+    "PER_HOST_CONCURRENCY": int(os.environ.get("SCRAPER_PER_HOST_CONCURRENCY", 4)),
+    "CACHE_TTL": int(os.environ.get("SCRAPER_CACHE_TTL", 24 * 60 * 60)),
+    "CACHE_MAX_ENTRIES": int(os.environ.get("SCRAPER_CACHE_MAX_ENTRIES", 10000)),
+    "EXTRACTOR": os.environ.get(
+        "SCRAPER_EXTRACTOR", "library.extractors.StreamingExtractor"
+    ),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -92,6 +185,37 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+PASSWORD_HASHER_CLASSES = {
+    "argon2": "users.hashers.Argon2PasswordHasher",
+    "scrypt": "users.hashers.ScryptPasswordHasher",
+    "pbkdf2_sha256": "users.hashers.PBKDF2PasswordHasher",
+}
+
+# New hashes use PASSWORD_HASHER; hashes made with another hasher or cost are
+# replaced on the next successful login.
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "argon2")
+
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_CLASSES[PASSWORD_HASHER],
+    *(
+        path
+        for algorithm, path in PASSWORD_HASHER_CLASSES.items()
+        if algorithm != PASSWORD_HASHER
+    ),
+]
+
+# The costs are pinned so that upgrading Django does not rehash every password.
+# WORKERS is per server process: hashing takes up to WEB_CONCURRENCY × WORKERS
+# cores, and as many times ARGON2_MEMORY_COST KiB.
+PASSWORD_HASHING = {
+    "WORKERS": int(os.environ.get("PASSWORD_HASH_WORKERS", 1)),
+    "ARGON2_TIME_COST": int(os.environ.get("ARGON2_TIME_COST", 2)),
+    "ARGON2_MEMORY_COST": int(os.environ.get("ARGON2_MEMORY_COST", 102400)),
+    "ARGON2_PARALLELISM": int(os.environ.get("ARGON2_PARALLELISM", 8)),
+    "SCRYPT_WORK_FACTOR": int(os.environ.get("SCRYPT_WORK_FACTOR", 2**14)),
+    "PBKDF2_ITERATIONS": int(os.environ.get("PBKDF2_ITERATIONS", 870000)),
+}
+
 LANGUAGE_CODE = "en-us"
 
 TIME_ZONE = "UTC"
@@ -104,15 +228,64 @@ STATIC_URL = "static/"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.ClaimsJWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "library.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_THROTTLE_CLASSES": [
+        "core.throttling.AnonTokenBucketThrottle",
+        "core.throttling.UserTokenBucketThrottle",
+    ],
+}
+
+THROTTLING = {
+    "RATES": {
+        # An empty value turns the throttle off, e.g. for load tests.
+        "anon": os.environ.get("THROTTLE_ANON_RATE", "120/min") or None,
+        "user": os.environ.get("THROTTLE_USER_RATE", "1200/min") or None,
+    },
+    "CONCURRENCY": {
+        "export": {
+            "process": int(os.environ.get("EXPORT_PROCESS_CONCURRENCY", 2)),
+            "total": int(os.environ.get("EXPORT_TOTAL_CONCURRENCY", 4)),
+            "lease": 15 * 60,
+            "retry_after": 30,
+        },
+        "scrape": {
+            "process": int(os.environ.get("SCRAPE_PROCESS_CONCURRENCY", 4)),
+            "total": int(os.environ.get("SCRAPE_TOTAL_CONCURRENCY", 8)),
+            "lease": 60,
+            "retry_after": 5,
+        },
+    },
+}
+
+METRICS = {
+    "SLOW_REQUEST_MS": int(os.environ.get("SLOW_REQUEST_MS", 500)),
+    "PROFILE_SAMPLE_RATE": float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+    "PROFILE_DIR": os.environ.get("PROFILE_DIR"),
+    "TOKEN": os.environ.get("METRICS_TOKEN"),
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "core.metrics": {"handlers": ["console"], "level": "WARNING"},
+        "core.profiling": {"handlers": ["console"], "level": "INFO"},
+    },
 }
 
 SWAGGER_SETTINGS = {
-    "DEFAULT_API_URL": URL_NGROK_HOST,
+    "DEFAULT_GENERATOR_CLASS": "core.schema.PublicURLSchemaGenerator",
     "SECURITY_DEFINITIONS": {
         "Bearer": {
             "type": "apiKey",
@@ -131,13 +304,31 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(days=30),
     "SLIDING_TOKEN_REFRESH_LIFETIME_LATE_USER": timedelta(days=1),
     "SLIDING_TOKEN_LIFETIME_LATE_USER": timedelta(days=30),
+    "TOKEN_OBTAIN_SERIALIZER": "users.authentication.UserClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.authentication.CachedTokenRefreshSerializer",
 }
 
+TOKEN_BLACKLIST = {
+    "SYNC_INTERVAL": float(os.environ.get("TOKEN_BLACKLIST_SYNC_INTERVAL", 1)),
+    "REBUILD_INTERVAL": int(os.environ.get("TOKEN_BLACKLIST_REBUILD_INTERVAL", 600)),
+}
+
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 60))
+
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "mailhog"
 EMAIL_PORT = 1025
 EMAIL_USE_TLS = False
 DEFAULT_FROM_EMAIL = "no-reply@example.com"
+EMAIL_TIMEOUT = 10
+
+EMAIL_OUTBOX = {
+    "BATCH_SIZE": int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", 100)),
+    "MAX_ATTEMPTS": int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 5)),
+    "BACKOFF_SECONDS": int(os.environ.get("EMAIL_OUTBOX_BACKOFF_SECONDS", 30)),
+    # Claimed emails are left to other workers only after this long.
+    "LEASE_SECONDS": int(os.environ.get("EMAIL_OUTBOX_LEASE_SECONDS", 300)),
+}
 
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -0,0 +1,251 @@
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+BUCKET_KEY = "throttle:bucket:{}:{}"
+BUCKET_LOCK_KEY = "throttle:bucket-lock:{}:{}"
+SLOT_KEY = "throttle:slot:{}:{}"
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def record(*events):
+    with _stats_lock:
+        for event in events:
+            _stats[event] += 1
+
+
+def get_throttle_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def parse_rate(rate):
+    """``"120/min"`` -> ``(120, 60)``; the period may be s, min, h or day."""
+    count, period = rate.split("/")
+    seconds = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600}
+    seconds.update({"d": 86400, "day": 86400})
+    return int(count), seconds[period]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    A token bucket per client kept in the cache. The bucket holds up to the
+    ``rate`` count and refills evenly over its period; a request takes the
+    view's ``throttle_cost`` tokens (1 by default), so expensive endpoints
+    use up the budget faster.
+
+    The bucket is read and written under a per-client lock claimed with
+    ``cache.add``, so concurrent requests of a client cannot spend the same
+    tokens. A request that cannot get the lock within ``lock_wait`` seconds
+    is throttled.
+    """
+
+    scope = None
+    lock_wait = 0.1
+
+    def get_rate(self):
+        return settings.THROTTLING["RATES"].get(self.scope)
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        rate = self.get_rate()
+        key = self.get_cache_key(request, view)
+        if rate is None or key is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        refill = capacity / period
+        cost = min(getattr(view, "throttle_cost", 1), capacity)
+        cache_key = BUCKET_KEY.format(self.scope, key)
+
+        lock = self.lock_bucket(key)
+        if lock is None:
+            self.wait_seconds = cost / refill
+            record("throttled", f"throttled:{self.scope}")
+            return False
+        try:
+            now = time.time()
+            tokens, updated_at = cache.get(cache_key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill)
+            if tokens < cost:
+                self.wait_seconds = (cost - tokens) / refill
+                record("throttled", f"throttled:{self.scope}")
+                return False
+            cache.set(cache_key, (tokens - cost, now), period)
+        finally:
+            self.unlock_bucket(lock)
+        record("allowed", f"allowed:{self.scope}")
+        return True
+
+    def lock_bucket(self, key):
+        lock = BUCKET_LOCK_KEY.format(self.scope, key), uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        # The lease only matters if the holder dies between the two calls.
+        while not cache.add(*lock, timeout=1):
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(0.005)
+        return lock
+
+    def unlock_bucket(self, lock):
+        key, token = lock
+        if cache.get(key) == token:
+            cache.delete(key)
+
+    def wait(self):
+        return math.ceil(self.wait_seconds)
+
+
+class AnonTokenBucketThrottle(TokenBucketThrottle):
+    scope = "anon"
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    scope = "user"
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class ConcurrencyLimited(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many concurrent requests for this resource, try again later."
+    default_code = "concurrency_limited"
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait
+
+
+class ConcurrencyLimiter:
+    """
+    Admits at most ``process`` concurrent holders per process, with a local
+    semaphore, and ``total`` across processes, with slot keys claimed through
+    ``cache.add``. Slots carry a lease so a crashed process cannot hold one
+    forever.
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.semaphore = threading.BoundedSemaphore(self.limits["process"])
+
+    @property
+    def limits(self):
+        return settings.THROTTLING["CONCURRENCY"][self.scope]
+
+    def acquire(self):
+        if not self.semaphore.acquire(blocking=False):
+            record("rejected", f"rejected:{self.scope}")
+            return None
+        token = uuid.uuid4().hex
+        for slot in range(self.limits["total"]):
+            key = SLOT_KEY.format(self.scope, slot)
+            if cache.add(key, token, self.limits["lease"]):
+                record("admitted", f"admitted:{self.scope}")
+                return key, token
+        self.semaphore.release()
+        record("rejected", f"rejected:{self.scope}")
+        return None
+
+    def release(self, slot):
+        key, token = slot
+        if cache.get(key) == token:
+            cache.delete(key)
+        self.semaphore.release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(scope):
+    with _limiters_lock:
+        if scope not in _limiters:
+            _limiters[scope] = ConcurrencyLimiter(scope)
+        return _limiters[scope]
+
+
+class ClosingIterator:
+    """
+    Streams ``content`` and calls ``on_close`` once, when the response is
+    closed, whether or not it was read to the end.
+    """
+
+    def __init__(self, content, on_close):
+        self.content = content
+        self.on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.content)
+
+    def close(self):
+        on_close, self.on_close = self.on_close, None
+        if on_close is not None:
+            on_close()
+
+
+class AsyncClosingIterator(ClosingIterator):
+    __iter__ = __next__ = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await anext(self.content)
+
+
+class ConcurrencyLimitMixin:
+    """
+    Holds a ``concurrency_scope`` slot from after the throttles pass until
+    the response is closed, so a streamed export keeps its slot while it
+    streams. Without a free slot the request gets a 503 with Retry-After.
+    """
+
+    concurrency_scope = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.concurrency_scope:
+            limiter = get_limiter(self.concurrency_scope)
+            self.concurrency_slot = limiter.acquire()
+            if self.concurrency_slot is None:
+                raise ConcurrencyLimited(limiter.limits["retry_after"])
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        slot = getattr(self, "concurrency_slot", None)
+        if slot is not None:
+            self.concurrency_slot = None
+            limiter = get_limiter(self.concurrency_scope)
+            if response.streaming:
+                iterator = (
+                    AsyncClosingIterator if response.is_async else ClosingIterator
+                )
+                response.streaming_content = iterator(
+                    response.streaming_content, lambda: limiter.release(slot)
+                )
+            else:
+                limiter.release(slot)
+        return response
@@ -1,3 +1,4 @@
+from core.views import MetricsView, MonitoringStatsView
 from django.contrib import admin
 from django.urls import include, path
 from drf_yasg import openapi
@@ -24,4 +25,6 @@ urlpatterns = [
         "swagger/", schema_view.with_ui("swagger", cache_timeout=0), name="swagger-ui"
     ),
     path("library/", include("library.urls")),
+    path("stats/", MonitoringStatsView.as_view(), name="monitoring-stats"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
@@ -1,9 +1,24 @@
-import requests
+import logging
+import os
+import threading
+import time
 
+logger = logging.getLogger(__name__)
 
-def get_ngrok_url():
+DEFAULT_PUBLIC_URL = "http://localhost:8000"
+
+
+def get_ngrok_url(timeout=None):
+    # requests is only needed here, so it is not imported with the settings.
+    import requests
+
+    if timeout is None:
+        timeout = float(os.environ.get("NGROK_DISCOVERY_TIMEOUT", 1))
     try:
-        response = requests.get("http://ngrok:4040/api/tunnels")
+        response = requests.get(
+            os.environ.get("NGROK_API_URL", "http://ngrok:4040/api/tunnels"),
+            timeout=timeout,
+        )
         response.raise_for_status()
         data = response.json()
 
@@ -11,7 +26,43 @@ def get_ngrok_url():
             if tunnel["public_url"].startswith("https://"):
                 return tunnel["public_url"]
 
-        return "http://localhost:8000"
+        return None
     except Exception as e:
-        print(f"Error getting ngrok url: {e}")
-        return "http://localhost:8000"
+        logger.warning(f"Error getting ngrok url: {e}")
+        return None
+
+
+_discovered_url = None
+_retry_at = None
+_discovery_lock = threading.Lock()
+
+
+def get_public_url():
+    """
+    The public base URL of the site: ``PUBLIC_URL`` if set, otherwise the
+    ngrok tunnel, discovered on first use and kept for the life of the
+    process. Until discovery succeeds it is retried at most every
+    ``NGROK_DISCOVERY_RETRY`` seconds, and localhost is used meanwhile.
+    """
+    global _discovered_url, _retry_at
+
+    url = os.environ.get("PUBLIC_URL")
+    if url:
+        return url.rstrip("/")
+    with _discovery_lock:
+        if _discovered_url is None and (
+            _retry_at is None or time.monotonic() >= _retry_at
+        ):
+            _discovered_url = get_ngrok_url()
+            if _discovered_url is None:
+                _retry_at = time.monotonic() + float(
+                    os.environ.get("NGROK_DISCOVERY_RETRY", 60)
+                )
+        return _discovered_url or DEFAULT_PUBLIC_URL
+
+
+def clear_public_url():
+    global _discovered_url, _retry_at
+
+    with _discovery_lock:
+        _discovered_url = _retry_at = None
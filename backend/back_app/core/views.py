@@ -0,0 +1,54 @@
+from core.metrics import (
+    CONTENT_TYPE,
+    has_metrics_token,
+    is_staff_request,
+    render_counter,
+    render_metrics,
+)
+from core.throttling import get_throttle_stats
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.cache import never_cache
+from library.cache import get_response_cache_stats
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class MonitoringStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(
+            {
+                "throttling": get_throttle_stats(),
+                "response_cache": get_response_cache_stats(),
+            }
+        )
+
+
+@method_decorator(never_cache, name="dispatch")
+class MetricsView(View):
+    """
+    Prometheus exposition of this process's metrics, for staff users or a
+    scraper sending ``Authorization: Bearer <METRICS["TOKEN"]>``.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not (has_metrics_token(request) or is_staff_request(request)):
+            return HttpResponseForbidden()
+        lines = render_metrics()
+        lines += render_counter(
+            "throttle_events_total",
+            "Throttle and concurrency limit decisions.",
+            "event",
+            get_throttle_stats(),
+        )
+        lines += render_counter(
+            "response_cache_events_total",
+            "Response cache lookups.",
+            "event",
+            get_response_cache_stats(),
+        )
+        return HttpResponse("\n".join(lines) + "\n", content_type=CONTENT_TYPE)
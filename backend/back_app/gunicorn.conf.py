@@ -0,0 +1,42 @@
+"""
+Production server settings: ``gunicorn -c gunicorn.conf.py``.
+
+SERVER_MODE=wsgi (the default) runs threaded sync workers; SERVER_MODE=asgi
+runs uvicorn workers that serve the async views (see ``ASYNC_VIEWS``).
+"""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+
+server_mode = os.environ.get("SERVER_MODE", "wsgi")
+if server_mode == "asgi":
+    wsgi_app = "core.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+elif server_mode == "wsgi":
+    wsgi_app = "core.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", 4))
+else:
+    raise RuntimeError(f"SERVER_MODE must be 'wsgi' or 'asgi', not {server_mode!r}.")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot build up.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = max_requests // 10
+reload = os.environ.get("GUNICORN_RELOAD") == "1"
+accesslog = "-"
+
+
+def on_starting(server):
+    # Several workers only share throttle and concurrency state through a
+    # shared cache; the check runs apart so the master never imports Django.
+    if server.cfg.workers > 1:
+        check = [sys.executable, "manage.py", "check", "--deploy", "--tag", "caches"]
+        if subprocess.run(check).returncode:
+            raise RuntimeError("The default cache is not shared by the workers.")
@@ -0,0 +1,70 @@
+import datetime
+import random
+
+from django.db import connection, transaction
+from library.bulk import delete_books
+from library.cache import bump_generation
+from library.facets import batched_facet_counts, record_book_changes
+from library.models import Book, Category
+
+CATEGORY_NAME = "Benchmark category {}"
+
+WORDS = (
+    "dragon river shadow garden winter empire silent glass ocean forest "
+    "machine letter city night storm crown island secret journey mirror "
+    "fire stone memory star voyage kingdom harbor lantern orchard clock"
+).split()
+
+SURNAMES = (
+    "Smith Tolkien Austen Orwell Tolstoy Dickens Bronte Woolf Hemingway "
+    "Murakami Borges Calvino Atwood Morrison Achebe Eco Kafka Camus"
+).split()
+
+
+def parse_count(value):
+    """``"100k"`` -> 100000, ``"1m"`` -> 1000000."""
+    value = str(value).strip().lower()
+    multiplier = {"k": 1000, "m": 1000000}.get(value[-1:], 1)
+    return int(value.rstrip("km")) * multiplier
+
+
+def seed_catalogue(books, categories=20, batch_size=5000, seed=0):
+    rng = random.Random(seed)
+    category_objects = Category.objects.bulk_create(
+        Category(name=CATEGORY_NAME.format(i)) for i in range(categories)
+    )
+    start = datetime.date(1900, 1, 1)
+
+    batch = []
+    for i in range(books):
+        batch.append(
+            Book(
+                title=" ".join(rng.choices(WORDS, k=rng.randint(2, 5))).title(),
+                author=f"{rng.choice(WORDS).title()} {rng.choice(SURNAMES)}",
+                publication_date=start + datetime.timedelta(days=rng.randrange(45000)),
+                category=rng.choice(category_objects),
+                description=" ".join(rng.choices(WORDS, k=40)),
+            )
+        )
+        if len(batch) >= batch_size:
+            Book.objects.bulk_create(batch)
+            record_book_changes(created=batch)
+            batch = []
+    Book.objects.bulk_create(batch)
+    record_book_changes(created=batch)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {Book._meta.db_table}, {Category._meta.db_table}")
+    # bulk_create sends no signals, so cached list responses are dropped here.
+    bump_generation(Book)
+    bump_generation(Category)
+    return category_objects
+
+
+def clear_catalogue():
+    categories = Category.objects.filter(name__startswith=CATEGORY_NAME.format(""))
+    with transaction.atomic(), batched_facet_counts():
+        delete_books(Book.objects.filter(category__in=categories))
+        categories.delete()
+    bump_generation(Book)
+    bump_generation(Category)
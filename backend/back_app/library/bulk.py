@@ -0,0 +1,240 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections, transaction
+from library.cache import bump_generation
+from library.categories import category_cache
+from library.facets import batched_facet_counts, record_book_changes
+from library.models import Book, ScrapedPage
+from library.serializers import BookSerializer
+
+BOOK_FIELDS = ["title", "author", "publication_date", "category", "description"]
+
+# Every relation to Book, as "<model label>.<field>", that delete_books
+# handles in place of the delete collector. A new relation must be added
+# here and to delete_books, or its rows are left pointing at deleted books.
+BOOK_DELETE_RELATIONS = ["library.ScrapedPage.book"]
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _to_uuid(value):
+    if isinstance(value, dict):
+        value = value.get("id")
+    if value is None:
+        return None
+    try:
+        return Book._meta.pk.to_python(value)
+    except DjangoValidationError:
+        return None
+
+
+class BookBulkResult:
+    def __init__(self):
+        self.results = []
+        self.errors = []
+
+    def error(self, index, errors):
+        self.errors.append({"index": index, "errors": errors})
+
+    def ok(self, index, book_id, status):
+        self.results.append({"index": index, "id": str(book_id), "status": status})
+
+    def count(self, status):
+        return sum(1 for result in self.results if result["status"] == status)
+
+    @property
+    def data(self):
+        return {
+            "created": self.count("created"),
+            "updated": self.count("updated"),
+            "deleted": self.count("deleted"),
+            "results": sorted(self.results, key=lambda result: result["index"]),
+            "errors": sorted(self.errors, key=lambda error: error["index"]),
+        }
+
+
+def _resolve_categories(validated, result, known=None):
+    categories = category_cache.get_existing(
+        {data["category_id"] for _, data in validated if "category_id" in data},
+        known,
+    )
+    resolved = []
+    for index, data in validated:
+        if "category_id" in data:
+            category = categories.get(data.pop("category_id"))
+            if category is None:
+                result.error(index, {"category_id": ["Category does not exist."]})
+                continue
+            data["category"] = category
+        resolved.append((index, data))
+    return resolved
+
+
+def bulk_save_books(items, batch_size, upsert=False, dry_run=False, categories=None):
+    """
+    Validates every item on its own, then creates (or, with ``upsert``,
+    updates books matching on title and author) all valid ones in one
+    transaction. Invalid items are reported and skipped; ``dry_run`` stops
+    before writing. ``categories`` maps ids of already known categories to
+    instances so they are not looked up again.
+    """
+    result = BookBulkResult()
+    validated = []
+    for index, item in enumerate(items):
+        serializer = BookSerializer(data=item)
+        if serializer.is_valid():
+            validated.append((index, dict(serializer.validated_data)))
+        else:
+            result.error(index, serializer.errors)
+    validated = _resolve_categories(validated, result, categories)
+
+    existing = {}
+    if upsert and validated:
+        titles = sorted({data["title"] for _, data in validated})
+        for chunk in _chunks(titles, batch_size):
+            for book in (
+                Book.objects.defer("search_vector")
+                .filter(title__in=chunk)
+                .order_by("id")
+            ):
+                existing.setdefault((book.title, book.author), book)
+
+    to_create, to_update = {}, {}
+    for index, data in validated:
+        key = (data["title"], data["author"])
+        book = existing.get(key) if upsert else None
+        if book is None:
+            book = Book(**data)
+            to_create[book.id] = book
+            existing[key] = book
+            result.ok(index, book.id, "created")
+        else:
+            for field, value in data.items():
+                setattr(book, field, value)
+            if book.id not in to_create:
+                to_update[book.id] = book
+            result.ok(index, book.id, "updated")
+
+    if dry_run:
+        return result
+
+    with transaction.atomic():
+        Book.objects.bulk_create(to_create.values(), batch_size=batch_size)
+        Book.objects.bulk_update(
+            list(to_update.values()), BOOK_FIELDS, batch_size=batch_size
+        )
+        # bulk_create and bulk_update send no signals.
+        record_book_changes(created=to_create.values(), updated=to_update.values())
+        transaction.on_commit(lambda: bump_generation(Book))
+    return result
+
+
+def bulk_update_books(items, batch_size):
+    result = BookBulkResult()
+    ids = [_to_uuid(item) for item in items]
+    books = Book.objects.defer("search_vector").in_bulk(
+        [book_id for book_id in ids if book_id]
+    )
+
+    validated = []
+    for index, (item, book_id) in enumerate(zip(items, ids)):
+        book = books.get(book_id)
+        if book is None:
+            result.error(index, {"id": ["Book does not exist."]})
+            continue
+        serializer = BookSerializer(book, data=item, partial=True)
+        if serializer.is_valid():
+            validated.append((index, {"book": book, **serializer.validated_data}))
+        else:
+            result.error(index, serializer.errors)
+    validated = _resolve_categories(validated, result)
+
+    fields = set()
+    updated = {}
+    for index, data in validated:
+        book = data.pop("book")
+        if not data:
+            result.error(index, {"non_field_errors": ["No fields to update."]})
+            continue
+        for field, value in data.items():
+            setattr(book, field, value)
+        fields.update(data)
+        updated[book.id] = book
+        result.ok(index, book.id, "updated")
+
+    if updated:
+        with transaction.atomic():
+            Book.objects.bulk_update(
+                list(updated.values()), sorted(fields), batch_size=batch_size
+            )
+            record_book_changes(updated=updated.values())
+            transaction.on_commit(lambda: bump_generation(Book))
+    return result
+
+
+def delete_books(queryset):
+    """
+    Deletes the books of ``queryset`` without loading them or sending
+    signals. The facet counters are moved from one ``values_list`` query over
+    the locked rows, the relations in ``BOOK_DELETE_RELATIONS`` are handled
+    as their ``on_delete`` would, and the rows go with one ``DELETE``.
+    Returns the ids of the deleted books; the caller bumps the cache
+    generation. Must run in a transaction.
+    """
+    deleted = []
+    for book_id, category_id, publication_date, author in (
+        queryset.select_for_update()
+        .order_by()
+        .values_list("id", "category_id", "publication_date", "author")
+    ):
+        book = Book(
+            id=book_id,
+            category_id=category_id,
+            publication_date=publication_date,
+            author=author,
+        )
+        book.stored_facets = book.get_facet_values()
+        deleted.append(book)
+    ids = [book.id for book in deleted]
+    if ids:
+        ScrapedPage.objects.using(queryset.db).filter(book__in=ids).update(book=None)
+        connection = connections[queryset.db]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {} WHERE {} = ANY(%s)".format(
+                    connection.ops.quote_name(Book._meta.db_table),
+                    connection.ops.quote_name(Book._meta.pk.column),
+                ),
+                [ids],
+            )
+        record_book_changes(deleted=deleted)
+    return ids
+
+
+def bulk_delete_books(ids, batch_size):
+    result = BookBulkResult()
+    wanted = {}
+    for index, value in enumerate(ids):
+        book_id = _to_uuid(value)
+        if book_id in wanted:
+            result.error(index, {"id": ["Duplicate id."]})
+        elif book_id:
+            wanted[book_id] = index
+        else:
+            result.error(index, {"id": ["Must be a valid UUID."]})
+
+    with transaction.atomic(), batched_facet_counts():
+        found = set()
+        for chunk in _chunks(list(wanted), batch_size):
+            found.update(delete_books(Book.objects.filter(id__in=chunk)))
+        if found:
+            transaction.on_commit(lambda: bump_generation(Book))
+
+    for book_id, index in wanted.items():
+        if book_id in found:
+            result.ok(index, book_id, "deleted")
+        else:
+            result.error(index, {"id": ["Book does not exist."]})
+    return result
@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from core.replicas import read_from_replica, reads_own_writes, replication_setting
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+
+GENERATION_KEY = "library:generation:{}"
+RESPONSE_KEY = "library:response:{}:{}"
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _generation_key(model):
+    return GENERATION_KEY.format(model._meta.label_lower)
+
+
+def get_generations(models):
+    keys = [_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # A generation that was evicted must not restart at a value an
+            # older entry was stored under, so new counters start from the clock.
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+async def aget_generations(models):
+    keys = [_generation_key(model) for model in models]
+    generations = await cache.aget_many(keys)
+    if len(generations) < len(keys):
+        return await sync_to_async(get_generations)(models)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(model):
+    key = _generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def record(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def get_response_cache_stats():
+    with _stats_lock:
+        return {"hits": _stats["hit"], "misses": _stats["miss"]}
+
+
+class VersionedResponseCacheMixin:
+    """
+    Caches the rendered list response under the normalized URL and the current
+    generation of every model in ``cache_models``. Saving or deleting one of
+    those models bumps its generation (see ``library.signals``), so stale
+    entries are simply never looked up again and expire on their own.
+
+    HTML (the browsable API) is never cached: it shows the user's name and
+    CSRF token. Clients that must read their own writes skip the lookup, as
+    the entry for the new generations may have been read from a replica that
+    had not caught up yet; what they read from the primary is stored.
+    """
+
+    cache_models = ()
+    cache_timeout = 300
+
+    def get_response_cache_key(self, request, generations=None):
+        if generations is None:
+            generations = get_generations(self.cache_models)
+        query = urlencode(
+            sorted(
+                (key, value)
+                for key, values in request.query_params.lists()
+                for value in values
+            )
+        )
+        source = "|".join(
+            [
+                request.build_absolute_uri(request.path),
+                query,
+                request.accepted_media_type,
+                *map(str, generations),
+            ]
+        )
+        return RESPONSE_KEY.format(
+            type(self).__name__, hashlib.md5(source.encode()).hexdigest()
+        )
+
+    def use_response_cache(self, request):
+        return request.accepted_media_type.split(";")[0].strip() != "text/html"
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_response_cache(request):
+            return super().list(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        entry = None if reads_own_writes() else cache.get(key)
+        if entry is None:
+            record("miss")
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response = self.finalize_response(request, response, *args, **kwargs)
+            response.render()
+            entry = {
+                "content": response.content,
+                "content_type": response["Content-Type"],
+                "etag": quote_etag(hashlib.md5(response.content).hexdigest()),
+            }
+            cache.set(key, entry, self.get_cache_timeout())
+            status = "MISS"
+        else:
+            record("hit")
+            status = "HIT"
+
+        return self.cached_response(request, entry, status)
+
+    def get_cache_timeout(self):
+        if read_from_replica():
+            # The replica may not have replayed the write that moved the
+            # generations yet, so its answer is kept no longer than it may lag.
+            return min(self.cache_timeout, replication_setting("MAX_LAG_SECONDS"))
+        return self.cache_timeout
+
+    def cached_response(self, request, entry, status):
+        if entry["etag"] in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                entry["content"], content_type=entry["content_type"]
+            )
+        response["ETag"] = entry["etag"]
+        response["X-Cache"] = status
+        patch_vary_headers(response, ["Accept", "Authorization"])
+        return response
+
+
+class AsyncCachedListMixin:
+    """
+    Answers cache hits of a ``VersionedResponseCacheMixin`` view without
+    leaving the event loop; a miss runs the synchronous ``list`` in a thread.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        if not self.use_response_cache(request) or reads_own_writes():
+            return await sync_to_async(self.list)(request, *args, **kwargs)
+        generations = await aget_generations(self.cache_models)
+        entry = await cache.aget(self.get_response_cache_key(request, generations))
+        if entry is None:
+            return await sync_to_async(self.list)(request, *args, **kwargs)
+        record("hit")
+        return self.cached_response(request, entry, "HIT")
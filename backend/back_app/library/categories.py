@@ -0,0 +1,112 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from library.cache import get_generations
+from library.models import Category
+
+
+class CategoryTable:
+    def __init__(self, categories, generation):
+        self.categories = categories
+        self.by_id = {category.pk: category for category in categories}
+        self.by_name = {category.name: category for category in categories}
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+
+    def is_current(self, generation):
+        return self.generation == generation and (
+            time.monotonic() - self.loaded_at
+            < getattr(settings, "CATEGORY_CACHE_MAX_AGE", 30)
+        )
+
+
+class CategoryCache:
+    """
+    Keeps the whole (small) category table in process memory, by id and by
+    name. Each lookup compares the table with the shared Category generation,
+    which ``library.signals`` bumps on every save and delete in any process,
+    and reloads it with one query when it moved, or at the latest after
+    ``CATEGORY_CACHE_MAX_AGE`` seconds, in case the bump was missed (with a
+    per-process cache backend, other processes never see it). Writes confirm
+    their ids with the database (see ``get_existing``). The instances are
+    shared between threads and must not be modified.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.table = None
+
+    def current(self):
+        [generation] = get_generations([Category])
+        table = self.table
+        if table is None or not table.is_current(generation):
+            with self.lock:
+                table = self.table
+                if table is None or not table.is_current(generation):
+                    # The generation is read first, so a write racing the
+                    # query leaves a newer generation behind and is reloaded.
+                    # A replica could still miss that write, so the table,
+                    # kept until the generation moves, comes from the primary.
+                    categories = list(
+                        Category.objects.using(DEFAULT_DB_ALIAS).order_by("name")
+                    )
+                    table = self.table = CategoryTable(categories, generation)
+        return table
+
+    def all(self):
+        return self.current().categories
+
+    def get(self, pk):
+        category = self.current().by_id.get(pk)
+        if category is None:
+            # Unknown ids are rare and may belong to a category committed
+            # after the last reload, so they are checked against the table.
+            category = Category.objects.using(DEFAULT_DB_ALIAS).filter(pk=pk).first()
+        return category
+
+    def get_existing(self, pks, known=None):
+        """
+        The categories of ``pks`` that exist, by id, for writes to point at.
+        A category deleted by another process may still be in the table, so
+        the ids are confirmed with one primary key query; only the categories
+        missing from the table (and from ``known``) are loaded. Unsaved
+        categories in ``known``, as a dry run makes, are taken as they are.
+        """
+        known = known or {}
+        unsaved = {
+            pk: known[pk] for pk in pks if pk in known and known[pk]._state.adding
+        }
+        pks = set(pks) - unsaved.keys()
+        if not pks:
+            return unsaved
+        existing = set(
+            Category.objects.using(DEFAULT_DB_ALIAS)
+            .filter(pk__in=pks)
+            .values_list("pk", flat=True)
+        )
+        table = self.current()
+        if (pks - existing) & table.by_id.keys():
+            self.clear()
+        categories = {**table.by_id, **known}
+        found = {pk: categories[pk] for pk in existing if pk in categories}
+        missing = existing - found.keys()
+        if missing:
+            found.update(Category.objects.using(DEFAULT_DB_ALIAS).in_bulk(missing))
+        return {**found, **unsaved}
+
+    def get_by_name(self, name):
+        return self.current().by_name.get(name)
+
+    def get_or_create(self, name):
+        category = self.get_by_name(name)
+        if category is None:
+            category, _ = Category.objects.get_or_create(name=name)
+        return category
+
+    def clear(self):
+        self.table = None
+
+
+category_cache = CategoryCache()
@@ -0,0 +1,231 @@
+import json
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+DEFAULT_RULES = {
+    "title": ["tag:h1", "meta:og:title", "jsonld:name", "tag:title"],
+    "description": ["meta:description", "meta:og:description", "jsonld:description"],
+    "author": [
+        "meta:author",
+        "meta:book:author",
+        "itemprop:author",
+        "jsonld:author.name",
+    ],
+    "publication_date": [
+        "meta:book:release_date",
+        "itemprop:datePublished",
+        "jsonld:datePublished",
+    ],
+    "isbn": ["meta:book:isbn", "itemprop:isbn", "jsonld:isbn"],
+}
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link"}
+VOID_TAGS |= {"meta", "param", "source", "track", "wbr"}
+
+
+def parse_selector(selector):
+    kind, _, name = selector.partition(":")
+    if kind not in ("tag", "meta", "itemprop", "jsonld") or not name:
+        raise ValueError(f"Invalid extraction selector: {selector!r}")
+    return kind, name.lower() if kind != "jsonld" else name
+
+
+def iter_jsonld_objects(text):
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return
+    stack = data if isinstance(data, list) else [data]
+    for item in stack:
+        if isinstance(item, dict):
+            yield item
+            yield from (obj for obj in item.get("@graph", []) if isinstance(obj, dict))
+
+
+def resolve_jsonld(objects, path):
+    """
+    Reads a dotted ``path`` from the first JSON-LD object that has it,
+    preferring objects typed as a Book.
+    """
+    objects = sorted(objects, key=lambda obj: obj.get("@type") != "Book")
+    for obj in objects:
+        value = obj
+        for key in path.split("."):
+            if isinstance(value, list):
+                value = value[0] if value else None
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if isinstance(value, dict):
+            value = value.get("name")
+        if value not in (None, ""):
+            return str(value)
+    return None
+
+
+def pick(rules, found):
+    """Returns, per field, the value of its first selector that matched."""
+    return {
+        field: next(
+            (found[selector] for selector in selectors if selector in found), None
+        )
+        for field, selectors in rules.items()
+    }
+
+
+class _Done(Exception):
+    pass
+
+
+class _CollectingParser(HTMLParser):
+    def __init__(self, selectors, top_choices):
+        super().__init__()
+        self.wanted = {}
+        self.jsonld_paths = []
+        for selector in selectors:
+            kind, name = parse_selector(selector)
+            if kind == "jsonld":
+                self.jsonld_paths.append((selector, name))
+            else:
+                self.wanted[(kind, name)] = selector
+        self.top_choices = top_choices
+        self.found = {}
+        self.capturing = []
+
+    def record(self, selector, value):
+        value = " ".join(value.split())
+        if value and selector not in self.found:
+            self.found[selector] = value
+            if self.top_choices <= self.found.keys():
+                raise _Done
+
+    def handle_starttag(self, tag, attrs):
+        for capture in self.capturing:
+            if capture[1] == tag:
+                capture[2] += 1
+
+        attrs = dict(attrs)
+        targets = []
+        if ("tag", tag) in self.wanted:
+            targets.append(self.wanted[("tag", tag)])
+        itemprop = (attrs.get("itemprop") or "").lower()
+        if ("itemprop", itemprop) in self.wanted:
+            selector = self.wanted[("itemprop", itemprop)]
+            value = attrs.get("content") or attrs.get("datetime")
+            if value:
+                self.record(selector, value)
+            else:
+                targets.append(selector)
+        if tag == "meta":
+            for attr in ("name", "property"):
+                name = (attrs.get(attr) or "").lower()
+                if ("meta", name) in self.wanted:
+                    self.record(self.wanted[("meta", name)], attrs.get("content") or "")
+        elif (
+            tag == "script"
+            and self.jsonld_paths
+            and (attrs.get("type") or "").lower() == "application/ld+json"
+        ):
+            targets.append(None)
+
+        if targets and tag not in VOID_TAGS:
+            self.capturing.append([targets, tag, 1, []])
+
+    def handle_endtag(self, tag):
+        for capture in list(self.capturing):
+            if capture[1] != tag:
+                continue
+            capture[2] -= 1
+            if capture[2]:
+                continue
+            self.capturing.remove(capture)
+            text = "".join(capture[3])
+            for selector in capture[0]:
+                if selector is None:
+                    self.record_jsonld(text)
+                else:
+                    self.record(selector, text)
+
+    def handle_data(self, data):
+        for capture in self.capturing:
+            capture[3].append(data)
+
+    def record_jsonld(self, text):
+        objects = list(iter_jsonld_objects(text))
+        for selector, path in self.jsonld_paths:
+            value = resolve_jsonld(objects, path)
+            if value is not None:
+                self.record(selector, value)
+
+
+class StreamingExtractor:
+    """
+    Feeds the document to an incremental ``HTMLParser`` in chunks, keeping
+    only the text of tags some rule asks for, and stops as soon as the first
+    choice selector of every field has been seen.
+    """
+
+    chunk_size = 16 * 1024
+
+    def extract(self, html, rules):
+        selectors = {selector for selectors in rules.values() for selector in selectors}
+        top_choices = {selectors[0] for selectors in rules.values() if selectors}
+        parser = _CollectingParser(selectors, top_choices)
+        try:
+            for start in range(0, len(html), self.chunk_size):
+                parser.feed(html[start : start + self.chunk_size])
+            parser.close()
+        except _Done:
+            pass
+        return pick(rules, parser.found)
+
+
+class BeautifulSoupExtractor:
+    """Builds the whole tree with BeautifulSoup; the reference implementation."""
+
+    def extract(self, html, rules):
+        soup = BeautifulSoup(html, "html.parser")
+        jsonld = None
+        found = {}
+        for selectors in rules.values():
+            for selector in selectors:
+                kind, name = parse_selector(selector)
+                value = None
+                if kind == "tag":
+                    element = soup.find(name)
+                    value = element.get_text() if element else None
+                elif kind == "meta":
+                    element = soup.find(
+                        lambda el: el.name == "meta"
+                        and name
+                        in (
+                            (el.get("name") or "").lower(),
+                            (el.get("property") or "").lower(),
+                        )
+                    )
+                    value = element.get("content") if element else None
+                elif kind == "itemprop":
+                    element = soup.find(
+                        attrs={"itemprop": lambda v: v and v.lower() == name}
+                    )
+                    if element:
+                        value = (
+                            element.get("content")
+                            or element.get("datetime")
+                            or element.get_text()
+                        )
+                else:
+                    if jsonld is None:
+                        jsonld = [
+                            obj
+                            for script in soup.find_all(
+                                "script", type="application/ld+json"
+                            )
+                            for obj in iter_jsonld_objects(script.string or "")
+                        ]
+                    value = resolve_jsonld(jsonld, name)
+                value = " ".join((value or "").split())
+                if value:
+                    found[selector] = value
+        return pick(rules, found)
@@ -0,0 +1,165 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.db.models.functions import ExtractYear
+from library.models import Book, BookFacetCount
+
+Facet = BookFacetCount.Facet
+
+FACET_EXPRESSIONS = {
+    Facet.CATEGORY: F("category_id"),
+    Facet.YEAR: ExtractYear("publication_date"),
+    Facet.AUTHOR: F("author"),
+}
+
+# Rows per upsert statement, well below PostgreSQL's 65535 parameters.
+UPSERT_BATCH_SIZE = 1000
+
+_pending = ContextVar("pending_facet_deltas", default=None)
+
+
+def apply_deltas(deltas):
+    """
+    Adds ``deltas`` (a mapping of ``(facet, value)`` to a change in count) to
+    the counters with ``INSERT ... ON CONFLICT DO UPDATE``, so concurrent
+    writers never lose an increment. Rows are written in key order, which
+    keeps two batches touching the same counters from deadlocking.
+    """
+    rows = sorted((key, delta) for key, delta in deltas.items() if delta)
+    table = connection.ops.quote_name(BookFacetCount._meta.db_table)
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        batch = rows[start : start + UPSERT_BATCH_SIZE]
+        values = ", ".join(["(%s, %s, %s)"] * len(batch))
+        params = [
+            item for (facet, value), delta in batch for item in (facet, value, delta)
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (facet, value, count) VALUES {values} "
+                f"ON CONFLICT (facet, value) "
+                f"DO UPDATE SET count = {table}.count + EXCLUDED.count",
+                params,
+            )
+
+
+@contextmanager
+def batched_facet_counts():
+    """
+    Collects the counter changes of every save and delete in the block and
+    writes them in one go at the end, instead of once per book. Nothing is
+    written when the block raises.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    pending = Counter()
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    apply_deltas(pending)
+
+
+def record_book_changes(created=(), updated=(), deleted=()):
+    """
+    Moves the counters for books that were just written. Changed and deleted
+    books are compared with the values they were stored with (see
+    ``Book.from_db`` and ``load_stored_facets``).
+    """
+    deltas = Counter()
+    for book in [*updated, *deleted]:
+        deltas.subtract(getattr(book, "stored_facets", ()))
+    for book in [*created, *updated]:
+        book.stored_facets = book.get_facet_values()
+        deltas.update(book.stored_facets)
+
+    pending = _pending.get()
+    if pending is None:
+        apply_deltas(deltas)
+    else:
+        pending.update(deltas)
+
+
+def load_stored_facets(book):
+    """
+    Reads the stored facet values of a book that is about to be changed or
+    deleted, unless it was loaded with them.
+    """
+    if hasattr(book, "stored_facets"):
+        return
+    stored = (
+        Book.objects.filter(pk=book.pk)
+        .values_list("category_id", "publication_date", "author")
+        .first()
+    )
+    if stored is not None:
+        category_id, publication_date, author = stored
+        book.stored_facets = Book(
+            category_id=category_id, publication_date=publication_date, author=author
+        ).get_facet_values()
+
+
+def count_facet(queryset, facet, limit=None):
+    """Counts the books of ``queryset`` per value of ``facet`` in one query."""
+    rows = (
+        queryset.order_by()
+        .annotate(facet_value=FACET_EXPRESSIONS[facet])
+        .values("facet_value")
+        .annotate(count=Count("pk"))
+        .values_list("facet_value", "count")
+    )
+    if limit is not None:
+        rows = rows.order_by("-count", "facet_value")[:limit]
+    return [(str(value), count) for value, count in rows]
+
+
+def stored_facet(facet, limit=None):
+    """Reads the counters of ``facet``."""
+    rows = BookFacetCount.objects.filter(facet=facet, count__gt=0).values_list(
+        "value", "count"
+    )
+    if limit is not None:
+        rows = rows.order_by("-count", "value")[:limit]
+    return list(rows)
+
+
+def rebuild_facet_counts(dry_run=False):
+    """
+    Recounts every facet from the books and replaces the counters. Writes to
+    books wait for the rebuild, so no change is counted twice or lost. Returns
+    the ``(facet, value)`` keys whose counter was off.
+    """
+    with transaction.atomic():
+        if not dry_run:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"LOCK TABLE {connection.ops.quote_name(Book._meta.db_table)} "
+                    f"IN SHARE MODE"
+                )
+        actual = {
+            (facet, value): count
+            for facet in Facet
+            for value, count in count_facet(Book.objects.all(), facet)
+        }
+        stored = {
+            (facet, value): count
+            for facet, value, count in BookFacetCount.objects.values_list(
+                "facet", "value", "count"
+            )
+        }
+        drift = sorted(
+            key
+            for key in actual.keys() | stored.keys()
+            if actual.get(key, 0) != stored.get(key, 0)
+        )
+        if not dry_run:
+            BookFacetCount.objects.all().delete()
+            BookFacetCount.objects.bulk_create(
+                BookFacetCount(facet=facet, value=value, count=count)
+                for (facet, value), count in actual.items()
+            )
+    return drift
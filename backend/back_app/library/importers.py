@@ -0,0 +1,302 @@
+import codecs
+import csv
+import datetime
+import json
+import posixpath
+import re
+import time
+import zipfile
+from xml.etree.ElementTree import ParseError, fromstring, iterparse
+
+from library.bulk import bulk_save_books
+from library.cache import bump_generation
+from library.categories import category_cache
+from library.models import Category
+
+SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIP_NS = (
+    "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+)
+PACKAGE_RELATIONSHIP_NS = (
+    "{http://schemas.openxmlformats.org/package/2006/relationships}"
+)
+EXCEL_EPOCH = datetime.date(1899, 12, 30)
+IMPORT_FORMATS = ("xlsx", "csv", "ndjson")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def iter_csv_rows(fileobj):
+    reader = csv.DictReader(codecs.iterdecode(fileobj, "utf-8-sig"))
+    try:
+        yield from reader
+    except UnicodeDecodeError as exc:
+        raise ImportFormatError(
+            f"CSV is not UTF-8 on line {reader.line_num + 1} - {exc}"
+        )
+    except csv.Error as exc:
+        raise ImportFormatError(f"CSV parse error on line {reader.line_num} - {exc}")
+
+
+def iter_ndjson_rows(fileobj):
+    for number, line in enumerate(fileobj, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            raise ImportFormatError(f"NDJSON parse error on line {number} - {exc}")
+
+
+def _column_index(reference):
+    index = 0
+    for letter in re.match(r"[A-Z]+", reference).group():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def _cell_value(cell, shared_strings):
+    kind = cell.get("t", "n")
+    if kind == "inlineStr":
+        return "".join(text.text or "" for text in cell.iter(f"{SPREADSHEET_NS}t"))
+    value = cell.findtext(f"{SPREADSHEET_NS}v")
+    if value is None:
+        return None
+    if kind == "s":
+        return shared_strings[int(value)]
+    if kind == "b":
+        return value == "1"
+    if kind == "n":
+        number = float(value)
+        return int(number) if number.is_integer() else number
+    return value
+
+
+def _first_sheet(archive):
+    """
+    The part name of the first worksheet in workbook order, which need not be
+    ``sheet1.xml``.
+    """
+    names = archive.namelist()
+    if "xl/workbook.xml" in names and "xl/_rels/workbook.xml.rels" in names:
+        workbook = fromstring(archive.read("xl/workbook.xml"))
+        sheet = workbook.find(f"{SPREADSHEET_NS}sheets/{SPREADSHEET_NS}sheet")
+        if sheet is None:
+            return None
+        relationships = fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        for relationship in relationships.iter(
+            f"{PACKAGE_RELATIONSHIP_NS}Relationship"
+        ):
+            if relationship.get("Id") == sheet.get(f"{RELATIONSHIP_NS}id"):
+                target = relationship.get("Target", "")
+                if target.startswith("/"):
+                    return target[1:]
+                return posixpath.normpath(posixpath.join("xl", target))
+        return None
+
+    sheets = [
+        (int(match[1]), name)
+        for name in names
+        if (match := re.fullmatch(r"xl/worksheets/sheet(\d+)\.xml", name))
+    ]
+    return min(sheets)[1] if sheets else None
+
+
+def iter_xlsx_rows(fileobj):
+    """
+    Reads the first worksheet row by row with ``iterparse``, clearing every
+    row once it is read, so memory stays flat whatever the sheet size.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as exc:
+        raise ImportFormatError(f"Invalid XLSX file - {exc}")
+
+    try:
+        with archive:
+            yield from _iter_sheet_rows(archive)
+    except (ParseError, KeyError, zipfile.BadZipFile) as exc:
+        raise ImportFormatError(f"Invalid XLSX file - {exc}")
+
+
+def _iter_sheet_rows(archive):
+    shared_strings = []
+    if "xl/sharedStrings.xml" in archive.namelist():
+        with archive.open("xl/sharedStrings.xml") as strings:
+            for _, item in iterparse(strings):
+                if item.tag == f"{SPREADSHEET_NS}si":
+                    shared_strings.append(
+                        "".join(t.text or "" for t in item.iter(f"{SPREADSHEET_NS}t"))
+                    )
+                    item.clear()
+
+    sheet_name = _first_sheet(archive)
+    if sheet_name is None:
+        raise ImportFormatError("XLSX file has no worksheets.")
+
+    header = None
+    with archive.open(sheet_name) as sheet:
+        for event, element in iterparse(sheet, events=("start", "end")):
+            if event == "start":
+                if element.tag == f"{SPREADSHEET_NS}sheetData":
+                    sheet_data = element
+                continue
+            if element.tag != f"{SPREADSHEET_NS}row":
+                continue
+
+            values = {}
+            for cell in element.iter(f"{SPREADSHEET_NS}c"):
+                reference = cell.get("r")
+                index = _column_index(reference) if reference else len(values)
+                values[index] = _cell_value(cell, shared_strings)
+            # Drop the rows parsed so far so the tree never grows.
+            sheet_data.clear()
+
+            if header is None:
+                header = [values.get(i) for i in range(max(values, default=-1) + 1)]
+                continue
+            yield {
+                name: values.get(index)
+                for index, name in enumerate(header)
+                if name is not None
+            }
+
+
+READERS = {
+    "xlsx": iter_xlsx_rows,
+    "csv": iter_csv_rows,
+    "ndjson": iter_ndjson_rows,
+}
+
+
+def detect_format(filename):
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if extension not in READERS:
+        raise ImportFormatError(
+            f"Unsupported file type; expected one of: {', '.join(IMPORT_FORMATS)}."
+        )
+    return extension
+
+
+class BookImporter:
+    """
+    Imports rows shaped like the book export (``title``, ``author``,
+    ``publication_date``, ``category_id`` or ``category_name``,
+    ``description``) in batches. Each batch resolves its category names
+    through a name cache, creating the missing ones in bulk, and is written
+    in its own transaction by ``bulk_save_books``.
+    """
+
+    max_reported_errors = 100
+
+    def __init__(self, batch_size=1000, upsert=False, dry_run=False, progress=None):
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.dry_run = dry_run
+        self.progress = progress
+        self.categories_by_name = {}
+        self.report = {
+            "dry_run": dry_run,
+            "rows": 0,
+            "created": 0,
+            "updated": 0,
+            "invalid": 0,
+            "categories_created": 0,
+            "errors": [],
+        }
+
+    def run(self, rows):
+        self.started = time.perf_counter()
+        batch = []
+        for row in rows:
+            self.report["rows"] += 1
+            batch.append((self.report["rows"], row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        self.update_throughput()
+        return self.report
+
+    def import_batch(self, batch):
+        categories = self.resolve_categories(
+            {
+                str(row["category_name"]).strip()
+                for _, row in batch
+                if isinstance(row, dict)
+                and not row.get("category_id")
+                and row.get("category_name")
+            }
+        )
+        items = [self.to_item(row) for _, row in batch]
+        result = bulk_save_books(
+            items,
+            self.batch_size,
+            upsert=self.upsert,
+            dry_run=self.dry_run,
+            categories={category.id: category for category in categories.values()},
+        )
+
+        self.report["created"] += result.count("created")
+        self.report["updated"] += result.count("updated")
+        self.report["invalid"] += len(result.errors)
+        for error in result.errors:
+            if len(self.report["errors"]) < self.max_reported_errors:
+                self.report["errors"].append(
+                    {"row": batch[error["index"]][0], "errors": error["errors"]}
+                )
+
+        self.update_throughput()
+        if self.progress:
+            self.progress(self.report)
+
+    def resolve_categories(self, names):
+        missing = names - self.categories_by_name.keys()
+        if missing:
+            by_name = category_cache.current().by_name
+            for name in missing & by_name.keys():
+                self.categories_by_name[name] = by_name[name]
+            missing -= self.categories_by_name.keys()
+        if missing:
+            new = [Category(name=name) for name in sorted(missing)]
+            if not self.dry_run:
+                # Another import may create some of them first, so conflicts
+                # are skipped and the stored rows read back.
+                Category.objects.bulk_create(new, ignore_conflicts=True)
+                new = list(Category.objects.filter(name__in=missing))
+                bump_generation(Category)
+            self.report["categories_created"] += len(new)
+            for category in new:
+                self.categories_by_name[category.name] = category
+        return {name: self.categories_by_name[name] for name in names}
+
+    def to_item(self, row):
+        if not isinstance(row, dict):
+            return row
+        item = {
+            field: row.get(field)
+            for field in ("title", "author", "publication_date", "description")
+            if row.get(field) not in (None, "")
+        }
+        if isinstance(item.get("publication_date"), (int, float)):
+            item["publication_date"] = EXCEL_EPOCH + datetime.timedelta(
+                days=int(item["publication_date"])
+            )
+        if row.get("category_id"):
+            item["category_id"] = row["category_id"]
+        elif row.get("category_name"):
+            item["category_id"] = self.categories_by_name[
+                str(row["category_name"]).strip()
+            ].id
+        return item
+
+    def update_throughput(self):
+        elapsed = time.perf_counter() - self.started
+        self.report["elapsed_seconds"] = round(elapsed, 3)
+        self.report["rows_per_second"] = (
+            round(self.report["rows"] / elapsed, 1) if elapsed else None
+        )
@@ -0,0 +1,67 @@
+import tracemalloc
+from pathlib import Path
+
+from core.benchmarks import summarize, time_call, write_report
+from django.core.management.base import BaseCommand, CommandError
+from library.extractors import BeautifulSoupExtractor, StreamingExtractor
+from library.scraper import get_rules
+
+CORPUS = Path(__file__).resolve().parents[2] / "scrape_fixtures"
+
+
+def peak_memory_kb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare parse time and peak memory of the streaming extractor with the "
+        "BeautifulSoup one over a corpus of saved HTML pages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", default=str(CORPUS))
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--json", dest="json_path")
+
+    def handle(self, *args, **options):
+        paths = sorted(Path(options["corpus"]).glob("*.html"))
+        if not paths:
+            raise CommandError(f"No .html files in {options['corpus']}.")
+
+        extractors = [
+            ("BeautifulSoup", BeautifulSoupExtractor()),
+            ("Streaming", StreamingExtractor()),
+        ]
+        rules = get_rules()
+        results = {"pages": {}}
+        totals = {name: 0 for name, _ in extractors}
+        for path in paths:
+            html = path.read_text(encoding="utf-8")
+            outputs = [extractor.extract(html, rules) for _, extractor in extractors]
+            if any(output != outputs[0] for output in outputs):
+                self.stderr.write(f"{path.name}: extractors disagree: {outputs}")
+
+            page = {"bytes": len(html.encode())}
+            for name, extractor in extractors:
+                timing = summarize(
+                    time_call(lambda: extractor.extract(html, rules), options["repeat"])
+                )
+                timing["peak_kb"] = peak_memory_kb(
+                    lambda: extractor.extract(html, rules)
+                )
+                page[name] = timing
+                totals[name] += timing["p50_ms"]
+                self.stdout.write(f"{path.name:>24} {name:>14}: {timing}")
+            results["pages"][path.name] = page
+
+        results["speedup"] = round(totals["BeautifulSoup"] / totals["Streaming"], 1)
+        self.stdout.write(f"speed-up (sum of p50): {results['speedup']}x")
+
+        if options["json_path"]:
+            write_report(options["json_path"], results)
@@ -0,0 +1,51 @@
+from core.benchmarks import summarize, time_call, write_report
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from library.benchmarks import seed_catalogue
+from library.search import BookSearchFilter
+
+TERMS = ["dragon", "silent garden", "tolkin", "murakami", "kingd"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare /library/books/ search latency for every search_mode on a "
+        "synthetic catalogue. The catalogue is seeded inside a transaction that "
+        "is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--json", dest="json_path")
+
+    def handle(self, *args, **options):
+        client = Client()
+        url = reverse("book-list")
+        results = {"books": options["books"], "modes": {}}
+
+        with transaction.atomic():
+            seed_catalogue(options["books"])
+
+            for mode in BookSearchFilter.search_modes:
+                samples = []
+                for term in TERMS:
+                    params = {"search": term, "search_mode": mode}
+                    samples += time_call(
+                        lambda: client.get(url, params), options["repeat"]
+                    )
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(url, {"search": TERMS[0], "search_mode": mode})
+                results["modes"][mode] = {
+                    **summarize(samples),
+                    "queries": len(queries.captured_queries),
+                }
+                self.stdout.write(f"{mode:>10}: {results['modes'][mode]}")
+
+            transaction.set_rollback(True)
+
+        if options["json_path"]:
+            write_report(options["json_path"], results)
@@ -0,0 +1,58 @@
+from core.benchmarks import summarize, time_call, write_report
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from library.benchmarks import seed_catalogue
+from library.models import Book
+from library.renderers import FastJSONRenderer
+from library.serializers import BookRowSerializer, BookSerializer
+from rest_framework.renderers import JSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Time serializing and rendering 1k books with BookSerializer and with "
+        "the BookRowSerializer fast path. Rows are loaded once, so only CPU "
+        "time is measured."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--json", dest="json_path")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            seed_catalogue(options["books"])
+            queryset = Book.objects.for_listing().order_by("publication_date", "id")
+            instances = list(queryset)
+            rows = list(queryset.values(*BookRowSerializer.row_fields))
+            transaction.set_rollback(True)
+
+        def model_serializer():
+            return JSONRenderer().render(BookSerializer(instances, many=True).data)
+
+        def row_serializer():
+            return FastJSONRenderer().render(BookRowSerializer(rows, many=True).data)
+
+        if model_serializer() != row_serializer():
+            raise CommandError("Fast path output differs from BookSerializer.")
+
+        per_1k = 1000 / options["books"]
+        results = {"books": options["books"]}
+        for name, func in [
+            ("BookSerializer", model_serializer),
+            ("BookRowSerializer", row_serializer),
+        ]:
+            samples = [sample * per_1k for sample in time_call(func, options["repeat"])]
+            results[name] = summarize(samples)
+            self.stdout.write(f"{name:>18} per 1k books: {results[name]}")
+
+        results["speedup"] = round(
+            results["BookSerializer"]["p50_ms"]
+            / results["BookRowSerializer"]["p50_ms"],
+            1,
+        )
+        self.stdout.write(f"speed-up (p50): {results['speedup']}x")
+
+        if options["json_path"]:
+            write_report(options["json_path"], results)
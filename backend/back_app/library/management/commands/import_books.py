@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from library.importers import (
+    IMPORT_FORMATS,
+    READERS,
+    BookImporter,
+    ImportFormatError,
+    detect_format,
+)
+
+
+class Command(BaseCommand):
+    help = "Import books from an XLSX, CSV or NDJSON file shaped like the export."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=IMPORT_FORMATS)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--upsert", action="store_true")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Validate every row and report errors without writing anything.",
+        )
+
+    def handle(self, *args, **options):
+        importer = BookImporter(
+            batch_size=options["batch_size"],
+            upsert=options["upsert"],
+            dry_run=options["dry_run"],
+            progress=self.report_progress,
+        )
+        try:
+            file_format = options["format"] or detect_format(options["path"])
+            with open(options["path"], "rb") as fileobj:
+                report = importer.run(READERS[file_format](fileobj))
+        except (ImportFormatError, OSError) as exc:
+            report = importer.report
+            if not report["dry_run"] and (report["created"] or report["updated"]):
+                # The batches before the error stay imported.
+                raise CommandError(
+                    f"{exc} ({report['created']} created and {report['updated']} "
+                    f"updated before the error.)"
+                )
+            raise CommandError(exc)
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Validated' if report['dry_run'] else 'Imported'} "
+                f"{report['rows']} rows in {report['elapsed_seconds']}s "
+                f"({report['rows_per_second']} rows/s): {report['created']} created, "
+                f"{report['updated']} updated, {report['invalid']} invalid, "
+                f"{report['categories_created']} new categories."
+            )
+        )
+
+    def report_progress(self, report):
+        self.stdout.write(
+            f"{report['rows']} rows, {report['rows_per_second']} rows/s, "
+            f"{report['invalid']} invalid"
+        )
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["publication_date", "id"], name="book_pub_date_id_idx"
+            ),
+        ),
+    ]
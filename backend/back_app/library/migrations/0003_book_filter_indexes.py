@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0002_book_pub_date_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["category", "publication_date", "id"],
+                name="book_category_pub_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["author", "publication_date", "id"],
+                name="book_author_pub_date_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0006_scrapedpage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookFacetCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "facet",
+                    models.CharField(
+                        choices=[
+                            ("category", "Category"),
+                            ("year", "Year"),
+                            ("author", "Author"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("value", models.CharField(max_length=255)),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["facet", "-count"], name="book_facet_count_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("facet", "value"), name="book_facet_count_unique"
+                    )
+                ],
+            },
+        ),
+        # Existing books are counted once; from here on library.facets keeps
+        # the counters up to date.
+        migrations.RunSQL(
+            """
+            INSERT INTO library_bookfacetcount (facet, value, count)
+            SELECT 'category', category_id::text, count(*)
+            FROM library_book GROUP BY category_id
+            UNION ALL
+            SELECT 'year', extract(year FROM publication_date)::int::text, count(*)
+            FROM library_book GROUP BY 2
+            UNION ALL
+            SELECT 'author', author, count(*)
+            FROM library_book GROUP BY author
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,7 +1,11 @@
 import uuid
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 
+SEARCH_CONFIG = "english"
+
 
 class Category(models.Model):
     name = models.CharField(max_length=255, unique=True)
@@ -11,6 +15,11 @@ class Category(models.Model):
         return self.name
 
 
+class BookQuerySet(models.QuerySet):
+    def for_listing(self):
+        return self.select_related("category").defer("search_vector")
+
+
 class Book(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=255)
@@ -20,6 +29,120 @@ class Book(models.Model):
         Category, on_delete=models.CASCADE, related_name="books"
     )
     description = models.TextField(blank=True, null=True)
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("author", weight="B", config=SEARCH_CONFIG)
+            + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["publication_date", "id"], name="book_pub_date_id_idx"
+            ),
+            models.Index(
+                fields=["category", "publication_date", "id"],
+                name="book_category_pub_date_idx",
+            ),
+            models.Index(
+                fields=["author", "publication_date", "id"],
+                name="book_author_pub_date_idx",
+            ),
+            GinIndex(fields=["search_vector"], name="book_search_vector_idx"),
+            GinIndex(
+                fields=["title"], name="book_title_trgm_idx", opclasses=["gin_trgm_ops"]
+            ),
+            GinIndex(
+                fields=["author"],
+                name="book_author_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        # The stored facet values let library.facets move the counters when
+        # the book is changed or deleted without reading it again.
+        if {"category_id", "publication_date", "author"} <= set(field_names):
+            book.stored_facets = book.get_facet_values()
+        return book
+
+    def get_facet_values(self):
+        return (
+            (BookFacetCount.Facet.CATEGORY, str(self.category_id)),
+            (BookFacetCount.Facet.YEAR, str(self.publication_date.year)),
+            (BookFacetCount.Facet.AUTHOR, self.author),
+        )
+
+
+class BookFacetCount(models.Model):
+    """
+    Number of books per category, publication year and author, kept up to date
+    by ``library.facets`` so unfiltered facet counts need no scan of books.
+    """
+
+    class Facet(models.TextChoices):
+        CATEGORY = "category"
+        YEAR = "year"
+        AUTHOR = "author"
+
+    facet = models.CharField(max_length=16, choices=Facet.choices)
+    value = models.CharField(max_length=255)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["facet", "value"], name="book_facet_count_unique"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["facet", "-count"], name="book_facet_count_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.count}"
+
+
+class ScrapeJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        FINISHED = "finished"
+        FAILED = "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING
+    )
+    urls = models.JSONField(default=list)
+    results = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+
+class ScrapedPage(models.Model):
+    url = models.URLField(max_length=2048, unique=True)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    content_hash = models.CharField(max_length=64)
+    book = models.ForeignKey(
+        Book, on_delete=models.SET_NULL, blank=True, null=True, related_name="+"
+    )
+    fetched_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.url
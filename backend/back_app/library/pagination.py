@@ -0,0 +1,172 @@
+from base64 import b64decode, b64encode
+from functools import reduce
+from operator import or_
+from urllib import parse
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+from rest_framework.utils.urls import replace_query_param
+
+
+class Row(Func):
+    function = "ROW"
+    output_field = Field()
+
+
+def seek_past(fields, values, descending=False):
+    """
+    The rows after ``values`` in the order of ``fields``, all ascending or all
+    descending, as one row-value comparison such as ``(a, b) > (x, y)``, which
+    PostgreSQL answers with a range scan on an index over ``fields``.
+    """
+    lookup = LessThan if descending else GreaterThan
+    return lookup(
+        Row(*(F(field) for field in fields)),
+        Row(
+            *(
+                value if hasattr(value, "resolve_expression") else Value(value)
+                for value in values
+            )
+        ),
+    )
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on every ordering field instead of the first
+    field plus an offset, so each page is a single index range scan however
+    deep the client pages. The last ordering field must be unique; ordering
+    on annotations (such as a search rank) is supported.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.queryset = queryset
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_seek_filter(ordering))
+
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        has_following_page = len(results) > len(self.page)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following_page
+        else:
+            self.has_next = has_following_page
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def get_seek_filter(self, ordering):
+        names = [self.get_field_name(order) for order in ordering]
+        descending = {order.startswith("-") for order in ordering}
+        if len(descending) == 1:
+            return seek_past(
+                names,
+                [
+                    Value(value, output_field=self.get_field(order))
+                    for order, value in zip(ordering, self.cursor.position)
+                ],
+                descending=descending.pop(),
+            )
+
+        # Mixed directions have no row-value form; the leading bound on the
+        # first field still limits the scan.
+        lookup = "__lte" if ordering[0].startswith("-") else "__gte"
+        bound = Q(**{names[0] + lookup: self.cursor.position[0]})
+        clauses = []
+        for index, order in enumerate(ordering):
+            lookup = "__lt" if order.startswith("-") else "__gt"
+            clause = {
+                self.get_field_name(previous): value
+                for previous, value in zip(ordering[:index], self.cursor.position)
+            }
+            clause[self.get_field_name(order) + lookup] = self.cursor.position[index]
+            clauses.append(Q(**clause))
+        return bound & reduce(or_, clauses)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.get_position(self.page[-1]))
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.get_position(self.page[0]))
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode("ascii")).decode("ascii")
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+            position = tokens["p"]
+            if len(position) != len(self.ordering):
+                raise ValueError
+            position = [
+                self.get_field(order).to_python(value)
+                for order, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {"p": cursor.position}
+        if cursor.reverse:
+            tokens["r"] = "1"
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_position(self, instance):
+        if isinstance(instance, dict):
+            values = [instance[self.get_field_name(order)] for order in self.ordering]
+        else:
+            values = [
+                getattr(instance, self.get_field_name(order)) for order in self.ordering
+            ]
+        return [str(value) for value in values]
+
+    def get_field(self, order):
+        name = self.get_field_name(order)
+        if name in self.queryset.query.annotations:
+            return self.queryset.query.annotations[name].output_field
+        return self.queryset.model._meta.get_field(name)
+
+    @staticmethod
+    def get_field_name(order):
+        return order.lstrip("-")
+
+
+class BookCursorPagination(KeysetCursorPagination):
+    ordering = ("publication_date", "id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import tempfile
+
+import xlsxwriter
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    Byte-for-byte the output of ``JSONRenderer``, encoded with orjson when it
+    is installed and the response is compact UTF-8 JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default)
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class BookExportRenderer(renderers.BaseRenderer):
+    charset = None
+    extension = None
+    stream_chunk_size = 64 * 1024
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b"".join(self.stream(data, columns=list(data[0]) if data else []))
+
+    def stream(self, rows, columns):
+        raise NotImplementedError
+
+
+class CSVRenderer(BookExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    extension = "csv"
+
+    def stream(self, rows, columns):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row.values())
+            if buffer.tell() >= self.stream_chunk_size:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+
+
+class NDJSONRenderer(BookExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    extension = "ndjson"
+
+    def stream(self, rows, columns):
+        lines = []
+        size = 0
+        for row in rows:
+            line = json.dumps(row, ensure_ascii=False, default=str) + "\n"
+            lines.append(line)
+            size += len(line)
+            if size >= self.stream_chunk_size:
+                yield "".join(lines).encode()
+                lines = []
+                size = 0
+        yield "".join(lines).encode()
+
+
+class XLSXRenderer(BookExportRenderer):
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    format = "xlsx"
+    extension = "xlsx"
+    sheet_name = "Books"
+
+    def stream(self, rows, columns):
+        # constant_memory flushes every finished row to disk, so only the
+        # current row is held in memory; the zip container is assembled in a
+        # temporary file and streamed back from there.
+        with tempfile.TemporaryFile() as output:
+            workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+            worksheet = workbook.add_worksheet(self.sheet_name)
+            date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+            worksheet.write_row(0, 0, columns)
+            for row_number, row in enumerate(rows, start=1):
+                for column_number, value in enumerate(row.values()):
+                    if hasattr(value, "isoformat"):
+                        worksheet.write_datetime(
+                            row_number, column_number, value, date_format
+                        )
+                    elif value is None or isinstance(value, (str, int, float)):
+                        worksheet.write(row_number, column_number, value)
+                    else:
+                        worksheet.write_string(row_number, column_number, str(value))
+            workbook.close()
+
+            output.seek(0)
+            while chunk := output.read(self.stream_chunk_size):
+                yield chunk
@@ -0,0 +1,456 @@
+import asyncio
+import datetime
+import functools
+import hashlib
+import logging
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import dateparse, timezone
+from django.utils.module_loading import import_string
+from library.cache import bump_generation
+from library.categories import category_cache
+from library.extractors import DEFAULT_RULES
+from library.facets import record_book_changes
+from library.models import Book, ScrapedPage, ScrapeJob
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+SCRAPED_CATEGORY = "Scraped"
+
+DEFAULTS = {
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 10,
+    "RETRIES": 2,
+    "BACKOFF_FACTOR": 0.5,
+    "MAX_WORKERS": 16,
+    "PER_HOST_CONCURRENCY": 4,
+    "MAX_URLS_PER_JOB": 500,
+    "JOB_WORKERS": 2,
+    "JOB_TIMEOUT": 60 * 60,
+    "CACHE_TTL": 24 * 60 * 60,
+    "CACHE_MAX_ENTRIES": 10000,
+    "EXTRACTOR": "library.extractors.StreamingExtractor",
+    "SITE_RULES": {},
+}
+
+
+def scraper_setting(name):
+    return getattr(settings, "SCRAPER", {}).get(name, DEFAULTS[name])
+
+
+def conditional_headers(cached):
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    return headers
+
+
+def build_page(url, cached, response):
+    page = {
+        "url": url,
+        "cached": cached,
+        "unchanged": response.status_code == 304,
+        "etag": response.headers.get("ETag", ""),
+        "last_modified": response.headers.get("Last-Modified", ""),
+    }
+    if page["unchanged"]:
+        page["etag"] = page["etag"] or cached.etag
+        page["last_modified"] = page["last_modified"] or cached.last_modified
+        page["content_hash"] = cached.content_hash
+        return page
+
+    page["content_hash"] = hashlib.sha256(response.content).hexdigest()
+    if cached is not None and page["content_hash"] == cached.content_hash:
+        page["unchanged"] = True
+    else:
+        page.update(parse_book_page(response.text, url))
+    return page
+
+
+class ScrapeFetcher:
+    """
+    Fetches pages over one pooled ``requests`` session with timeouts and
+    retries, on a bounded thread pool that never runs more than
+    ``PER_HOST_CONCURRENCY`` requests against the same host at once.
+    """
+
+    def __init__(self):
+        self.timeout = (
+            scraper_setting("CONNECT_TIMEOUT"),
+            scraper_setting("READ_TIMEOUT"),
+        )
+        self.max_workers = scraper_setting("MAX_WORKERS")
+        self.per_host = scraper_setting("PER_HOST_CONCURRENCY")
+        self.host_limits = defaultdict(
+            lambda: threading.BoundedSemaphore(self.per_host)
+        )
+        self.host_limits_lock = threading.Lock()
+
+        retry = Retry(
+            total=scraper_setting("RETRIES"),
+            backoff_factor=scraper_setting("BACKOFF_FACTOR"),
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.max_workers,
+            pool_maxsize=self.max_workers,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def host_limit(self, url):
+        with self.host_limits_lock:
+            return self.host_limits[urlsplit(url).netloc]
+
+    def fetch(self, url, headers=None):
+        with self.host_limit(url):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def scrape(self, url, cached=None):
+        """
+        Fetches ``url``, sending the validators of its ``cached`` page (a
+        ``ScrapedPage``) if there is one. The page is only parsed when the
+        server answers with new content; a 304 or an unchanged body comes
+        back as ``{"unchanged": True}`` with the cached book.
+        """
+        response = self.fetch(url, conditional_headers(cached))
+        return build_page(url, cached, response)
+
+    def scrape_many(self, urls, cached=None):
+        """Yields ``(url, page, error)`` for every url as soon as it is done."""
+        cached = cached or {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.scrape, url, cached.get(url)): url for url in urls
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as exc:
+                    yield futures[future], None, exc
+
+    def close(self):
+        self.session.close()
+
+
+@functools.cache
+def get_ssl_context():
+    # Loading the CA bundle takes tens of milliseconds; do it once per process
+    # rather than on the event loop for every client.
+    return httpx.create_ssl_context()
+
+
+class AsyncScrapeFetcher:
+    """
+    ``ScrapeFetcher`` for async views, on one pooled ``httpx.AsyncClient``
+    with the same timeouts, retries and per-host limit. Use it as an async
+    context manager so the client is closed.
+    """
+
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self):
+        self.retries = scraper_setting("RETRIES")
+        self.backoff_factor = scraper_setting("BACKOFF_FACTOR")
+        self.per_host = scraper_setting("PER_HOST_CONCURRENCY")
+        self.host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        max_workers = scraper_setting("MAX_WORKERS")
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                scraper_setting("READ_TIMEOUT"),
+                connect=scraper_setting("CONNECT_TIMEOUT"),
+            ),
+            limits=httpx.Limits(
+                max_connections=max_workers, max_keepalive_connections=max_workers
+            ),
+            # Retries connection failures; failed statuses are retried below.
+            transport=httpx.AsyncHTTPTransport(
+                verify=get_ssl_context(), retries=self.retries
+            ),
+            follow_redirects=True,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def fetch(self, url, headers=None):
+        async with self.host_limits[urlsplit(url).netloc]:
+            for attempt in range(self.retries + 1):
+                response = await self.client.get(url, headers=headers)
+                if (
+                    response.status_code not in self.retry_statuses
+                    or attempt == self.retries
+                ):
+                    break
+                await asyncio.sleep(self.backoff_factor * 2**attempt)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    async def scrape(self, url, cached=None):
+        response = await self.fetch(url, conditional_headers(cached))
+        # Parsing is CPU-bound, keep it off the event loop.
+        return await sync_to_async(build_page, thread_sensitive=False)(
+            url, cached, response
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def get_extractor():
+    return import_string(scraper_setting("EXTRACTOR"))()
+
+
+def get_rules(url=None):
+    """
+    Returns ``DEFAULT_RULES`` overridden, field by field, by the
+    ``SITE_RULES`` entry of the url's host (or of a parent domain).
+    """
+    rules = dict(DEFAULT_RULES)
+    host = (urlsplit(url).hostname or "") if url else ""
+    site_rules = scraper_setting("SITE_RULES")
+    for domain in sorted(site_rules, key=len):
+        if host == domain or host.endswith(f".{domain}"):
+            rules.update(site_rules[domain])
+    return rules
+
+
+def parse_date(value):
+    if not value:
+        return None
+    date = dateparse.parse_date(value[:10])
+    if date is None:
+        match = re.search(r"\b(1[5-9]|20)\d{2}\b", value)
+        date = datetime.date(int(match.group()), 1, 1) if match else None
+    return date
+
+
+def parse_isbn(value):
+    isbn = re.sub(r"[^0-9X]", "", (value or "").upper())
+    return isbn if len(isbn) in (10, 13) else ""
+
+
+def parse_book_page(html, url=None):
+    fields = get_extractor().extract(html, get_rules(url))
+    return {
+        "title": (fields.get("title") or "Unknown")[:255],
+        "author": (fields.get("author") or "Unknown")[:255],
+        "publication_date": parse_date(fields.get("publication_date")),
+        "isbn": parse_isbn(fields.get("isbn")),
+        "description": fields.get("description") or "",
+    }
+
+
+def get_cached_pages(urls):
+    """
+    Returns the cached pages, by url, that are younger than ``CACHE_TTL`` and
+    still point at a book; anything else is fetched again in full.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=scraper_setting("CACHE_TTL"))
+    return {
+        cached.url: cached
+        for cached in ScrapedPage.objects.select_related("book")
+        .defer("book__search_vector")
+        .filter(url__in=urls, fetched_at__gte=cutoff, book__isnull=False)
+    }
+
+
+def save_scraped_books(pages):
+    """
+    Upserts scraped pages into the "Scraped" category, matching on title, with
+    one read and at most one bulk insert and one bulk update, and records the
+    validators of every page in the scrape cache. Unchanged pages write
+    nothing. Returns a ``(book, status)`` pair per page, where status is
+    "created", "updated" or "unchanged".
+    """
+    changed = [page for page in pages if not page["unchanged"]]
+    saved, to_create, to_update = {}, {}, {}
+    if changed:
+        category = category_cache.get_or_create(SCRAPED_CATEGORY)
+        existing = {
+            book.title: book
+            for book in Book.objects.defer("search_vector").filter(
+                category=category, title__in={page["title"] for page in changed}
+            )
+        }
+        for page in changed:
+            book = existing.get(page["title"])
+            if book is None:
+                book = Book(title=page["title"], category=category)
+                existing[book.title] = book
+                to_create[book.id] = book
+            elif book.id not in to_create:
+                to_update[book.id] = book
+            book.author = page["author"]
+            book.publication_date = page["publication_date"] or datetime.date.today()
+            book.description = page["description"]
+            saved[id(page)] = (book, "created" if book.id in to_create else "updated")
+
+    now = timezone.now()
+    cache_entries = []
+    for page in pages:
+        cached = page["cached"]
+        if page["unchanged"]:
+            saved[id(page)] = (cached.book, "unchanged")
+            if (page["etag"], page["last_modified"]) == (
+                cached.etag,
+                cached.last_modified,
+            ):
+                continue
+        cache_entries.append(
+            ScrapedPage(
+                url=page["url"],
+                etag=page["etag"],
+                last_modified=page["last_modified"],
+                content_hash=page["content_hash"],
+                book=saved[id(page)][0],
+                fetched_at=cached.fetched_at if page["unchanged"] else now,
+            )
+        )
+
+    if to_create or to_update or cache_entries:
+        with transaction.atomic():
+            Book.objects.bulk_create(to_create.values())
+            Book.objects.bulk_update(
+                to_update.values(), ["author", "publication_date", "description"]
+            )
+            record_book_changes(created=to_create.values(), updated=to_update.values())
+            ScrapedPage.objects.bulk_create(
+                cache_entries,
+                update_conflicts=True,
+                unique_fields=["url"],
+                update_fields=[
+                    "etag",
+                    "last_modified",
+                    "content_hash",
+                    "book",
+                    "fetched_at",
+                ],
+            )
+            if to_create or to_update:
+                transaction.on_commit(lambda: bump_generation(Book))
+        if any(page["cached"] is None for page in pages):
+            evict_scraped_pages()
+    return [saved[id(page)] for page in pages]
+
+
+def evict_scraped_pages():
+    """Drops expired cache entries and the oldest ones above ``CACHE_MAX_ENTRIES``."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=scraper_setting("CACHE_TTL"))
+    overflow = ScrapedPage.objects.order_by("-fetched_at", "-id").values("id")[
+        scraper_setting("CACHE_MAX_ENTRIES") :
+    ]
+    ScrapedPage.objects.filter(Q(fetched_at__lt=cutoff) | Q(id__in=overflow)).delete()
+
+
+def fail_stale_scrape_jobs(jobs=None):
+    """
+    Marks the pending or running jobs of ``jobs`` (all by default) created
+    more than ``JOB_TIMEOUT`` seconds ago as failed. Jobs live in the
+    executor of the process that queued them, so a restart or a crashed
+    worker leaves them unfinished for good.
+    """
+    if jobs is None:
+        jobs = ScrapeJob.objects.all()
+    now = timezone.now()
+    return jobs.filter(
+        status__in=[ScrapeJob.Status.PENDING, ScrapeJob.Status.RUNNING],
+        created_at__lt=now - datetime.timedelta(seconds=scraper_setting("JOB_TIMEOUT")),
+    ).update(status=ScrapeJob.Status.FAILED, finished_at=now)
+
+
+def run_scrape_job(job_id):
+    # Claim the job, so one that was failed as stale is not run after all.
+    claimed = ScrapeJob.objects.filter(
+        id=job_id, status=ScrapeJob.Status.PENDING
+    ).update(status=ScrapeJob.Status.RUNNING)
+    if not claimed:
+        logger.warning(f"Scrape job {job_id} is no longer pending, skipping it.")
+        return
+    job = ScrapeJob.objects.get(id=job_id)
+
+    fetcher = ScrapeFetcher()
+    pages, results = [], []
+    try:
+        cached = get_cached_pages(job.urls)
+        for url, page, error in fetcher.scrape_many(job.urls, cached):
+            if error is not None:
+                logger.error(f"Error querying URL {url}: {error}")
+                results.append({"url": url, "status": "error", "detail": str(error)})
+            else:
+                pages.append((url, page))
+    finally:
+        fetcher.close()
+
+    if pages:
+        saved = save_scraped_books([page for _, page in pages])
+        for (url, page), (book, status) in zip(pages, saved):
+            result = {
+                "url": url,
+                "status": status,
+                "book_id": str(book.id),
+                "title": book.title,
+            }
+            if page.get("isbn"):
+                result["isbn"] = page["isbn"]
+            results.append(result)
+
+    job.results = results
+    job.status = ScrapeJob.Status.FINISHED
+    job.finished_at = timezone.now()
+    job.save(update_fields=["results", "status", "finished_at"])
+    logger.info(f"Scrape job {job.id} finished: {len(results)} urls.")
+
+
+def _run_scrape_job_in_worker(job_id):
+    try:
+        run_scrape_job(job_id)
+    except Exception:
+        logger.exception(f"Scrape job {job_id} failed")
+        ScrapeJob.objects.filter(id=job_id).update(
+            status=ScrapeJob.Status.FAILED, finished_at=timezone.now()
+        )
+    finally:
+        connections.close_all()
+
+
+_job_executor = None
+_job_executor_lock = threading.Lock()
+
+
+def enqueue_scrape_job(job):
+    global _job_executor
+    with _job_executor_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(
+                max_workers=scraper_setting("JOB_WORKERS"),
+                thread_name_prefix="scrape-job",
+            )
+    transaction.on_commit(
+        lambda: _job_executor.submit(_run_scrape_job_in_worker, job.id)
+    )
@@ -1,14 +1,18 @@
-from library.models import Book, Category
+from core.metrics import TimedListSerializer, TimedSerializerMixin
+from library.categories import category_cache
+from library.models import Book, Category, ScrapeJob
+from library.scraper import scraper_setting
 from rest_framework import serializers
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ["id", "name"]
+        list_serializer_class = TimedListSerializer
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.UUIDField(write_only=True)
 
@@ -23,19 +27,81 @@ class BookSerializer(serializers.ModelSerializer):
             "category_id",
             "description",
         ]
+        list_serializer_class = TimedListSerializer
+
+    def get_category(self, category_id):
+        category = category_cache.get_existing([category_id]).get(category_id)
+        if category is None:
+            raise serializers.ValidationError(
+                {"category_id": ["Category does not exist."]}
+            )
+        return category
 
     def create(self, validated_data):
-        category_id = validated_data.pop("category_id")
-        category = Category.objects.get(id=category_id)
+        category = self.get_category(validated_data.pop("category_id"))
         book = Book.objects.create(category=category, **validated_data)
         return book
 
     def update(self, instance, validated_data):
         if "category_id" in validated_data:
-            category_id = validated_data.pop("category_id")
-            instance.category = Category.objects.get(id=category_id)
+            instance.category = self.get_category(validated_data.pop("category_id"))
         return super().update(instance, validated_data)
 
 
+class BookRowSerializer(TimedSerializerMixin, serializers.BaseSerializer):
+    """
+    Read-only fast path for list endpoints: renders ``.values(*row_fields)``
+    rows into exactly what ``BookSerializer`` produces for the same book.
+    """
+
+    row_fields = (
+        "id",
+        "title",
+        "author",
+        "publication_date",
+        "category_id",
+        "category__name",
+        "description",
+    )
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    def to_representation(self, row):
+        return {
+            "id": str(row["id"]),
+            "title": row["title"],
+            "author": row["author"],
+            "publication_date": row["publication_date"].isoformat(),
+            "category": {"id": str(row["category_id"]), "name": row["category__name"]},
+            "description": row["description"],
+        }
+
+
 class BookInfoScrapeSerializer(serializers.Serializer):
     url = serializers.URLField(required=True)
+
+
+class BookBatchScrapeSerializer(serializers.Serializer):
+    urls = serializers.ListField(child=serializers.URLField(), allow_empty=False)
+
+    def validate_urls(self, urls):
+        limit = scraper_setting("MAX_URLS_PER_JOB")
+        if len(urls) > limit:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than {limit} elements."
+            )
+        return list(dict.fromkeys(urls))
+
+
+class ScrapeJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScrapeJob
+        fields = ["id", "status", "urls", "results", "created_at", "finished_at"]
+
+
+class BookImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=["xlsx", "csv", "ndjson"], required=False)
+    dry_run = serializers.BooleanField(default=False)
+    upsert = serializers.BooleanField(default=False)
@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from library.cache import bump_generation
+from library.facets import load_stored_facets, record_book_changes
+from library.models import Book, Category
+
+
+@receiver([post_save, post_delete], sender=Book)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_cached_responses(sender, **kwargs):
+    bump_generation(sender)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_cache(sender, **kwargs):
+    # A process that reloads the category cache before the change commits
+    # does not see it, so bump once more after the commit.
+    transaction.on_commit(lambda: bump_generation(Category))
+
+
+@receiver(pre_save, sender=Book)
+def remember_facet_values(sender, instance, **kwargs):
+    # Saving an instance that is still being added always inserts it.
+    if not instance._state.adding:
+        load_stored_facets(instance)
+
+
+@receiver(pre_delete, sender=Book)
+def remember_deleted_facet_values(sender, instance, **kwargs):
+    load_stored_facets(instance)
+
+
+@receiver(post_save, sender=Book)
+def count_saved_book(sender, instance, created, **kwargs):
+    if created:
+        record_book_changes(created=[instance])
+    else:
+        record_book_changes(updated=[instance])
+
+
+@receiver(post_delete, sender=Book)
+def count_deleted_book(sender, instance, **kwargs):
+    record_book_changes(deleted=[instance])
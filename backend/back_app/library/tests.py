@@ -1,3 +1,1702 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import json
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from core import metrics, throttling
+from core.checks import check_shared_cache
+from core.replicas import replica_set
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from library.benchmarks import parse_count
+from library.bulk import BOOK_DELETE_RELATIONS
+from library.cache import bump_generation, get_response_cache_stats
+from library.categories import category_cache
+from library.extractors import (
+    BeautifulSoupExtractor,
+    StreamingExtractor,
+    _CollectingParser,
+)
+from library.facets import rebuild_facet_counts
+from library.filters import BookFilter
+from library.models import Book, BookFacetCount, Category, ScrapedPage, ScrapeJob
+from library.renderers import FastJSONRenderer
+from library.scraper import (
+    AsyncScrapeFetcher,
+    ScrapeFetcher,
+    get_rules,
+    parse_book_page,
+    run_scrape_job,
+)
+from library.serializers import BookRowSerializer, BookSerializer
+from library.views import (
+    AsyncBookListView,
+    AsyncScrapeBookInfoView,
+    ExportBooksXLSXView,
+    ImportBooksView,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from users.authentication import UserClaimsTokenObtainPairSerializer
+from users.models import User
+
+SHARED_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "library_cache",
+    }
+}
+
+
+class LibraryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email="admin@example.com", username="admin", password="password"
+        )
+        cls.fiction = Category.objects.create(name="Fiction")
+        cls.science = Category.objects.create(name="Science")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def create_books(self, count, category=None, **kwargs):
+        return Book.objects.bulk_create(
+            Book(
+                title=f"Book {i}",
+                author=f"Author {i % 3}",
+                publication_date=datetime.date(2000 + i % 20, 1, 1),
+                category=category or self.fiction,
+                description=f"Description {i}",
+                **kwargs,
+            )
+            for i in range(count)
+        )
+
+
+class ExportBooksTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.create_books(5)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse("export-books"), {"format": "csv"})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_ignores_the_accept_header(self):
+        url = reverse("export-books")
+        response = self.client.get(
+            url, {"format": "csv"}, HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 6)
+        self.assertEqual(self.client.get(url, {"format": "pdf"}).status_code, 404)
+
+        self.client.force_authenticate(None)
+        response = self.client.get(url, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_xlsx_is_default(self):
+        response = self.client.get(reverse("export-books"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('filename="books.xlsx"', response["Content-Disposition"])
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertIn("xl/worksheets/sheet1.xml", archive.namelist())
+
+    def test_csv(self):
+        response = self.client.get(reverse("export-books"), {"format": "csv"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines[0],
+            "id,title,author,publication_date,category_id,category_name,description",
+        )
+        self.assertEqual(len(lines), 6)
+
+    def test_ndjson(self):
+        response = self.client.get(reverse("export-books"), {"format": "ndjson"})
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["category_name"], "Fiction")
+        self.assertEqual(rows[0]["publication_date"], "2000-01-01")
+
+    def test_without_server_side_cursors(self):
+        self.create_books(5)
+        response = self.client.get(reverse("export-books"), {"format": "ndjson"})
+        expected = b"".join(response.streaming_content)
+
+        settings_dict = connection.settings_dict
+        with mock.patch.dict(settings_dict, {"DISABLE_SERVER_SIDE_CURSORS": True}):
+            with mock.patch.object(ExportBooksXLSXView, "chunk_size", 3):
+                response = self.client.get(
+                    reverse("export-books"), {"format": "ndjson"}
+                )
+                with CaptureQueriesContext(connection) as queries:
+                    content = b"".join(response.streaming_content)
+        self.assertEqual(content, expected)
+        self.assertEqual(len(content.splitlines()), 10)
+        self.assertEqual(len(queries), 4)
+        for query in queries[1:]:
+            self.assertIn(
+                'ROW("library_book"."publication_date", "library_book"."id") >',
+                query["sql"],
+            )
+
+
+class BookListQueryCountTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def count_queries(self, url, books):
+        Book.objects.all().delete()
+        self.create_books(books)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertQueryCountIndependentOfSize(self, url):
+        self.assertEqual(self.count_queries(url, 2), self.count_queries(url, 20))
+
+    def test_book_list(self):
+        self.assertQueryCountIndependentOfSize(reverse("book-list"))
+
+    def test_books_by_category(self):
+        self.assertQueryCountIndependentOfSize(
+            reverse("books-by-category", args=[self.fiction.id])
+        )
+
+    def test_book_admin_list(self):
+        self.assertQueryCountIndependentOfSize(reverse("book-admin-list"))
+
+    def test_export(self):
+        self.assertQueryCountIndependentOfSize(reverse("export-books"))
+
+
+class BookCursorPaginationTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = self.create_books(45)
+
+    def test_walks_all_pages_forward_and_back(self):
+        seen = []
+        url = reverse("book-list")
+        pages = []
+        while url:
+            response = self.client.get(url, {"page_size": 10} if not pages else {})
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            seen += [book["id"] for book in response.json()["results"]]
+            url = response.json()["next"]
+
+        self.assertEqual(len(pages), 5)
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), {str(book.id) for book in self.books})
+        self.assertIsNone(pages[0]["previous"])
+
+        response = self.client.get(pages[-1]["previous"])
+        self.assertEqual(response.json()["results"], pages[-2]["results"])
+
+    def test_results_are_ordered_by_publication_date_then_id(self):
+        response = self.client.get(reverse("book-list"), {"page_size": 100})
+        keys = [
+            (book["publication_date"], book["id"])
+            for book in response.json()["results"]
+        ]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_deep_pages_seek_on_the_index(self):
+        response = self.client.get(reverse("book-list"), {"page_size": 10})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.json()["next"])
+        sql = next(query["sql"] for query in queries if "ORDER BY" in query["sql"])
+        self.assertIn(
+            'WHERE ROW("library_book"."publication_date", "library_book"."id") > (ROW(',
+            sql,
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}")
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("book_pub_date_id_idx", plan)
+        self.assertIn("Index Cond", plan)
+        self.assertNotIn("Sort", plan)
+
+    def test_page_size_is_capped(self):
+        self.create_books(80)
+        response = self.client.get(reverse("book-list"), {"page_size": 1000})
+        self.assertEqual(len(response.json()["results"]), 100)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("book-list"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_books_by_category_is_paginated(self):
+        response = self.client.get(
+            reverse("books-by-category", args=[self.fiction.id]), {"page_size": 5}
+        )
+        self.assertEqual(len(response.json()["results"]), 5)
+        self.assertIsNotNone(response.json()["next"])
+
+
+class BookFilterTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_books(20)
+        self.create_books(20, category=self.science)
+
+    def get_books(self, **params):
+        response = self.client.get(reverse("book-list"), {"page_size": 100, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_year_range(self):
+        books = self.get_books(year_from=2005, year_to=2009)
+        self.assertEqual(len(books), 10)
+        self.assertTrue(
+            all(
+                "2005-01-01" <= book["publication_date"] <= "2009-12-31"
+                for book in books
+            )
+        )
+
+    def test_open_ended_year_bounds(self):
+        self.assertEqual(len(self.get_books(year_from=2015)), 10)
+        self.assertEqual(len(self.get_books(year_to=2001)), 4)
+
+    def test_combined_filters(self):
+        books = self.get_books(
+            **{"category__id": self.science.id, "author": "Author 0", "year_to": 2009}
+        )
+        self.assertEqual(
+            {book["title"] for book in books}, {"Book 0", "Book 3", "Book 6", "Book 9"}
+        )
+
+    def test_invalid_year(self):
+        response = self.client.get(reverse("book-list"), {"year_from": "soon"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_year_filter_is_a_date_range(self):
+        queryset = BookFilter(
+            {"year_from": 2000, "year_to": 2010}, queryset=Book.objects.all()
+        ).qs
+        sql = str(queryset.query)
+        self.assertNotIn("EXTRACT", sql)
+        self.assertIn('"library_book"."publication_date" >= 2000-01-01', sql)
+
+
+class BookSearchTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_books(10)
+        Book.objects.bulk_create(
+            [
+                Book(
+                    title="The Hobbit",
+                    author="J. R. R. Tolkien",
+                    publication_date=datetime.date(1937, 9, 21),
+                    category=self.fiction,
+                    description="A dragon guards the treasure of the dwarves.",
+                ),
+                Book(
+                    title="Dragons of Autumn Twilight",
+                    author="Margaret Weis",
+                    publication_date=datetime.date(1984, 11, 1),
+                    category=self.fiction,
+                    description="An adventure in Krynn.",
+                ),
+            ]
+        )
+
+    def search(self, term, **params):
+        response = self.client.get(reverse("book-list"), {"search": term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [book["title"] for book in response.json()["results"]]
+
+    def test_fulltext_is_ranked(self):
+        self.assertEqual(
+            self.search("dragons"), ["Dragons of Autumn Twilight", "The Hobbit"]
+        )
+
+    def test_fulltext_falls_back_to_trigram_for_typos(self):
+        self.assertEqual(self.search("Tolkin"), ["The Hobbit"])
+
+    def test_trigram_mode(self):
+        self.assertEqual(self.search("Hobit", search_mode="trigram"), ["The Hobbit"])
+        self.assertEqual(self.search("treasure", search_mode="trigram"), [])
+
+    def test_simple_mode(self):
+        self.assertEqual(self.search("obbi", search_mode="simple"), ["The Hobbit"])
+
+    def test_unknown_mode(self):
+        response = self.client.get(
+            reverse("book-list"), {"search": "x", "search_mode": "magic"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_ranked_results_paginate(self):
+        titles = self.search("book", page_size=4)
+        response = self.client.get(
+            reverse("book-list"), {"search": "book", "page_size": 4}
+        )
+        next_page = self.client.get(response.json()["next"])
+        self.assertEqual(next_page.status_code, 200)
+        next_titles = [book["title"] for book in next_page.json()["results"]]
+        self.assertEqual(len(titles), 4)
+        self.assertFalse(set(titles) & set(next_titles))
+
+    def test_search_vector_follows_writes(self):
+        book = Book.objects.get(title="The Hobbit")
+        book.description = "Smaug sleeps on a hoard."
+        book.save()
+        self.assertEqual(self.search("smaug"), ["The Hobbit"])
+
+
+class ResponseCacheTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_books(3)
+        self.url = reverse("book-list")
+
+    def test_second_request_is_served_from_cache(self):
+        stats = get_response_cache_stats()
+        first = self.client.get(self.url, {"year_from": 2000, "page_size": 5})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {"page_size": 5, "year_from": 2000})
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(
+            get_response_cache_stats(),
+            {"hits": stats["hits"] + 1, "misses": stats["misses"] + 1},
+        )
+
+    def test_writes_invalidate(self):
+        self.client.get(self.url)
+        Book.objects.create(
+            title="New",
+            author="Someone",
+            publication_date=datetime.date(2024, 1, 1),
+            category=self.science,
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()["results"]), 4)
+
+        self.science.name = "Natural science"
+        self.science.save()
+        self.assertEqual(self.client.get(self.url)["X-Cache"], "MISS")
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_errors_are_not_cached(self):
+        self.client.get(self.url, {"year_from": "soon"})
+        response = self.client.get(self.url, {"year_from": "soon"})
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("X-Cache", response)
+
+    def test_browsable_api_is_not_cached(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(self.url, HTTP_ACCEPT="text/html")
+        self.assertContains(response, self.admin.username)
+        self.assertNotIn("X-Cache", response)
+
+        self.client.force_authenticate(None)
+        response = self.client.get(self.url, HTTP_ACCEPT="text/html")
+        self.assertNotContains(response, self.admin.username)
+
+    def test_cached_responses_vary_on_accept_and_authorization(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response["Vary"], "Accept, Authorization")
+
+
+class CategoryCacheTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        category_cache.current()
+
+    def test_writes_and_listing_do_not_load_categories(self):
+        payload = {
+            "title": "Cached",
+            "author": "Someone",
+            "publication_date": "2020-01-01",
+            "category_id": str(self.fiction.id),
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("book-admin-list"), payload)
+            self.assertEqual(response.status_code, 201)
+            response = self.client.patch(
+                reverse("book-admin-detail", args=[response.json()["id"]]),
+                {"category_id": str(self.science.id)},
+            )
+            self.assertEqual(response.json()["category"]["name"], "Science")
+            response = self.client.get(reverse("category-list"))
+        self.assertEqual(
+            [item["name"] for item in response.json()], ["Fiction", "Science"]
+        )
+        category_queries = [
+            query["sql"]
+            for query in queries.captured_queries
+            if 'FROM "library_category"' in query["sql"]
+        ]
+        # Each write only confirms that its category still exists.
+        self.assertEqual(len(category_queries), 2)
+        self.assertFalse(any('"name"' in sql for sql in category_queries))
+
+    def test_unknown_category_is_a_validation_error(self):
+        book = self.create_books(1)[0]
+        unknown = str(uuid.uuid4())
+        payload = {
+            "title": "Lost",
+            "author": "Someone",
+            "publication_date": "2020-01-01",
+            "category_id": unknown,
+        }
+        response = self.client.post(reverse("book-admin-list"), payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"category_id": ["Category does not exist."]})
+        response = self.client.patch(
+            reverse("book-admin-detail", args=[book.id]), {"category_id": unknown}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Book.objects.filter(title="Lost").exists())
+
+    def test_category_deleted_elsewhere_is_a_validation_error(self):
+        payload = {
+            "title": "Orphan",
+            "author": "Someone",
+            "publication_date": "2020-01-01",
+            "category_id": str(self.science.id),
+        }
+        # Deleted without a signal, as if by another process.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM library_category WHERE id = %s", [self.science.pk]
+            )
+        self.assertIsNotNone(category_cache.get(self.science.pk))
+
+        response = self.client.post(reverse("book-admin-list"), payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"category_id": ["Category does not exist."]})
+        response = self.client.post(
+            reverse("book-admin-bulk"), [payload], format="json"
+        )
+        self.assertEqual(response.json()["errors"][0]["index"], 0)
+        self.assertIsNone(category_cache.current().by_id.get(self.science.pk))
+
+    def test_reloads_after_max_age(self):
+        Category.objects.filter(pk=self.fiction.pk).update(name="Novels")
+        self.assertEqual(category_cache.get(self.fiction.pk).name, "Fiction")
+        with override_settings(CATEGORY_CACHE_MAX_AGE=0):
+            self.assertEqual(category_cache.get(self.fiction.pk).name, "Novels")
+
+    def test_reloads_when_the_generation_moves(self):
+        # A queryset update sends no signal, as if another process made it
+        # before its bump reached this one.
+        Category.objects.filter(pk=self.fiction.pk).update(name="Novels")
+        self.assertEqual(category_cache.get(self.fiction.pk).name, "Fiction")
+
+        bump_generation(Category)
+        self.assertEqual(category_cache.get(self.fiction.pk).name, "Novels")
+        self.assertIsNone(category_cache.get_by_name("Fiction"))
+
+        created = Category.objects.create(name="Poetry")
+        self.assertEqual(category_cache.get_by_name("Poetry"), created)
+
+
+class BookFacetTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_books(20)
+        self.create_books(10, category=self.science)
+        # bulk_create sends no signals.
+        rebuild_facet_counts()
+        self.url = reverse("book-facets")
+
+    def get_facets(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        book_queries = [
+            query["sql"]
+            for query in queries.captured_queries
+            if 'FROM "library_book"' in query["sql"]
+        ]
+        return response.json(), book_queries
+
+    def test_unfiltered_counts_come_from_the_counters(self):
+        data, book_queries = self.get_facets(top_authors=2)
+        self.assertEqual(book_queries, [])
+        self.assertEqual(data["total"], 30)
+        self.assertEqual(
+            [(row["name"], row["count"]) for row in data["categories"]],
+            [("Fiction", 20), ("Science", 10)],
+        )
+        self.assertEqual(
+            data["years"][:2],
+            [
+                {"year": 2000, "count": 2},
+                {"year": 2001, "count": 2},
+            ],
+        )
+        self.assertEqual(len(data["years"]), 20)
+        self.assertEqual(
+            data["authors"],
+            [{"author": "Author 0", "count": 11}, {"author": "Author 1", "count": 10}],
+        )
+
+    def test_filtered_counts_take_one_query_per_facet(self):
+        data, book_queries = self.get_facets(
+            **{"category__id": self.science.id, "year_to": 2004}
+        )
+        self.assertEqual(len(book_queries), 3)
+        self.assertTrue(all("GROUP BY" in sql for sql in book_queries))
+        self.assertEqual(data["total"], 5)
+        self.assertEqual(
+            data["categories"],
+            [{"id": str(self.science.id), "name": "Science", "count": 5}],
+        )
+        self.assertEqual(
+            [row["year"] for row in data["years"]], list(range(2000, 2005))
+        )
+
+        data, _ = self.get_facets(search="Book 12", search_mode="simple")
+        self.assertEqual(data["total"], 1)
+        self.assertEqual(data["authors"], [{"author": "Author 0", "count": 1}])
+
+    def test_counters_follow_writes(self):
+        self.client.force_authenticate(self.admin)
+        payload = {
+            "title": "New",
+            "author": "Someone",
+            "publication_date": "1990-05-05",
+            "category_id": str(self.science.id),
+        }
+        book_id = self.client.post(reverse("book-admin-list"), payload).json()["id"]
+        self.client.patch(
+            reverse("book-admin-detail", args=[book_id]),
+            {"category_id": str(self.fiction.id), "publication_date": "1991-01-01"},
+        )
+        Book.objects.get(title="Book 1", category=self.fiction).delete()
+        self.client.post(
+            reverse("book-admin-bulk") + "?upsert=true",
+            [{**payload, "title": "Book 2", "author": "Author 2"}],
+            format="json",
+        )
+        books = list(Book.objects.filter(title__in=["Book 3", "Book 4"]))
+        self.client.patch(
+            reverse("book-admin-bulk"),
+            [{"id": str(book.id), "author": "Someone"} for book in books],
+            format="json",
+        )
+        self.client.delete(
+            reverse("book-admin-bulk"),
+            [str(Book.objects.filter(title="Book 5").first().id)],
+            format="json",
+        )
+        Book(pk=Book.objects.get(title="Book 6", category=self.science).pk).delete()
+
+        self.assertEqual(rebuild_facet_counts(dry_run=True), [])
+        data, _ = self.get_facets()
+        self.assertEqual(
+            data["years"][:2],
+            [{"year": 1990, "count": 1}, {"year": 1991, "count": 1}],
+        )
+
+    def test_rebuild_command_fixes_drift(self):
+        BookFacetCount.objects.filter(facet="author", value="Author 0").update(count=1)
+        Book.objects.filter(title="Book 0").delete()
+
+        out = io.StringIO()
+        call_command("rebuild_facets", "--dry-run", stdout=out)
+        self.assertIn("author=Author 0", out.getvalue())
+        self.assertEqual(
+            BookFacetCount.objects.get(facet="author", value="Author 0").count, -1
+        )
+
+        call_command("rebuild_facets", stdout=io.StringIO())
+        self.assertEqual(rebuild_facet_counts(dry_run=True), [])
+        self.assertEqual(
+            BookFacetCount.objects.get(facet="author", value="Author 0").count, 9
+        )
+
+
+@override_settings(
+    DATABASE_REPLICATION={
+        **settings.DATABASE_REPLICATION,
+        "REPLICAS": ["replica"],
+        "STICKY_SECONDS": 60,
+    }
+)
+class ReplicaRoutingTests(LibraryTestCase):
+    """
+    A second test database stands in for the replica. Nothing replicates to
+    it, so every read shows which database served it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        default = connections["default"].settings_dict
+        name = f"{default['NAME']}_replica"
+        connections.settings["replica"] = {
+            **default,
+            "NAME": name,
+            "TEST": {**default["TEST"], "NAME": name},
+        }
+        connections["replica"].creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        # Declared here: the test runner only sets up the configured databases.
+        cls.databases = {"default", "replica"}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].creation.destroy_test_db(verbosity=0)
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        super().setUp()
+        replica_set.clear()
+        self.create_books(1)
+        # bulk_create sends no signals, so the facet counters stay untouched.
+        Category.objects.using("replica").bulk_create(
+            [Category(id=self.fiction.id, name="Fiction")]
+        )
+        Book.objects.using("replica").bulk_create(
+            [
+                Book(
+                    title="Replica book",
+                    author="Someone",
+                    publication_date=datetime.date(2001, 1, 1),
+                    category_id=self.fiction.id,
+                )
+            ]
+        )
+
+    def titles(self, client=None):
+        cache.clear()
+        response = (client or self.client).get(reverse("book-list"))
+        self.assertEqual(response.status_code, 200)
+        return [book["title"] for book in response.json()["results"]]
+
+    def test_public_reads_use_the_replica(self):
+        self.assertEqual(self.titles(), ["Replica book"])
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse("book-admin-list"))
+        self.assertEqual([book["title"] for book in response.json()], ["Book 0"])
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(
+            reverse("book-admin-list"),
+            {
+                "title": "Fresh",
+                "author": "Admin",
+                "publication_date": "2020-01-01",
+                "category_id": str(self.fiction.id),
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        cookie = response.cookies["db_primary_until"]
+        self.assertEqual(cookie["max-age"], 60)
+        self.assertEqual(self.titles(), ["Book 0", "Fresh"])
+
+        self.assertEqual(self.titles(APIClient()), ["Replica book"])
+
+        self.client.cookies["db_primary_until"] = "0"
+        self.assertEqual(self.titles(), ["Replica book"])
+
+    def test_pinned_clients_skip_cached_replica_reads(self):
+        self.client.force_authenticate(self.admin)
+        self.client.post(
+            reverse("book-admin-list"),
+            {
+                "title": "Fresh",
+                "author": "Admin",
+                "publication_date": "2020-01-01",
+                "category_id": str(self.fiction.id),
+            },
+        )
+        # Another client caches the replica's answer for the new generation.
+        response = APIClient().get(reverse("book-list"))
+        self.assertEqual(response["X-Cache"], "MISS")
+
+        response = self.client.get(reverse("book-list"))
+        self.assertEqual(response["X-Cache"], "MISS")
+        titles = [book["title"] for book in response.json()["results"]]
+        self.assertEqual(titles, ["Book 0", "Fresh"])
+        self.assertEqual(APIClient().get(reverse("book-list")).json(), response.json())
+
+    def test_reads_do_not_pin(self):
+        response = self.client.get(reverse("book-list"))
+        self.assertNotIn("db_primary_until", response.cookies)
+
+    def test_lagging_replica_is_skipped(self):
+        with override_settings(
+            DATABASE_REPLICATION={
+                **settings.DATABASE_REPLICATION,
+                "REPLICAS": ["replica"],
+                "MAX_LAG_SECONDS": -1,
+            }
+        ), self.assertLogs("core.replicas", "WARNING"):
+            self.assertEqual(self.titles(), ["Book 0"])
+
+    def test_round_robin(self):
+        with override_settings(
+            DATABASE_REPLICATION={
+                **settings.DATABASE_REPLICATION,
+                "REPLICAS": ["replica", "default"],
+            }
+        ):
+            chosen = [replica_set.choose() for _ in range(4)]
+        self.assertEqual(chosen[:2], chosen[2:])
+        self.assertEqual(set(chosen), {"replica", "default"})
+
+
+class BookRowSerializerTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_books(5)
+        Book.objects.create(
+            title='Quotes " and \\ backslashes \u2028 \u2029 \x1f',
+            author="Émile Zola 中文 🙂",
+            publication_date=datetime.date(1871, 1, 1),
+            category=self.science,
+            description=None,
+        )
+
+    def render_both(self):
+        books = Book.objects.for_listing().order_by("publication_date", "id")
+        expected = JSONRenderer().render(BookSerializer(books, many=True).data)
+        rows = books.values(*BookRowSerializer.row_fields)
+        actual = FastJSONRenderer().render(BookRowSerializer(rows, many=True).data)
+        return expected, actual
+
+    def test_matches_book_serializer(self):
+        expected, actual = self.render_both()
+        self.assertEqual(expected, actual)
+
+    def test_matches_book_serializer_without_orjson(self):
+        with mock.patch("library.renderers.orjson", None):
+            expected, actual = self.render_both()
+        self.assertEqual(expected, actual)
+
+    def test_list_endpoint_shape(self):
+        response = self.client.get(reverse("book-list"), {"page_size": 1})
+        book = Book.objects.get(publication_date=datetime.date(1871, 1, 1))
+        self.assertEqual(
+            response.json()["results"],
+            [json.loads(JSONRenderer().render(BookSerializer(book).data))],
+        )
+
+
+class BookBulkTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse("book-admin-bulk")
+
+    def book_payload(self, i, category=None):
+        return {
+            "title": f"Bulk {i}",
+            "author": "Bulk Author",
+            "publication_date": "2020-01-01",
+            "category_id": str((category or self.fiction).id),
+        }
+
+    def test_bulk_create_reports_item_errors(self):
+        payload = [self.book_payload(i) for i in range(50)]
+        payload[3]["category_id"] = "00000000-0000-0000-0000-000000000000"
+        del payload[7]["title"]
+
+        category_cache.current()
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                self.url + "?batch_size=20", payload, format="json"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["created"], 48)
+        self.assertEqual([error["index"] for error in data["errors"]], [3, 7])
+        self.assertEqual(Book.objects.count(), 48)
+
+    def test_bulk_create_ndjson(self):
+        body = "\n".join(json.dumps(self.book_payload(i)) for i in range(3))
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.json()["created"], 3)
+
+    def test_upsert_by_title_and_author(self):
+        book = self.create_books(1)[0]
+        payload = [
+            {
+                "title": book.title,
+                "author": book.author,
+                "publication_date": "1999-09-09",
+                "category_id": str(self.science.id),
+            },
+            self.book_payload(1),
+        ]
+        response = self.client.post(self.url + "?upsert=true", payload, format="json")
+        self.assertEqual(response.json()["updated"], 1)
+        self.assertEqual(response.json()["created"], 1)
+        book.refresh_from_db()
+        self.assertEqual(book.category, self.science)
+        self.assertEqual(book.publication_date, datetime.date(1999, 9, 9))
+
+    def test_bulk_update(self):
+        books = self.create_books(3)
+        payload = [
+            {"id": str(books[0].id), "title": "Renamed"},
+            {"id": str(books[1].id), "category_id": str(self.science.id)},
+            {"id": "not-a-uuid", "title": "Nope"},
+            {"id": str(books[2].id)},
+        ]
+        response = self.client.patch(self.url, payload, format="json")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["updated"], 2)
+        self.assertEqual([error["index"] for error in data["errors"]], [2, 3])
+        self.assertEqual(Book.objects.get(id=books[0].id).title, "Renamed")
+        self.assertEqual(Book.objects.get(id=books[1].id).category, self.science)
+
+    def test_bulk_delete(self):
+        books = self.create_books(3)
+        payload = [
+            str(books[0].id),
+            {"id": str(books[1].id)},
+            str(uuid.uuid4()),
+            str(books[0].id),
+        ]
+        response = self.client.delete(self.url, payload, format="json")
+        data = response.json()
+        self.assertEqual(data["deleted"], 2)
+        self.assertEqual([error["index"] for error in data["errors"]], [2, 3])
+        self.assertEqual(data["errors"][1]["errors"], {"id": ["Duplicate id."]})
+        self.assertEqual(Book.objects.count(), 1)
+
+    def test_bulk_delete_does_not_load_books(self):
+        books = self.create_books(20)
+        rebuild_facet_counts()
+        page = ScrapedPage.objects.create(
+            url="https://example.com/book",
+            content_hash="x",
+            book=books[0],
+            fetched_at=timezone.now(),
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(
+                self.url, [str(book.id) for book in books[:15]], format="json"
+            )
+        self.assertEqual(response.json()["deleted"], 15)
+        book_queries = [q["sql"] for q in queries if '"library_book"' in q["sql"]]
+        self.assertEqual(len(book_queries), 2)
+        self.assertFalse(any('"library_book"."title"' in sql for sql in book_queries))
+
+        page.refresh_from_db()
+        self.assertIsNone(page.book_id)
+        self.assertEqual(Book.objects.count(), 5)
+        self.assertEqual(rebuild_facet_counts(dry_run=True), [])
+
+    def test_bulk_delete_handles_every_relation_to_books(self):
+        relations = [
+            f"{field.related_model._meta.label}.{field.field.name}"
+            for field in Book._meta.get_fields(include_hidden=True)
+            if field.auto_created and not field.concrete
+        ]
+        self.assertEqual(sorted(relations), sorted(BOOK_DELETE_RELATIONS))
+
+    def test_requires_array(self):
+        response = self.client.post(self.url, {"title": "x"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalidates_response_cache(self):
+        self.client.get(reverse("book-list"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, [self.book_payload(1)], format="json")
+        response = self.client.get(reverse("book-list"))
+        self.assertEqual(response["X-Cache"], "MISS")
+
+
+class ImportBooksTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, file_format):
+        response = self.client.get(reverse("export-books"), {"format": file_format})
+        return b"".join(response.streaming_content)
+
+    def upload(self, content, name, **data):
+        return self.client.post(
+            reverse("import-books"),
+            {"file": SimpleUploadedFile(name, content), **data},
+            format="multipart",
+        )
+
+    def test_round_trips_every_export_format(self):
+        self.create_books(5, category=self.science)
+        exports = {
+            file_format: self.export(file_format)
+            for file_format in ("xlsx", "csv", "ndjson")
+        }
+        for file_format, content in exports.items():
+            response = self.upload(content, f"books.{file_format}")
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.json()["created"], 5)
+        self.assertEqual(Book.objects.filter(category=self.science).count(), 20)
+        self.assertEqual(
+            set(Book.objects.values_list("publication_date", flat=True)),
+            {datetime.date(2000 + i, 1, 1) for i in range(5)},
+        )
+
+    def test_creates_missing_categories_once(self):
+        content = (
+            "title,author,publication_date,category_name\n"
+            "A,X,2001-01-01,Poetry\n"
+            "B,X,2002-01-01,Poetry\n"
+            "C,X,2003-01-01,Fiction\n"
+        ).encode()
+        response = self.upload(content, "books.csv")
+        self.assertEqual(response.json()["categories_created"], 1)
+        self.assertEqual(Category.objects.get(name="Poetry").books.count(), 2)
+        self.assertEqual(self.fiction.books.count(), 1)
+
+    def test_dry_run_reports_without_writing(self):
+        content = (
+            "title,author,publication_date,category_name\n"
+            "A,X,2001-01-01,Poetry\n"
+            "B,X,not a date,Poetry\n"
+        ).encode()
+        response = self.upload(content, "books.csv", dry_run=True)
+        report = response.json()
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(report["invalid"], 1)
+        self.assertEqual(report["errors"][0]["row"], 2)
+        self.assertIn("publication_date", report["errors"][0]["errors"])
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(Category.objects.filter(name="Poetry").exists())
+
+    def test_unsupported_file(self):
+        response = self.upload(b"whatever", "books.txt")
+        self.assertEqual(response.status_code, 400)
+
+    def test_csv_that_is_not_utf8(self):
+        content = b"title,author,publication_date,category_name\n" + (
+            "A,X,2001-01-01,Fiction\n".encode() * 3
+            + "B,Zoë,2002-01-01,Fiction\n".encode("latin-1")
+        )
+        with mock.patch.object(ImportBooksView, "batch_size", 2):
+            response = self.upload(content, "books.csv")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("not UTF-8 on line 5", response.json()["detail"])
+        self.assertEqual(response.json()["report"]["created"], 2)
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_corrupt_xlsx_sheet(self):
+        self.create_books(1)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(self.export("xlsx"))) as source:
+            with zipfile.ZipFile(buffer, "w") as target:
+                for name in source.namelist():
+                    content = source.read(name)
+                    if name.startswith("xl/worksheets/"):
+                        content = content[: len(content) // 2]
+                    target.writestr(name, content)
+        response = self.upload(buffer.getvalue(), "books.xlsx")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Invalid XLSX file", response.json()["detail"])
+
+    def test_xlsx_reads_the_first_sheet_of_the_workbook(self):
+        self.create_books(2)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(self.export("xlsx"))) as source:
+            with zipfile.ZipFile(buffer, "w") as target:
+                for name in source.namelist():
+                    content = source.read(name)
+                    if name == "xl/_rels/workbook.xml.rels":
+                        content = content.replace(b"sheet1.xml", b"sheet2.xml")
+                    target.writestr(name.replace("sheet1.xml", "sheet2.xml"), content)
+                # Not part of the workbook.
+                target.writestr("xl/worksheets/sheet1.xml", b"not xml")
+        response = self.upload(buffer.getvalue(), "books.xlsx")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["created"], 2)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile(suffix=".ndjson") as fileobj:
+            fileobj.write(
+                b'{"title": "A", "author": "X", "publication_date": "2001-01-01", '
+                b'"category_name": "Fiction"}\n'
+            )
+            fileobj.flush()
+            out = io.StringIO()
+            call_command("import_books", fileobj.name, "--batch-size", "1", stdout=out)
+        self.assertIn("1 created", out.getvalue())
+        self.assertTrue(Book.objects.filter(title="A", category=self.fiction).exists())
+
+
+SCRAPE_FIXTURES = Path(__file__).resolve().parent / "scrape_fixtures"
+
+
+class StubBookHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            time.sleep(server.delay)
+            etag = None
+            if self.path.startswith("/fixtures/"):
+                body = (SCRAPE_FIXTURES / self.path.rsplit("/", 1)[-1]).read_bytes()
+                self.send_response(200)
+            elif self.path.startswith(("/books/", "/plain/")):
+                title = self.path.rsplit("/", 1)[-1].replace("-", " ").title()
+                description = server.descriptions.get(title, f"About {title}")
+                body = (
+                    f'<html><head><meta name="description" content="{description}">'
+                    f"</head><body><h1> {title} </h1></body></html>"
+                ).encode()
+                if self.path.startswith("/books/"):
+                    etag = f'"{hash(body)}"'
+                if etag and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+            else:
+                body = b"missing"
+                self.send_response(404)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(SCRAPER={"RETRIES": 0, "MAX_WORKERS": 8, "PER_HOST_CONCURRENCY": 2})
+class ScrapeTests(LibraryTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubBookHandler)
+        cls.server.lock = threading.Lock()
+        cls.server.active = cls.server.peak = 0
+        cls.server.delay = 0
+        cls.server.requests = []
+        cls.server.descriptions = {}
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.server.active = self.server.peak = 0
+        self.server.delay = 0
+        self.server.requests = []
+        self.server.descriptions = {}
+        self.client.force_authenticate(self.admin)
+
+    def test_scrape_single_book(self):
+        url = reverse("scrape-book-info")
+        response = self.client.post(url, {"url": f"{self.base_url}/books/dune"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["detail"], "Book created successfully.")
+        self.assertEqual(response.json()["book"]["title"], "Dune")
+        self.assertEqual(response.json()["book"]["description"], "About Dune")
+
+        self.server.descriptions["Dune"] = "Revised"
+        response = self.client.post(url, {"url": f"{self.base_url}/books/dune"})
+        self.assertEqual(response.json()["detail"], "Book updated successfully.")
+        self.assertEqual(Book.objects.filter(title="Dune").count(), 1)
+
+    def test_scrape_single_book_error(self):
+        response = self.client.post(
+            reverse("scrape-book-info"), {"url": f"{self.base_url}/nothing"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Book.objects.exists())
+
+    async def async_scrape(self, url):
+        request = APIRequestFactory().post("/", {"url": url}, format="json")
+        force_authenticate(request, self.admin)
+        return await AsyncScrapeBookInfoView.as_view()(request)
+
+    async def test_async_scrape(self):
+        response = await self.async_scrape(f"{self.base_url}/books/dune")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["detail"], "Book created successfully.")
+        self.assertEqual(response.data["book"]["title"], "Dune")
+
+        response = await self.async_scrape(f"{self.base_url}/books/dune")
+        self.assertEqual(response.data["detail"], "Book unchanged.")
+        self.assertEqual(await Book.objects.filter(title="Dune").acount(), 1)
+
+        response = await self.async_scrape(f"{self.base_url}/nothing")
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_fetcher_per_host_concurrency(self):
+        self.server.delay = 0.05
+        async with AsyncScrapeFetcher() as fetcher:
+            pages = await asyncio.gather(
+                *(fetcher.scrape(f"{self.base_url}/books/book-{i}") for i in range(10))
+            )
+        self.assertEqual([page["title"] for page in pages][:2], ["Book 0", "Book 1"])
+        self.assertEqual(self.server.peak, 2)
+
+    @override_settings(SCRAPER={"RETRIES": 0, "READ_TIMEOUT": 0.2})
+    def test_scrape_timeout(self):
+        self.server.delay = 1
+        response = self.client.post(
+            reverse("scrape-book-info"), {"url": f"{self.base_url}/books/slow"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("timed out", response.json()["detail"])
+
+    def test_per_host_concurrency(self):
+        self.server.delay = 0.05
+        fetcher = ScrapeFetcher()
+        urls = [f"{self.base_url}/books/book-{i}" for i in range(10)]
+        results = list(fetcher.scrape_many(urls))
+        fetcher.close()
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(error is None for _, _, error in results))
+        self.assertEqual(self.server.peak, 2)
+
+    def test_batch_job(self):
+        urls = [f"{self.base_url}/books/book-{i}" for i in range(5)]
+        urls.append(f"{self.base_url}/missing")
+        with mock.patch("library.views.enqueue_scrape_job") as enqueue:
+            response = self.client.post(
+                reverse("scrape-books"), {"urls": urls}, format="json"
+            )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["id"]
+        self.assertEqual(response.json()["status"], "pending")
+        self.assertTrue(response.json()["status_url"].endswith(f"/{job_id}/"))
+        enqueue.assert_called_once()
+
+        run_scrape_job(job_id)
+
+        response = self.client.get(reverse("scrape-job-detail", args=[job_id]))
+        job = response.json()
+        self.assertEqual(job["status"], ScrapeJob.Status.FINISHED)
+        self.assertEqual(len(job["results"]), 6)
+        statuses = {result["url"]: result["status"] for result in job["results"]}
+        self.assertEqual(statuses[f"{self.base_url}/missing"], "error")
+        self.assertEqual(list(statuses.values()).count("created"), 5)
+        self.assertEqual(Book.objects.filter(category__name="Scraped").count(), 5)
+
+    def test_stale_job_is_failed_and_not_run(self):
+        stale = ScrapeJob.objects.create(urls=[f"{self.base_url}/books/book-1"])
+        fresh = ScrapeJob.objects.create(urls=[f"{self.base_url}/books/book-2"])
+        ScrapeJob.objects.filter(id=stale.id).update(
+            created_at=timezone.now() - datetime.timedelta(hours=2)
+        )
+
+        for job in (stale, fresh):
+            self.client.get(reverse("scrape-job-detail", args=[job.id]))
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, ScrapeJob.Status.FAILED)
+        self.assertIsNotNone(stale.finished_at)
+        self.assertEqual(fresh.status, ScrapeJob.Status.PENDING)
+
+        # A worker that picks the job up late leaves it failed.
+        run_scrape_job(stale.id)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, ScrapeJob.Status.FAILED)
+        self.assertFalse(Book.objects.exists())
+
+    @override_settings(SCRAPER={"MAX_URLS_PER_JOB": 2})
+    def test_batch_job_limit(self):
+        urls = [f"{self.base_url}/books/book-{i}" for i in range(3)]
+        response = self.client.post(
+            reverse("scrape-books"), {"urls": urls}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ScrapeJob.objects.exists())
+
+    def test_batch_job_requires_admin(self):
+        self.client.force_authenticate(None)
+        response = self.client.post(
+            reverse("scrape-books"), {"urls": [self.base_url]}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_repeat_scrape_uses_conditional_get(self):
+        url = reverse("scrape-book-info")
+        self.client.post(url, {"url": f"{self.base_url}/books/dune"})
+        cached = ScrapedPage.objects.get(url=f"{self.base_url}/books/dune")
+        self.assertTrue(cached.etag)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {"url": f"{self.base_url}/books/dune"})
+        self.assertEqual(response.json()["detail"], "Book unchanged.")
+        self.assertEqual(response.json()["book"]["title"], "Dune")
+        writes = [
+            query["sql"]
+            for query in queries.captured_queries
+            if not query["sql"].startswith("SELECT")
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(len(self.server.requests), 2)
+
+        self.server.descriptions["Dune"] = "Revised"
+        response = self.client.post(url, {"url": f"{self.base_url}/books/dune"})
+        self.assertEqual(response.json()["detail"], "Book updated successfully.")
+        self.assertEqual(response.json()["book"]["description"], "Revised")
+
+    def test_repeat_scrape_without_validators_compares_hash(self):
+        url = f"{self.base_url}/plain/dune"
+        self.client.post(reverse("scrape-book-info"), {"url": url})
+        with mock.patch("library.scraper.parse_book_page") as parse:
+            response = self.client.post(reverse("scrape-book-info"), {"url": url})
+        parse.assert_not_called()
+        self.assertEqual(response.json()["detail"], "Book unchanged.")
+
+    def test_expired_cache_refetches(self):
+        url = f"{self.base_url}/books/dune"
+        self.client.post(reverse("scrape-book-info"), {"url": url})
+        ScrapedPage.objects.update(
+            fetched_at=timezone.now() - datetime.timedelta(days=2)
+        )
+        response = self.client.post(reverse("scrape-book-info"), {"url": url})
+        self.assertEqual(response.json()["detail"], "Book updated successfully.")
+
+    @override_settings(SCRAPER={"RETRIES": 0, "CACHE_MAX_ENTRIES": 3})
+    def test_cache_eviction(self):
+        run_scrape_job(
+            ScrapeJob.objects.create(
+                urls=[f"{self.base_url}/books/book-{i}" for i in range(5)]
+            ).id
+        )
+        self.assertEqual(ScrapedPage.objects.count(), 3)
+
+    def test_scrape_extracts_book_metadata(self):
+        response = self.client.post(
+            reverse("scrape-book-info"),
+            {"url": f"{self.base_url}/fixtures/microdata_book.html"},
+        )
+        book = response.json()["book"]
+        self.assertEqual(book["title"], "Beloved")
+        self.assertEqual(book["author"], "Toni Morrison")
+        self.assertEqual(book["publication_date"], "1987-09-02")
+
+
+class ExtractorTests(TestCase):
+    expected = {
+        "jsonld_book.html": ("Dune", "Frank Herbert", "1965-08-01", "9780441013593"),
+        "microdata_book.html": ("Beloved", "Toni Morrison", "1987-09-02", "1400033416"),
+        "opengraph_book.html": (
+            "The Left Hand of Darkness",
+            "Ursula K. Le Guin",
+            "1969-03-01",
+            "9780441478125",
+        ),
+        "plain_page.html": ("Middlemarch", "Unknown", None, ""),
+    }
+
+    def test_fixtures(self):
+        for name, (title, author, published, isbn) in self.expected.items():
+            with self.subTest(name):
+                html = (SCRAPE_FIXTURES / name).read_text()
+                page = parse_book_page(html)
+                self.assertEqual(page["title"], title)
+                self.assertEqual(page["author"], author)
+                self.assertEqual(
+                    page["publication_date"],
+                    published and datetime.date.fromisoformat(published),
+                )
+                self.assertEqual(page["isbn"], isbn)
+                self.assertTrue(page["description"])
+
+    def test_backends_agree(self):
+        rules = get_rules()
+        for path in SCRAPE_FIXTURES.glob("*.html"):
+            with self.subTest(path.name):
+                html = path.read_text()
+                self.assertEqual(
+                    StreamingExtractor().extract(html, rules),
+                    BeautifulSoupExtractor().extract(html, rules),
+                )
+
+    @override_settings(
+        SCRAPER={"SITE_RULES": {"example.com": {"title": ["tag:title"]}}}
+    )
+    def test_site_rules(self):
+        self.assertEqual(
+            get_rules("https://books.example.com/1")["title"], ["tag:title"]
+        )
+        self.assertEqual(get_rules("https://example.org/1")["title"][0], "tag:h1")
+        html = (SCRAPE_FIXTURES / "jsonld_book.html").read_text()
+        page = parse_book_page(html, "https://example.com/dune")
+        self.assertEqual(page["title"], "Dune - Example Books")
+        self.assertEqual(page["author"], "Frank Herbert")
+
+    @override_settings(
+        SCRAPER={"EXTRACTOR": "library.extractors.BeautifulSoupExtractor"}
+    )
+    def test_configurable_backend(self):
+        html = (SCRAPE_FIXTURES / "opengraph_book.html").read_text()
+        with mock.patch.object(
+            BeautifulSoupExtractor, "extract", return_value={}
+        ) as extract:
+            self.assertEqual(parse_book_page(html)["title"], "Unknown")
+        extract.assert_called_once()
+
+    def test_streaming_stops_early(self):
+        html = (SCRAPE_FIXTURES / "plain_page.html").read_text()
+        rules = {"title": ["tag:h1"], "description": ["meta:description"]}
+        with mock.patch.object(
+            StreamingExtractor, "chunk_size", 1024
+        ), mock.patch.object(
+            _CollectingParser, "feed", autospec=True, side_effect=HTMLParser.feed
+        ) as feed:
+            fields = StreamingExtractor().extract(html, rules)
+        self.assertEqual(fields["title"], "Middlemarch")
+        self.assertLess(feed.call_count, len(html) // 1024 // 2)
+
+
+class ThrottlingTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        throttling._limiters.clear()
+        self.addCleanup(throttling._limiters.clear)
+
+    @override_settings(
+        THROTTLING={**settings.THROTTLING, "RATES": {"anon": "3/min", "user": "5/min"}}
+    )
+    def test_anonymous_token_bucket(self):
+        url = reverse("book-list")
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "20")
+
+        other = APIClient(REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(other.get(url).status_code, 200)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertGreaterEqual(throttling.get_throttle_stats()["throttled:anon"], 1)
+
+    @override_settings(
+        THROTTLING={**settings.THROTTLING, "RATES": {"anon": "1/min", "user": "5/min"}}
+    )
+    def test_concurrent_requests_do_not_spend_the_same_tokens(self):
+        get = LocMemCache.get
+
+        def slow_get(cache, *args, **kwargs):
+            # Widens the gap between reading and writing the bucket.
+            value = get(cache, *args, **kwargs)
+            time.sleep(0.02)
+            return value
+
+        request = Request(APIRequestFactory().get("/"))
+        allowed = []
+
+        def allow():
+            throttle = throttling.AnonTokenBucketThrottle()
+            allowed.append(throttle.allow_request(request, None))
+
+        with mock.patch.object(LocMemCache, "get", slow_get):
+            threads = [threading.Thread(target=allow) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(allowed), [False, True])
+
+    @override_settings(
+        THROTTLING={**settings.THROTTLING, "RATES": {"anon": "3/min", "user": "30/min"}}
+    )
+    def test_cost_weights(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse("export-books"), {"format": "csv"})
+        self.assertEqual(response.status_code, 200)
+        b"".join(response.streaming_content)
+        response = self.client.get(reverse("export-books"), {"format": "csv"})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "20")
+        self.assertEqual(self.client.get(reverse("book-list")).status_code, 200)
+
+    @override_settings(
+        THROTTLING={
+            **settings.THROTTLING,
+            "RATES": {},
+            "CONCURRENCY": {
+                "export": {"process": 1, "total": 1, "lease": 60, "retry_after": 7}
+            },
+        }
+    )
+    def test_export_concurrency_limit(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse("export-books")
+        streaming = self.client.get(url, {"format": "csv"})
+        self.assertEqual(streaming.status_code, 200)
+
+        response = self.client.get(url, {"format": "csv"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+
+        b"".join(streaming.streaming_content)
+        self.assertEqual(self.client.get(url, {"format": "csv"}).status_code, 200)
+
+    @override_settings(
+        THROTTLING={
+            **settings.THROTTLING,
+            "RATES": {},
+            "CONCURRENCY": {
+                "export": {"process": 1, "total": 1, "lease": 60, "retry_after": 7}
+            },
+        }
+    )
+    def test_closing_a_stream_early_frees_the_slot(self):
+        request = APIRequestFactory().get(reverse("export-books"), {"format": "csv"})
+        force_authenticate(request, self.admin)
+        view = ExportBooksXLSXView.as_view()
+        streaming = view(request)
+        next(iter(streaming.streaming_content))
+        self.assertEqual(view(request).status_code, 503)
+
+        # Closing fires request_finished, which must keep the test connection.
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        streaming.close()
+        streaming = view(request)
+        self.assertEqual(streaming.status_code, 200)
+        streaming.close()
+
+    @override_settings(
+        THROTTLING={
+            **settings.THROTTLING,
+            "CONCURRENCY": {
+                "export": {"process": 2, "total": 1, "lease": 60, "retry_after": 7}
+            },
+        }
+    )
+    def test_concurrency_is_shared_across_processes(self):
+        with override_settings(CACHES=SHARED_CACHES):
+            call_command("createcachetable", verbosity=0)
+            # Another process has its own cache object on the same table.
+            other_process = DatabaseCache("library_cache", {})
+            other_process.add("throttle:slot:export:0", "another-process", 60)
+            self.client.force_authenticate(self.admin)
+            response = self.client.get(reverse("export-books"), {"format": "csv"})
+        self.assertEqual(response.status_code, 503)
+
+    def test_limits_require_a_shared_cache(self):
+        self.assertEqual(
+            [error.id for error in check_shared_cache(None)], ["core.E001"]
+        )
+        with override_settings(CACHES=SHARED_CACHES):
+            self.assertEqual(check_shared_cache(None), [])
+        no_limits = {**settings.THROTTLING, "RATES": {}, "CONCURRENCY": {}}
+        with override_settings(THROTTLING=no_limits):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_monitoring_stats(self):
+        self.client.get(reverse("book-list"))
+        self.client.force_authenticate(self.admin)
+        stats = self.client.get(reverse("monitoring-stats")).json()
+        self.assertGreaterEqual(stats["throttling"]["allowed:anon"], 1)
+        self.assertIn("hits", stats["response_cache"])
+
+
+class MetricsTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset_metrics()
+        self.create_books(3)
+        token = UserClaimsTokenObtainPairSerializer.get_token(self.admin).access_token
+        self.staff_auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+    def get_metrics(self, **extra):
+        return self.client.get(reverse("metrics"), **(extra or self.staff_auth))
+
+    def test_records_request_metrics_per_view(self):
+        self.client.get(reverse("book-list"))
+        self.client.get(reverse("book-list"))
+        self.client.get(reverse("category-list"), {"page": 1})
+
+        response = self.get_metrics()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn(
+            'http_requests_total{view="book-list",method="GET",status="200"} 2', body
+        )
+        self.assertIn('http_request_duration_seconds_count{view="book-list"} 2', body)
+        self.assertIn('http_request_db_queries_count{view="book-list"} 2', body)
+        self.assertIn(
+            'http_response_size_bytes_bucket{view="book-list",le="+Inf"} 2', body
+        )
+        # The second request is answered from the response cache.
+        self.assertIn(
+            'http_request_serializer_duration_seconds_count{view="book-list"} 1', body
+        )
+        self.assertIn(
+            'http_request_serializer_duration_seconds_count{view="category-list"} 1',
+            body,
+        )
+        self.assertIn("# TYPE response_cache_events_total counter", body)
+
+    def test_counts_queries(self):
+        self.client.force_authenticate(self.admin)
+        self.client.get(reverse("book-admin-list"))
+        self.assertEqual(metrics.DB_QUERIES.count("book-admin-list"), 1)
+        series = metrics.DB_QUERIES.series["book-admin-list"]
+        self.assertGreaterEqual(series[1], 1)
+
+    def test_metrics_require_staff_or_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        with override_settings(METRICS={"TOKEN": "secret"}):
+            response = self.get_metrics(HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(response.status_code, 200)
+            response = self.get_metrics(HTTP_AUTHORIZATION="Bearer wrong")
+            self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS={"SLOW_REQUEST_MS": 0})
+    def test_slow_request_log_has_sql(self):
+        with self.assertLogs("core.metrics", "WARNING") as logs:
+            self.client.get(reverse("book-list"))
+        self.assertIn("(book-list)", logs.output[0])
+        self.assertIn('FROM "library_book"', logs.output[0])
+
+    def test_profiles_staff_requests_with_header(self):
+        with self.assertNoLogs("core.profiling"):
+            self.client.get(reverse("book-list"), HTTP_X_PROFILE="1")
+
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(METRICS={"PROFILE_DIR": directory}):
+                with self.assertLogs("core.profiling", "INFO") as logs:
+                    response = self.client.get(
+                        reverse("book-list"), HTTP_X_PROFILE="1", **self.staff_auth
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("function calls", logs.output[0])
+                self.assertEqual(len(list(Path(directory).glob("book-list-*.prof"))), 1)
+
+
+class AsyncViewTests(LibraryTestCase):
+    async def test_async_book_list_uses_response_cache(self):
+        await sync_to_async(self.create_books)(3)
+        view = AsyncBookListView.as_view()
+        first = await view(APIRequestFactory().get(reverse("book-list")))
+        second = await view(APIRequestFactory().get(reverse("book-list")))
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(len(json.loads(second.content)["results"]), 3)
+
+    async def test_metrics_middleware_under_asgi(self):
+        metrics.reset_metrics()
+        response = await self.async_client.get(reverse("book-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.REQUEST_DURATION.count("book-list"), 1)
+        self.assertEqual(metrics.DB_QUERIES.series["book-list"][1], 1)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_parse_count(self):
+        self.assertEqual(parse_count("10k"), 10000)
+        self.assertEqual(parse_count("1M"), 1000000)
+        self.assertEqual(parse_count(250), 250)
+
+    def test_bench_api_client_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / "baseline.json"
+            call_command(
+                "bench_api",
+                books="50",
+                categories=3,
+                requests=2,
+                scenario=["book-list", "profile", "export-csv"],
+                json_path=str(baseline),
+                stdout=io.StringIO(),
+            )
+            report = json.loads(baseline.read_text())
+            self.assertEqual(
+                set(report["scenarios"]), {"book-list", "profile", "export-csv"}
+            )
+            book_list = report["scenarios"]["book-list"]
+            self.assertEqual(book_list["queries"], 1)
+            self.assertEqual(book_list["statuses"], {"200": 2})
+            self.assertIn("p99_ms", book_list)
+            self.assertIn("throughput_rps", book_list)
+
+            current = Path(directory) / "current.json"
+            call_command(
+                "bench_api",
+                books="0",
+                requests=2,
+                scenario=["profile"],
+                json_path=str(current),
+                baseline_path=str(baseline),
+                threshold=100,
+                stdout=io.StringIO(),
+            )
+            comparison = json.loads(current.read_text())["comparison"]
+            self.assertEqual(list(comparison), ["profile"])
+            self.assertFalse(comparison["profile"]["regressed"])
+        self.assertFalse(Book.objects.exists())
@@ -1,11 +1,21 @@
+from core.async_views import select_view
 from django.urls import include, path
 from library.views import (
+    AsyncBookFacetsView,
+    AsyncBookListView,
+    AsyncBooksByCategoryView,
+    AsyncCategoryListView,
+    AsyncScrapeBookInfoView,
+    BatchScrapeBooksView,
     BookAdminViewSet,
+    BookFacetsView,
     BookListView,
     BooksByCategoryView,
     CategoryListView,
     ExportBooksXLSXView,
+    ImportBooksView,
     ScrapeBookInfoView,
+    ScrapeJobDetailView,
 )
 from rest_framework.routers import DefaultRouter
 
@@ -13,14 +23,38 @@ router = DefaultRouter()
 router.register("admin/books", BookAdminViewSet, basename="book-admin")
 
 urlpatterns = [
-    path("categories/", CategoryListView.as_view(), name="category-list"),
-    path("books/", BookListView.as_view(), name="book-list"),
+    path(
+        "categories/",
+        select_view(CategoryListView, AsyncCategoryListView).as_view(),
+        name="category-list",
+    ),
+    path(
+        "books/",
+        select_view(BookListView, AsyncBookListView).as_view(),
+        name="book-list",
+    ),
+    path(
+        "books/facets/",
+        select_view(BookFacetsView, AsyncBookFacetsView).as_view(),
+        name="book-facets",
+    ),
     path(
         "categories/<uuid:category_id>/books/",
-        BooksByCategoryView.as_view(),
+        select_view(BooksByCategoryView, AsyncBooksByCategoryView).as_view(),
         name="books-by-category",
     ),
     path("export-books/", ExportBooksXLSXView.as_view(), name="export-books"),
-    path("scrape-book-info/", ScrapeBookInfoView.as_view(), name="scrape-book-info"),
+    path("import-books/", ImportBooksView.as_view(), name="import-books"),
+    path(
+        "scrape-book-info/",
+        select_view(ScrapeBookInfoView, AsyncScrapeBookInfoView).as_view(),
+        name="scrape-book-info",
+    ),
+    path("scrape-books/", BatchScrapeBooksView.as_view(), name="scrape-books"),
+    path(
+        "scrape-jobs/<uuid:pk>/",
+        ScrapeJobDetailView.as_view(),
+        name="scrape-job-detail",
+    ),
     path("", include(router.urls)),
 ]
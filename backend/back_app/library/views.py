@@ -1,137 +1,509 @@
-import datetime
-import io
 import logging
+import uuid
 
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from django.db.models.functions import ExtractYear
-from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from core.async_views import AsyncViewMixin
+from core.replicas import ReplicaReadMixin
+from core.throttling import ConcurrencyLimitMixin
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
-from library.models import Book, Category
+from library.bulk import bulk_delete_books, bulk_save_books, bulk_update_books
+from library.cache import AsyncCachedListMixin, VersionedResponseCacheMixin
+from library.categories import category_cache
+from library.facets import Facet, count_facet, stored_facet
+from library.filters import BookFilter
+from library.importers import (
+    READERS,
+    BookImporter,
+    ImportFormatError,
+    detect_format,
+)
+from library.models import Book, Category, ScrapeJob
+from library.pagination import BookCursorPagination, seek_past
+from library.parsers import NDJSONParser
+from library.renderers import CSVRenderer, NDJSONRenderer, XLSXRenderer
+from library.scraper import (
+    AsyncScrapeFetcher,
+    ScrapeFetcher,
+    enqueue_scrape_job,
+    fail_stale_scrape_jobs,
+    get_cached_pages,
+    save_scraped_books,
+)
+from library.search import BookSearchFilter
 from library.serializers import (
+    BookBatchScrapeSerializer,
+    BookImportSerializer,
     BookInfoScrapeSerializer,
+    BookRowSerializer,
     BookSerializer,
     CategorySerializer,
+    ScrapeJobSerializer,
 )
-from rest_framework import filters, generics, permissions, status, viewsets
+from rest_framework import generics, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 logger = logging.getLogger(__name__)
 
 
-class CategoryListView(generics.ListAPIView):
+class BookRowListMixin:
+    """
+    Lists books from ``.values()`` rows through ``BookRowSerializer`` instead
+    of building a model instance and a nested serializer per book.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return queryset.values(
+            *BookRowSerializer.row_fields, *queryset.query.annotations
+        )
+
+    def get_serializer_class(self):
+        if getattr(self, "swagger_fake_view", False):
+            return super().get_serializer_class()
+        return BookRowSerializer
+
+
+class CategoryListView(
+    ReplicaReadMixin, VersionedResponseCacheMixin, generics.ListAPIView
+):
+    cache_models = (Category,)
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
 
+    def get_queryset(self):
+        return category_cache.all()
+
 
-class BookListView(generics.ListAPIView):
+class BookListView(
+    ReplicaReadMixin,
+    VersionedResponseCacheMixin,
+    BookRowListMixin,
+    generics.ListAPIView,
+):
+    cache_models = (Book, Category)
     serializer_class = BookSerializer
     permission_classes = [permissions.AllowAny]
-    queryset = Book.objects.all()
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ["category__id"]
+    pagination_class = BookCursorPagination
+    queryset = Book.objects.for_listing()
+    filter_backends = [DjangoFilterBackend, BookSearchFilter]
+    filterset_class = BookFilter
     search_fields = ["title", "author"]
 
-    def get_queryset(self):
-        queryset = super().get_queryset().annotate(year=ExtractYear("publication_date"))
-        year_from = self.request.query_params.get("year_from")
-        year_to = self.request.query_params.get("year_to")
-        if year_from and year_to:
-            queryset = queryset.filter(year__gte=year_from, year__lte=year_to)
-        return queryset
 
-
-class BooksByCategoryView(generics.ListAPIView):
+class BooksByCategoryView(
+    ReplicaReadMixin,
+    VersionedResponseCacheMixin,
+    BookRowListMixin,
+    generics.ListAPIView,
+):
+    cache_models = (Book, Category)
     serializer_class = BookSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = BookCursorPagination
 
     def get_queryset(self):
         category_id = self.kwargs.get("category_id")
-        return Book.objects.filter(category__id=category_id)
+        return Book.objects.for_listing().filter(category__id=category_id)
+
+
+class AsyncCategoryListView(AsyncViewMixin, AsyncCachedListMixin, CategoryListView):
+    pass
+
+
+class AsyncBookListView(AsyncViewMixin, AsyncCachedListMixin, BookListView):
+    pass
+
+
+class AsyncBooksByCategoryView(
+    AsyncViewMixin, AsyncCachedListMixin, BooksByCategoryView
+):
+    pass
+
+
+class BookFacetsMixin:
+    """
+    Counts books per category, per publication year and for the
+    ``top_authors`` most frequent authors. Without filters the counts come from
+    the ``BookFacetCount`` counters; with ``BookListView``'s filters or search
+    every facet is one aggregated query over the matching books.
+    """
+
+    top_authors = 10
+    max_top_authors = 100
+
+    def get_top_authors(self, request):
+        try:
+            top_authors = int(request.query_params["top_authors"])
+        except (KeyError, ValueError):
+            return self.top_authors
+        return min(max(top_authors, 0), self.max_top_authors)
+
+    def is_filtered(self, request):
+        params = {*self.filterset_class.base_filters, BookSearchFilter.search_param}
+        return any(request.query_params.get(param) for param in params)
+
+    def list(self, request, *args, **kwargs):
+        limits = {
+            Facet.CATEGORY: None,
+            Facet.YEAR: None,
+            Facet.AUTHOR: self.get_top_authors(request),
+        }
+        if self.is_filtered(request):
+            queryset = self.filter_queryset(self.get_queryset())
+            counts = {
+                facet: count_facet(queryset, facet, limit)
+                for facet, limit in limits.items()
+            }
+        else:
+            counts = {
+                facet: stored_facet(facet, limit) for facet, limit in limits.items()
+            }
+
+        by_id = category_cache.current().by_id
+        categories = []
+        for value, count in counts[Facet.CATEGORY]:
+            category = by_id.get(uuid.UUID(value))
+            if category is not None:
+                categories.append(
+                    {"id": category.pk, "name": category.name, "count": count}
+                )
+        categories.sort(key=lambda row: (-row["count"], row["name"]))
+        data = {
+            "total": sum(count for _, count in counts[Facet.CATEGORY]),
+            "categories": categories,
+            "years": sorted(
+                (
+                    {"year": int(value), "count": count}
+                    for value, count in counts[Facet.YEAR]
+                ),
+                key=lambda row: row["year"],
+            ),
+            "authors": [
+                {"author": value, "count": count}
+                for value, count in counts[Facet.AUTHOR]
+            ],
+        }
+        return Response(data)
+
+
+class BookFacetsView(
+    ReplicaReadMixin,
+    VersionedResponseCacheMixin,
+    BookFacetsMixin,
+    generics.GenericAPIView,
+):
+    cache_models = (Book, Category)
+    permission_classes = [permissions.AllowAny]
+    queryset = Book.objects.all()
+    filter_backends = [DjangoFilterBackend, BookSearchFilter]
+    filterset_class = BookFilter
+    search_fields = ["title", "author"]
+
+    @swagger_auto_schema(
+        operation_description="Book counts per category, publication year and "
+        "author, for all books or for those matching the book list filters. "
+        "?top_authors=N (default 10, at most 100) limits the authors.",
+    )
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+
+class AsyncBookFacetsView(AsyncViewMixin, AsyncCachedListMixin, BookFacetsView):
+    pass
 
 
 class BookAdminViewSet(viewsets.ModelViewSet):
     serializer_class = BookSerializer
-    queryset = Book.objects.all()
+    queryset = Book.objects.for_listing()
     permission_classes = [permissions.IsAdminUser]
+    parser_classes = [*api_settings.DEFAULT_PARSER_CLASSES, NDJSONParser]
+    bulk_batch_size = 500
+    max_bulk_batch_size = 5000
+
+    def get_bulk_items(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError(
+                {"non_field_errors": ["Expected a JSON array or NDJSON body."]}
+            )
+        return request.data
+
+    def get_bulk_batch_size(self, request):
+        try:
+            batch_size = int(request.query_params["batch_size"])
+        except (KeyError, ValueError):
+            return self.bulk_batch_size
+        return min(max(batch_size, 1), self.max_bulk_batch_size)
+
+    @swagger_auto_schema(
+        operation_description="Create many books from a JSON array or NDJSON body. "
+        "With ?upsert=true, books matching on title and author are updated.",
+        request_body=BookSerializer(many=True),
+    )
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        result = bulk_save_books(
+            self.get_bulk_items(request),
+            self.get_bulk_batch_size(request),
+            upsert=request.query_params.get("upsert") in ("1", "true"),
+        )
+        return Response(result.data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_description="Partially update many books; every item needs an id.",
+        request_body=BookSerializer(many=True),
+    )
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        result = bulk_update_books(
+            self.get_bulk_items(request), self.get_bulk_batch_size(request)
+        )
+        return Response(result.data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_description="Delete many books given a list of ids.",
+    )
+    @bulk.mapping.delete
+    def bulk_delete(self, request):
+        result = bulk_delete_books(
+            self.get_bulk_items(request), self.get_bulk_batch_size(request)
+        )
+        return Response(result.data, status=status.HTTP_200_OK)
 
 
-class ExportBooksXLSXView(APIView):
+class ExportBooksXLSXView(ConcurrencyLimitMixin, APIView):
     permission_classes = [permissions.IsAdminUser]
+    concurrency_scope = "export"
+    throttle_cost = 20
+    renderer_classes = [XLSXRenderer, CSVRenderer, NDJSONRenderer]
+    export_fields = {
+        "id": "id",
+        "title": "title",
+        "author": "author",
+        "publication_date": "publication_date",
+        "category_id": "category_id",
+        "category_name": "category__name",
+        "description": "description",
+    }
+    chunk_size = 2000
 
     def get(self, request, format=None):
-        books = Book.objects.all()
-        serializer = BookSerializer(books, many=True)
-        df = pd.DataFrame(serializer.data)
-
-        with io.BytesIO() as buffer:
-            writer = pd.ExcelWriter(buffer, engine="xlsxwriter")
-            df.to_excel(writer, index=False, sheet_name="Books")
-            writer.close()
-            buffer.seek(0)
-
-            response = HttpResponse(
-                buffer.getvalue(),
-                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        renderer = request.accepted_renderer
+        columns = list(self.export_fields)
+        response = StreamingHttpResponse(
+            renderer.stream(self.iter_rows(), columns=columns),
+            content_type=renderer.media_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="books.{renderer.extension}"'
+        )
+        return response
+
+    def iter_rows(self):
+        columns = list(self.export_fields)
+        rows = (
+            Book.objects.for_listing()
+            .values_list(*self.export_fields.values())
+            .order_by("publication_date", "id")
+        )
+        if connections[rows.db].settings_dict["DISABLE_SERVER_SIDE_CURSORS"]:
+            chunks = self.seek_chunks(rows, columns)
+        else:
+            chunks = [rows.iterator(chunk_size=self.chunk_size)]
+        for chunk in chunks:
+            for row in chunk:
+                yield dict(zip(columns, row))
+
+    def seek_chunks(self, rows, columns):
+        """
+        Without server-side cursors ``iterator()`` fetches the whole result at
+        once, so read it a chunk at a time along the (publication_date, id)
+        index instead.
+        """
+        date, pk = columns.index("publication_date"), columns.index("id")
+        queryset = rows
+        while True:
+            chunk = list(queryset[: self.chunk_size])
+            yield chunk
+            if len(chunk) < self.chunk_size:
+                return
+            last = chunk[-1]
+            queryset = rows.filter(
+                seek_past(["publication_date", "id"], [last[date], last[pk]])
             )
-            response["Content-Disposition"] = 'attachment; filename="books.xlsx"'
-            return response
 
+    def perform_content_negotiation(self, request, force=False):
+        """
+        Picks the renderer from ``?format=`` alone, XLSX without one, so the
+        client's Accept header cannot turn the request into a 406.
+        """
+        renderers = self.get_renderers()
+        wanted = self.format_kwarg or request.query_params.get(
+            api_settings.URL_FORMAT_OVERRIDE
+        )
+        for renderer in renderers:
+            if renderer.format == wanted:
+                return renderer, renderer.media_type
+        if wanted and not force:
+            raise NotFound(f"Unknown export format {wanted!r}.")
+        return renderers[0], renderers[0].media_type
+
+    def handle_exception(self, exc):
+        # Errors are reported as JSON whichever export format was requested.
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
 
-class ScrapeBookInfoView(generics.GenericAPIView):
+
+class ImportBooksView(generics.GenericAPIView):
     permission_classes = [permissions.IsAdminUser]
-    serializer_class = BookInfoScrapeSerializer
+    throttle_cost = 20
+    serializer_class = BookImportSerializer
+    parser_classes = [MultiPartParser]
+    batch_size = 1000
 
     @swagger_auto_schema(
-        operation_description="Scraping book information by URL and saving (or updating) it in the database",
-        request_body=BookInfoScrapeSerializer,
-        responses={200: "Scraped book info and saved/updated in DB"},
+        operation_description="Import books from an XLSX, CSV or NDJSON file shaped "
+        "like the export. Missing categories are created by name; with dry_run "
+        "only a validation report is returned.",
     )
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        url = serializer.validated_data.get("url")
+        upload = serializer.validated_data["file"]
 
+        importer = BookImporter(
+            batch_size=self.batch_size,
+            upsert=serializer.validated_data["upsert"],
+            dry_run=serializer.validated_data["dry_run"],
+        )
         try:
-            resp = requests.get(url)
-            resp.raise_for_status()
-        except Exception as e:
-            logger.error(f"Error querying URL {url}: {e}")
+            file_format = serializer.validated_data.get("format") or detect_format(
+                upload.name
+            )
+            report = importer.run(READERS[file_format](upload))
+        except ImportFormatError as exc:
+            # Batches before the error were committed; the report counts them.
             return Response(
-                {"detail": f"Error querying URL: {str(e)}"},
+                {"detail": str(exc), "report": importer.report},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        soup = BeautifulSoup(resp.text, "html.parser")
-        title_tag = soup.find("h1")
-        meta_description = soup.find("meta", attrs={"name": "description"})
-        scraped_title = title_tag.text.strip() if title_tag else "Unknown"
-        scraped_description = (
-            meta_description["content"].strip()
-            if meta_description and meta_description.get("content")
-            else ""
-        )
+        logger.info(f"Imported books from {upload.name}: {report}")
+        return Response(report, status=status.HTTP_200_OK)
 
-        default_category, _ = Category.objects.get_or_create(name="Scraped")
 
-        book, created = Book.objects.update_or_create(
-            title=scraped_title,
-            category=default_category,
-            defaults={
-                "author": "Unknown",
-                "publication_date": datetime.date.today(),
-                "description": scraped_description,
-            },
+scrape_book_schema = swagger_auto_schema(
+    operation_description="Scraping book information by URL and saving (or updating) it in the database",
+    request_body=BookInfoScrapeSerializer,
+    responses={200: "Scraped book info and saved/updated in DB"},
+)
+
+
+class ScrapeBookInfoView(ConcurrencyLimitMixin, generics.GenericAPIView):
+    permission_classes = [permissions.IsAdminUser]
+    concurrency_scope = "scrape"
+    throttle_cost = 10
+    serializer_class = BookInfoScrapeSerializer
+
+    @scrape_book_schema
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        url = serializer.validated_data.get("url")
+
+        fetcher = ScrapeFetcher()
+        try:
+            page = fetcher.scrape(url, get_cached_pages([url]).get(url))
+        except Exception as e:
+            return self.error_response(url, e)
+        finally:
+            fetcher.close()
+        return self.saved_response(page)
+
+    def error_response(self, url, error):
+        logger.error(f"Error querying URL {url}: {error}")
+        return Response(
+            {"detail": f"Error querying URL: {str(error)}"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-        action = "created" if created else "updated"
-        logger.info(f"Book '{scraped_title}' {action} successfully.")
+
+    def saved_response(self, page):
+        [(book, action)] = save_scraped_books([page])
+        detail = (
+            "Book unchanged."
+            if action == "unchanged"
+            else f"Book {action} successfully."
+        )
+        logger.info(f"Book '{book.title}': {detail}")
 
         book_serializer = BookSerializer(book)
         return Response(
-            {"detail": f"Book {action} successfully.", "book": book_serializer.data},
+            {"detail": detail, "book": book_serializer.data},
             status=status.HTTP_200_OK,
         )
+
+
+class AsyncScrapeBookInfoView(AsyncViewMixin, ScrapeBookInfoView):
+    @scrape_book_schema
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        url = serializer.validated_data.get("url")
+
+        cached = (await sync_to_async(get_cached_pages)([url])).get(url)
+        try:
+            async with AsyncScrapeFetcher() as fetcher:
+                page = await fetcher.scrape(url, cached)
+        except Exception as e:
+            return self.error_response(url, e)
+        return await sync_to_async(self.saved_response)(page)
+
+
+class BatchScrapeBooksView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAdminUser]
+    throttle_cost = 20
+    serializer_class = BookBatchScrapeSerializer
+
+    @swagger_auto_schema(
+        operation_description="Queue a job that scrapes many URLs concurrently and "
+        "saves (or updates) the books; poll the returned status URL for results.",
+        request_body=BookBatchScrapeSerializer,
+        responses={202: ScrapeJobSerializer()},
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        job = ScrapeJob.objects.create(urls=serializer.validated_data["urls"])
+        enqueue_scrape_job(job)
+
+        return Response(
+            {
+                **ScrapeJobSerializer(job).data,
+                "status_url": request.build_absolute_uri(
+                    reverse("scrape-job-detail", args=[job.id])
+                ),
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class ScrapeJobDetailView(generics.RetrieveAPIView):
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = ScrapeJobSerializer
+    queryset = ScrapeJob.objects.all()
+
+    def retrieve(self, request, *args, **kwargs):
+        fail_stale_scrape_jobs(self.get_queryset().filter(pk=kwargs["pk"]))
+        return super().retrieve(request, *args, **kwargs)
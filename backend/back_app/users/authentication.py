@@ -0,0 +1,166 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from users.models import User
+from users.tokens import RefreshToken
+
+USER_CLAIMS = ("username", "is_staff", "is_superuser", "is_active")
+
+_users = {}
+_users_lock = threading.Lock()
+
+
+def get_cached_user(user_id):
+    """
+    Returns a copy of the user from the per-process cache, loading it from
+    the database on a miss or once ``USER_CACHE_TTL`` seconds have passed.
+    Entries are dropped when the user is saved or deleted (see
+    ``users.signals``).
+    """
+    user_id = User._meta.pk.to_python(user_id)
+    now = time.monotonic()
+    with _users_lock:
+        entry = _users.get(user_id)
+    if entry is None or entry[0] < now:
+        user = User.objects.get(pk=user_id)
+        with _users_lock:
+            _users[user_id] = (now + getattr(settings, "USER_CACHE_TTL", 60), user)
+    else:
+        user = entry[1]
+    return copy.copy(user)
+
+
+def invalidate_cached_user(user_id):
+    with _users_lock:
+        _users.pop(user_id, None)
+
+
+def clear_user_cache():
+    with _users_lock:
+        _users.clear()
+
+
+class UserClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    ``TokenRefreshSerializer`` checking the blacklist through
+    ``users.tokens.is_blacklisted`` and the user through the user cache.
+    """
+
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id:
+            try:
+                user = get_cached_user(user_id)
+            except User.DoesNotExist:
+                user = None
+            if not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed(
+                    self.error_messages["no_active_account"], "no_active_account"
+                )
+            # The claims in the refresh token are as old as the login; the
+            # new tokens carry the user's current ones.
+            for claim in USER_CLAIMS:
+                refresh[claim] = getattr(user, claim)
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data["refresh"] = str(refresh)
+
+        return data
+
+
+class ClaimsUser:
+    """
+    A ``User`` stand-in built from token claims. The claimed fields are
+    answered without a query; anything else loads the full user, through
+    the user cache, on first access.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        self.id = self.pk = User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM])
+        for claim in USER_CLAIMS:
+            setattr(self, claim, token[claim])
+
+    @cached_property
+    def user(self):
+        try:
+            return get_cached_user(self.id)
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other):
+        return isinstance(other, (ClaimsUser, User)) and self.pk == other.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return self.username
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` without the per-request ``User`` query: tokens
+    carrying the ``USER_CLAIMS`` give a ``ClaimsUser``, older tokens are
+    resolved through the per-process user cache.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        if all(claim in validated_token for claim in USER_CLAIMS):
+            user = ClaimsUser(validated_token)
+        else:
+            try:
+                user = get_cached_user(validated_token[api_settings.USER_ID_CLAIM])
+            except User.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -0,0 +1,33 @@
+from users.hashers import make_password
+from users.models import User
+
+USERNAME = "bench-user-{}"
+PASSWORD = "benchmark"
+
+
+def seed_users(count, staff=1, password=PASSWORD):
+    """
+    Creates ``bench-user-0`` to ``bench-user-{count - 1}``, the first
+    ``staff`` of them staff, sharing one password hash. Existing users are
+    kept as they are.
+    """
+    password_hash = make_password(password)
+    usernames = [USERNAME.format(i) for i in range(count)]
+    User.objects.bulk_create(
+        [
+            User(
+                username=username,
+                email=f"{username}@example.com",
+                password=password_hash,
+                is_staff=i < staff,
+            )
+            for i, username in enumerate(usernames)
+        ],
+        ignore_conflicts=True,
+    )
+    users = User.objects.in_bulk(usernames, field_name="username")
+    return [users[username] for username in usernames]
+
+
+def clear_users():
+    User.objects.filter(username__startswith=USERNAME.format("")).delete()
@@ -0,0 +1,159 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.crypto import get_random_string
+
+DEFAULTS = {
+    "WORKERS": 1,
+    "ARGON2_TIME_COST": hashers.Argon2PasswordHasher.time_cost,
+    "ARGON2_MEMORY_COST": hashers.Argon2PasswordHasher.memory_cost,
+    "ARGON2_PARALLELISM": hashers.Argon2PasswordHasher.parallelism,
+    "SCRYPT_WORK_FACTOR": hashers.ScryptPasswordHasher.work_factor,
+    "PBKDF2_ITERATIONS": hashers.PBKDF2PasswordHasher.iterations,
+}
+
+
+def hashing_setting(name):
+    return getattr(settings, "PASSWORD_HASHING", {}).get(name, DEFAULTS[name])
+
+
+def hashers_for(algorithm):
+    """``PASSWORD_HASHERS`` with the hasher of ``algorithm`` first."""
+    classes = settings.PASSWORD_HASHER_CLASSES
+    return [
+        classes[algorithm],
+        *(path for path in classes.values() if path != classes[algorithm]),
+    ]
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    def __init__(self):
+        self.time_cost = hashing_setting("ARGON2_TIME_COST")
+        self.memory_cost = hashing_setting("ARGON2_MEMORY_COST")
+        self.parallelism = hashing_setting("ARGON2_PARALLELISM")
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    # OpenSSL refuses to use more than 32 MiB unless allowed; this is only a
+    # ceiling, the work factor decides what a hash takes.
+    maxmem = 1024 * 1024 * 1024
+
+    def __init__(self):
+        self.work_factor = hashing_setting("SCRYPT_WORK_FACTOR")
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    def __init__(self):
+        self.iterations = hashing_setting("PBKDF2_ITERATIONS")
+
+
+class HashingPool:
+    """
+    Runs password hashing in a pool of ``WORKERS`` processes, so that a burst
+    of logins takes at most that many cores per server process and the request
+    threads only wait on a future. Every server process starts its own pool. ``WORKERS = 0`` hashes on the calling thread. The workers do
+    not load Django: they receive hasher instances with their cost set.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+
+    def get_executor(self):
+        with self.lock:
+            # A pool inherited through fork belongs to the parent process.
+            if self.executor is None or self.pid != os.getpid():
+                self.executor = ProcessPoolExecutor(
+                    max_workers=hashing_setting("WORKERS"),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                self.pid = os.getpid()
+            return self.executor
+
+    def run(self, function, *args):
+        if hashing_setting("WORKERS") <= 0:
+            return function(*args)
+        executor = self.get_executor()
+        try:
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool:
+            # A worker died, for example killed for its memory; start over once.
+            self.discard(executor)
+            return self.get_executor().submit(function, *args).result()
+
+    def discard(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None and self.pid == os.getpid():
+            executor.shutdown()
+
+
+hashing_pool = HashingPool()
+
+
+def _verify(hasher, preferred, password, encoded):
+    # django.contrib.auth.hashers.verify_password, with the hashers looked up
+    # by the caller because the worker has no settings.
+    if hasher is None:
+        preferred.encode(
+            get_random_string(hashers.UNUSABLE_PASSWORD_SUFFIX_LENGTH),
+            preferred.salt(),
+        )
+        return False, False
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    is_correct = hasher.verify(password, encoded)
+    if not is_correct and not hasher_changed and must_update:
+        hasher.harden_runtime(password, encoded)
+    return is_correct, must_update
+
+
+def make_password(password):
+    """``django.contrib.auth.hashers.make_password`` on ``hashing_pool``."""
+    if not isinstance(password, (bytes, str)):
+        return hashers.make_password(password)
+    hasher = hashers.get_hasher()
+    return hashing_pool.run(hasher.encode, password, hasher.salt())
+
+
+def check_password(password, encoded, setter=None):
+    """
+    ``django.contrib.auth.hashers.check_password`` on ``hashing_pool``. The
+    ``setter`` rehashes passwords whose hasher or cost is not the preferred
+    one, so changing either upgrades the hashes on the next login.
+    """
+    preferred = hashers.get_hasher()
+    hasher = None
+    if password is not None and hashers.is_password_usable(encoded):
+        try:
+            hasher = hashers.identify_hasher(encoded)
+        except ValueError:
+            pass
+    is_correct, must_update = hashing_pool.run(
+        _verify, hasher, preferred, password, encoded
+    )
+    if setter and is_correct and must_update:
+        setter(password)
+    return is_correct
+
+
+@receiver(setting_changed)
+def reset_hashers(setting, **kwargs):
+    if setting == "PASSWORD_HASHING":
+        hashers.get_hashers.cache_clear()
+        hashers.get_hashers_by_algorithm.cache_clear()
+        hashing_pool.shutdown()
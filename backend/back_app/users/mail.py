@@ -0,0 +1,130 @@
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from users.models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "BATCH_SIZE": 100,
+    "MAX_ATTEMPTS": 5,
+    "BACKOFF_SECONDS": 30,
+    "MAX_BACKOFF_SECONDS": 60 * 60,
+    "POLL_INTERVAL": 2,
+    "LEASE_SECONDS": 5 * 60,
+}
+
+
+def outbox_setting(name):
+    return getattr(settings, "EMAIL_OUTBOX", {}).get(name, DEFAULTS[name])
+
+
+def enqueue_mail(subject, message, recipient_list, from_email=None):
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or "",
+        to=list(recipient_list),
+    )
+
+
+async def aenqueue_mail(subject, message, recipient_list, from_email=None):
+    return await OutgoingEmail.objects.acreate(
+        subject=subject,
+        body=message,
+        from_email=from_email or "",
+        to=list(recipient_list),
+    )
+
+
+def backoff(attempts):
+    delay = outbox_setting("BACKOFF_SECONDS") * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(delay, outbox_setting("MAX_BACKOFF_SECONDS")))
+
+
+def fail(email, error, now):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= outbox_setting("MAX_ATTEMPTS"):
+        email.status = OutgoingEmail.Status.FAILED
+    else:
+        email.next_attempt_at = now + backoff(email.attempts)
+
+
+def claim_due_mail(batch_size, now):
+    """
+    Takes up to ``batch_size`` due emails for this worker by moving their
+    next attempt past ``LEASE_SECONDS``, in a short transaction with SKIP
+    LOCKED. Other workers skip them meanwhile; if this one dies before
+    recording the results, they are due again once the lease runs out.
+    """
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.Status.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        OutgoingEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            next_attempt_at=now
+            + datetime.timedelta(seconds=outbox_setting("LEASE_SECONDS"))
+        )
+    return emails
+
+
+def send_queued_mail(batch_size=None):
+    """
+    Sends one batch of due emails over a single SMTP connection. The batch is
+    claimed first (see ``claim_due_mail``), so several workers can run side
+    by side and no row lock is held while talking to the mail server. A
+    message that fails is retried with exponential backoff until
+    ``MAX_ATTEMPTS``; if the connection cannot be opened at all, the whole
+    batch is rescheduled. Returns ``(sent, failed)``.
+    """
+    batch_size = batch_size or outbox_setting("BATCH_SIZE")
+    sent = failed = 0
+    now = timezone.now()
+    emails = claim_due_mail(batch_size, now)
+    if not emails:
+        return sent, failed
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.error(f"Could not connect to the mail server: {exc}")
+        for email in emails:
+            fail(email, exc, now)
+        failed = len(emails)
+    else:
+        try:
+            for email in emails:
+                message = EmailMessage(
+                    email.subject,
+                    email.body,
+                    email.from_email or None,
+                    email.to,
+                    connection=connection,
+                )
+                try:
+                    message.send()
+                except Exception as exc:
+                    logger.error(f"Error sending email {email.id}: {exc}")
+                    fail(email, exc, now)
+                    failed += 1
+                else:
+                    email.status = OutgoingEmail.Status.SENT
+                    email.attempts += 1
+                    email.sent_at = timezone.now()
+                    sent += 1
+        finally:
+            connection.close()
+
+    with transaction.atomic():
+        OutgoingEmail.objects.bulk_update(
+            emails, ["status", "attempts", "last_error", "next_attempt_at", "sent_at"]
+        )
+    return sent, failed
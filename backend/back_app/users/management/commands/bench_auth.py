@@ -0,0 +1,55 @@
+from core.benchmarks import summarize, time_call, write_report
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from users.authentication import (
+    ClaimsJWTAuthentication,
+    UserClaimsTokenObtainPairSerializer,
+    clear_user_cache,
+)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare queries and time per authenticated request for the stock "
+        "JWTAuthentication and ClaimsJWTAuthentication."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=1000)
+        parser.add_argument("--json", dest="json_path")
+
+    def handle(self, *args, **options):
+        results = {}
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email="bench@example.com", username="bench-auth", password="bench"
+            )
+            token = UserClaimsTokenObtainPairSerializer.get_token(user).access_token
+            request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+            clear_user_cache()
+
+            for name, authentication in [
+                ("JWTAuthentication", JWTAuthentication()),
+                ("ClaimsJWTAuthentication", ClaimsJWTAuthentication()),
+            ]:
+
+                def authenticate():
+                    user, _ = authentication.authenticate(request)
+                    return user.is_staff
+
+                with CaptureQueriesContext(connection) as queries:
+                    samples = time_call(authenticate, options["repeat"], warmup=0)
+                results[name] = {
+                    **summarize(samples),
+                    "queries_per_request": len(queries) / options["repeat"],
+                }
+                self.stdout.write(f"{name:>24}: {results[name]}")
+            transaction.set_rollback(True)
+        clear_user_cache()
+
+        if options["json_path"]:
+            write_report(options["json_path"], results)
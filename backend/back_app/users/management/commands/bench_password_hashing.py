@@ -0,0 +1,91 @@
+import time
+
+from core.benchmarks import describe_environment, summarize, time_call, write_report
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from users.authentication import UserClaimsTokenObtainPairSerializer
+from users.hashers import hashers_for, hashing_pool
+from users.models import User
+
+PASSWORD = "correct horse battery staple"
+
+SCENARIOS = {
+    "pbkdf2_sha256-870k": ("pbkdf2_sha256", {"PBKDF2_ITERATIONS": 870000}),
+    "pbkdf2_sha256-600k": ("pbkdf2_sha256", {"PBKDF2_ITERATIONS": 600000}),
+    "scrypt-n16k": ("scrypt", {"SCRYPT_WORK_FACTOR": 2**14}),
+    "scrypt-n32k": ("scrypt", {"SCRYPT_WORK_FACTOR": 2**15}),
+    "argon2-t2-m100M-p8": (
+        "argon2",
+        {"ARGON2_TIME_COST": 2, "ARGON2_MEMORY_COST": 102400, "ARGON2_PARALLELISM": 8},
+    ),
+    "argon2-t3-m64M-p4": (
+        "argon2",
+        {"ARGON2_TIME_COST": 3, "ARGON2_MEMORY_COST": 65536, "ARGON2_PARALLELISM": 4},
+    ),
+    "argon2-t1-m46M-p1": (
+        "argon2",
+        {"ARGON2_TIME_COST": 1, "ARGON2_MEMORY_COST": 47104, "ARGON2_PARALLELISM": 1},
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure logins per second per core for each password hasher setting. "
+        "Every login validates the token obtain serializer, as /login/ does, "
+        "for a user whose password was hashed with that setting. Logins first "
+        "run on this thread, so the process CPU time covers the hashing, then "
+        "once more through a one-process hashing pool to show its latency. The "
+        "user is created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario", action="append", choices=list(SCENARIOS), dest="scenarios"
+        )
+        parser.add_argument("--logins", type=int, default=20)
+        parser.add_argument("--json", dest="json_path")
+
+    def handle(self, *args, **options):
+        report = {"environment": describe_environment(), "scenarios": {}}
+        for name in options["scenarios"] or SCENARIOS:
+            algorithm, costs = SCENARIOS[name]
+            hashing = {**settings.PASSWORD_HASHING, **costs}
+            with override_settings(
+                PASSWORD_HASHERS=hashers_for(algorithm),
+                PASSWORD_HASHING={**hashing, "WORKERS": 0},
+            ), transaction.atomic():
+                user = User.objects.create_user(
+                    email="bench-hashing@example.com",
+                    username="bench-hashing",
+                    password=PASSWORD,
+                )
+                login = self.login_for(user)
+                started = time.process_time()
+                samples = time_call(login, options["logins"])
+                cpu_seconds = time.process_time() - started
+                with override_settings(PASSWORD_HASHING={**hashing, "WORKERS": 1}):
+                    pool_samples = time_call(login, options["logins"])
+                    hashing_pool.shutdown()
+                transaction.set_rollback(True)
+
+            report["scenarios"][name] = {
+                **summarize(samples),
+                "logins_per_core_second": round(options["logins"] / cpu_seconds, 2),
+                "pool_p50_ms": summarize(pool_samples)["p50_ms"],
+            }
+            self.stdout.write(f"{name:>20}: {report['scenarios'][name]}")
+
+        if options["json_path"]:
+            write_report(options["json_path"], report)
+
+    def login_for(self, user):
+        def login():
+            serializer = UserClaimsTokenObtainPairSerializer(
+                data={"username": user.username, "password": PASSWORD}
+            )
+            serializer.is_valid(raise_exception=True)
+
+        return login
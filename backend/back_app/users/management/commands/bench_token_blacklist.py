@@ -0,0 +1,81 @@
+import datetime
+
+from core.benchmarks import summarize, time_call, write_report
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from users.authentication import CachedTokenRefreshSerializer, clear_user_cache
+from users.models import User
+from users.tokens import RefreshToken, blacklist_index
+
+
+def seed_tokens(user, first, last, batch_size=10000):
+    expires_at = timezone.now() + datetime.timedelta(days=1)
+    for start in range(first, last, batch_size):
+        tokens = OutstandingToken.objects.bulk_create(
+            OutstandingToken(
+                user=user, jti=f"bench-{i}", token="", expires_at=expires_at
+            )
+            for i in range(start, min(start + batch_size, last))
+        )
+        BlacklistedToken.objects.bulk_create(
+            BlacklistedToken(token=token) for token in tokens
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"ANALYZE {OutstandingToken._meta.db_table}, "
+            f"{BlacklistedToken._meta.db_table}"
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the refresh endpoint serializer with the stock blacklist check "
+        "and with the cached one, as the blacklist grows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10000,100000")
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--json", dest="json_path")
+
+    def handle(self, *args, **options):
+        results = {}
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email="bench@example.com", username="bench-jwt", password="bench"
+            )
+            refresh = str(RefreshToken.for_user(user))
+            seeded = 0
+            for size in map(int, options["sizes"].split(",")):
+                seed_tokens(user, seeded, size)
+                seeded = size
+                clear_user_cache()
+                blacklist_index.reset()
+                results[size] = {}
+                for name, serializer_class in [
+                    ("stock", TokenRefreshSerializer),
+                    ("cached", CachedTokenRefreshSerializer),
+                ]:
+
+                    def validate():
+                        serializer = serializer_class(data={"refresh": refresh})
+                        serializer.is_valid(raise_exception=True)
+
+                    results[size][name] = summarize(
+                        time_call(validate, options["repeat"])
+                    )
+                    self.stdout.write(
+                        f"{size:>9} blacklisted {name:>7}: {results[size][name]}"
+                    )
+            transaction.set_rollback(True)
+        blacklist_index.reset()
+        clear_user_cache()
+
+        if options["json_path"]:
+            write_report(options["json_path"], results)
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding and blacklisted tokens in small chunks, "
+        "each in its own short transaction. With --interval, repeat forever."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--pause", type=float, default=0.1)
+        parser.add_argument("--interval", type=float)
+
+    def prune(self, chunk_size, pause):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            ids = list(
+                OutstandingToken.objects.filter(expires_at__lte=now)
+                .order_by("id")
+                .values_list("id", flat=True)[:chunk_size]
+            )
+            if not ids:
+                return deleted
+            with transaction.atomic():
+                BlacklistedToken.objects.filter(token_id__in=ids).delete()
+                OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            if pause:
+                time.sleep(pause)
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = self.prune(options["chunk_size"], options["pause"])
+            self.stdout.write(f"Deleted {deleted} expired tokens.")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
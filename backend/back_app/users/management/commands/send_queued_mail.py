@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from users.mail import outbox_setting, send_queued_mail
+
+
+class Command(BaseCommand):
+    help = (
+        "Send queued emails in batches over one SMTP connection per batch, "
+        "retrying failures with backoff. Runs until stopped unless --once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int)
+        parser.add_argument("--interval", type=float)
+        parser.add_argument("--once", action="store_true")
+
+    def handle(self, *args, **options):
+        interval = options["interval"] or outbox_setting("POLL_INTERVAL")
+        while True:
+            sent, failed = send_queued_mail(options["batch_size"])
+            if sent or failed:
+                self.stdout.write(f"{sent} sent, {failed} failed")
+            elif options["once"]:
+                break
+            else:
+                time.sleep(interval)
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_outgoingemail"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outgoingemail",
+            name="next_attempt_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
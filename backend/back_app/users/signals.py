@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from users.authentication import invalidate_cached_user
+from users.models import User
+from users.tokens import remember_blacklisted
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def remember_blacklisted_token(sender, instance, created, **kwargs):
+    if created:
+        remember_blacklisted(instance.token.jti, instance.token.expires_at)
@@ -1,3 +1,538 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import socketserver
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import requests
+from core.benchmarks import percentile
+from core.middleware import PublicURLCsrfViewMiddleware
+from core.utils import DEFAULT_PUBLIC_URL, clear_public_url, get_public_url
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import AccessToken
+from users.authentication import (
+    ClaimsJWTAuthentication,
+    clear_user_cache,
+    get_cached_user,
+)
+from users.hashers import hashing_pool
+from users.mail import claim_due_mail, enqueue_mail, send_queued_mail
+from users.models import OutgoingEmail, User
+from users.tokens import (
+    BloomFilter,
+    RefreshToken,
+    blacklist_index,
+    blacklist_setting,
+)
+from users.views import AsyncPasswordResetRequestView
+
+
+class PublicURLTests(TestCase):
+    def setUp(self):
+        clear_public_url()
+        self.addCleanup(clear_public_url)
+        environ = mock.patch.dict(os.environ)
+        environ.start()
+        self.addCleanup(environ.stop)
+        os.environ.pop("PUBLIC_URL", None)
+
+    def test_env_var_wins(self):
+        os.environ["PUBLIC_URL"] = "https://library.example.com/"
+        with mock.patch("requests.get") as get:
+            self.assertEqual(get_public_url(), "https://library.example.com")
+        get.assert_not_called()
+
+    def test_discovery_is_lazy_and_memoized(self):
+        response = mock.Mock()
+        response.json.return_value = {
+            "tunnels": [
+                {"public_url": "http://abc.ngrok.app"},
+                {"public_url": "https://abc.ngrok.app"},
+            ]
+        }
+        with mock.patch("requests.get", return_value=response) as get:
+            self.assertEqual(get_public_url(), "https://abc.ngrok.app")
+            self.assertEqual(get_public_url(), "https://abc.ngrok.app")
+        get.assert_called_once()
+        self.assertEqual(get.call_args.kwargs["timeout"], 1)
+
+    def test_discovery_failure_falls_back_and_is_retried(self):
+        response = mock.Mock()
+        response.json.return_value = {
+            "tunnels": [{"public_url": "https://abc.ngrok.app"}]
+        }
+        with mock.patch("requests.get", side_effect=requests.ConnectionError) as get:
+            self.assertEqual(get_public_url(), DEFAULT_PUBLIC_URL)
+            self.assertEqual(get_public_url(), DEFAULT_PUBLIC_URL)
+            get.assert_called_once()
+
+            get.side_effect, get.return_value = None, response
+            later = time.monotonic() + 61
+            with mock.patch("core.utils.time.monotonic", return_value=later):
+                self.assertEqual(get_public_url(), "https://abc.ngrok.app")
+        self.assertEqual(get.call_count, 2)
+
+    def test_csrf_trusts_public_url(self):
+        os.environ["PUBLIC_URL"] = "https://library.example.com"
+        middleware = PublicURLCsrfViewMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+        trusted = factory.post(
+            "/", HTTP_ORIGIN="https://library.example.com", HTTP_HOST="django:8000"
+        )
+        other = factory.post(
+            "/", HTTP_ORIGIN="https://evil.example.com", HTTP_HOST="django:8000"
+        )
+        self.assertTrue(middleware._origin_verified(trusted))
+        self.assertFalse(middleware._origin_verified(other))
+
+    def test_password_reset_link(self):
+        os.environ["PUBLIC_URL"] = "https://library.example.com"
+        user = User.objects.create_user(
+            email="reader@example.com", username="reader", password="password"
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(reverse("password-reset"), {"email": user.email})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            "https://library.example.com/users/reset-password-confirm/",
+            OutgoingEmail.objects.get().body,
+        )
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 stub ESMTP")
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            time.sleep(server.delay)
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 stub")
+            elif command.startswith("RCPT") and "BOUNCE" in command:
+                self.reply("550 no such user")
+            elif command == "DATA":
+                self.reply("354 end with .")
+                data = []
+                while (line := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(line.decode())
+                with server.lock:
+                    server.messages.append("".join(data))
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="hasher@example.com", username="hasher", password="password"
+        )
+        self.client = APIClient()
+
+    def login(self, password="password"):
+        return self.client.post(
+            reverse("token_obtain_pair"),
+            {"username": "hasher", "password": password},
+        )
+
+    def test_hashes_in_the_pool_with_the_preferred_hasher(self):
+        self.assertNotEqual(hashing_pool.run(os.getpid), os.getpid())
+        self.assertTrue(self.user.password.startswith("argon2$"))
+        self.assertTrue(self.user.check_password("password"))
+        self.assertFalse(self.user.check_password("wrong"))
+
+    def test_login_upgrades_other_hashers(self):
+        self.user.password = PBKDF2PasswordHasher().encode("password", "salt", 1000)
+        self.user.save()
+
+        self.assertEqual(self.login("wrong").status_code, 401)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$1000$"))
+
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("argon2$"))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_login_upgrades_to_a_new_cost(self):
+        cheaper = {
+            **settings.PASSWORD_HASHING,
+            "ARGON2_TIME_COST": 1,
+            "ARGON2_MEMORY_COST": 8192,
+        }
+        with override_settings(PASSWORD_HASHING=cheaper):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIn("$m=8192,t=1,", self.user.password)
+
+    @override_settings(PASSWORD_HASHING={"WORKERS": 0})
+    def test_hashes_inline_without_workers(self):
+        self.assertEqual(hashing_pool.run(os.getpid), os.getpid())
+        self.assertTrue(self.user.check_password("password"))
+
+
+class OutgoingEmailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), StubSMTPHandler)
+        cls.server.daemon_threads = True
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.smtp = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=cls.server.server_address[1],
+            EMAIL_TIMEOUT=5,
+        )
+        cls.smtp.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.smtp.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.connections = 0
+        self.server.messages = []
+        self.server.delay = 0
+        self.user = User.objects.create_user(
+            email="reader@example.com", username="reader", password="password"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reset_request_only_enqueues(self):
+        response = self.client.post(
+            reverse("password-reset"), {"email": self.user.email}
+        )
+        self.assertEqual(response.status_code, 200)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.status, OutgoingEmail.Status.PENDING)
+        self.assertEqual(email.to, [self.user.email])
+        self.assertIn("/users/reset-password-confirm/", email.body)
+        self.assertEqual(self.server.connections, 0)
+
+    async def test_async_reset_request_enqueues(self):
+        request = APIRequestFactory().post(
+            "/", {"email": self.user.email}, format="json"
+        )
+        force_authenticate(request, self.user)
+        response = await AsyncPasswordResetRequestView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        email = await OutgoingEmail.objects.aget()
+        self.assertEqual(email.to, [self.user.email])
+        self.assertIn("/users/reset-password-confirm/", email.body)
+
+        request = APIRequestFactory().post(
+            "/", {"email": "nobody@example.com"}, format="json"
+        )
+        force_authenticate(request, self.user)
+        response = await AsyncPasswordResetRequestView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+
+    def test_worker_sends_batch_over_one_connection(self):
+        for i in range(5):
+            enqueue_mail("Subject", f"Message {i}", [f"user{i}@example.com"])
+        out = io.StringIO()
+        call_command("send_queued_mail", "--once", stdout=out)
+        self.assertIn("5 sent, 0 failed", out.getvalue())
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertFalse(
+            OutgoingEmail.objects.exclude(status=OutgoingEmail.Status.SENT).exists()
+        )
+
+    def test_failed_message_is_retried_with_backoff(self):
+        enqueue_mail("Subject", "Hello", ["ok@example.com"])
+        bounced = enqueue_mail("Subject", "Hello", ["bounce@example.com"])
+        self.assertEqual(send_queued_mail(), (1, 1))
+
+        bounced.refresh_from_db()
+        self.assertEqual(bounced.status, OutgoingEmail.Status.PENDING)
+        self.assertEqual(bounced.attempts, 1)
+        self.assertIn("550", bounced.last_error)
+        self.assertGreater(bounced.next_attempt_at, timezone.now())
+        self.assertEqual(send_queued_mail(), (0, 0))
+
+    def test_sends_outside_the_claiming_transaction(self):
+        enqueue_mail("Subject", "Hello", ["user@example.com"])
+        depth = len(connection.atomic_blocks)
+        during_send = []
+
+        def send(message, fail_silently=False):
+            # Another worker finds nothing due while this one sends.
+            during_send.append(
+                (len(connection.atomic_blocks), claim_due_mail(10, timezone.now()))
+            )
+            return 1
+
+        with mock.patch.object(EmailMessage, "send", send):
+            self.assertEqual(send_queued_mail(), (1, 0))
+        self.assertEqual(during_send, [(depth, [])])
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.Status.SENT)
+
+    @override_settings(EMAIL_OUTBOX={"MAX_ATTEMPTS": 2})
+    def test_smtp_outage_reschedules_then_gives_up(self):
+        email = enqueue_mail("Subject", "Hello", ["user@example.com"])
+        with override_settings(EMAIL_PORT=1):
+            for _ in range(2):
+                self.assertEqual(send_queued_mail(), (0, 1))
+                OutgoingEmail.objects.update(
+                    next_attempt_at=timezone.now() - datetime.timedelta(seconds=1)
+                )
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.Status.FAILED)
+        self.assertEqual(email.attempts, 2)
+
+    def test_mail_scheduled_for_later_waits(self):
+        later = timezone.now() + datetime.timedelta(hours=1)
+        email = OutgoingEmail.objects.create(
+            subject="Subject",
+            body="Hello",
+            to=["user@example.com"],
+            next_attempt_at=later,
+        )
+        self.assertEqual(email.next_attempt_at, later)
+        self.assertEqual(send_queued_mail(), (0, 0))
+
+    def test_endpoint_latency_does_not_depend_on_smtp(self):
+        self.server.delay = 0.2
+        samples = []
+        for _ in range(20):
+            started = time.perf_counter()
+            response = self.client.post(
+                reverse("password-reset"), {"email": self.user.email}
+            )
+            samples.append(time.perf_counter() - started)
+            self.assertEqual(response.status_code, 200)
+        self.assertLess(percentile(samples, 99), self.server.delay)
+        self.assertEqual(self.server.connections, 0)
+        self.assertEqual(OutgoingEmail.objects.count(), 20)
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="reader@example.com", username="reader", password="password"
+        )
+
+    def setUp(self):
+        clear_user_cache()
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {"username": "reader", "password": "password"},
+        )
+        return response.json()["access"]
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_token_carries_user_claims(self):
+        token = AccessToken(self.login())
+        self.assertEqual(token["username"], "reader")
+        self.assertIs(token["is_staff"], False)
+        self.assertIs(token["is_superuser"], False)
+        self.assertIs(token["is_active"], True)
+
+    def test_authenticates_without_queries(self):
+        token = self.login()
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertEqual(user.username, "reader")
+            self.assertFalse(user.is_staff)
+            self.assertTrue(user.is_authenticated)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "reader@example.com")
+        self.assertEqual(user, self.user)
+
+    def test_full_user_is_loaded_once_per_process(self):
+        token = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("user-retrieve"))
+        self.assertEqual(response.json()["email"], "reader@example.com")
+        with self.assertNumQueries(0):
+            self.client.get(reverse("user-retrieve"))
+
+    def test_inactive_claim_is_rejected(self):
+        token = AccessToken.for_user(self.user)
+        token.payload.update(
+            username="reader", is_staff=False, is_superuser=False, is_active=False
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.client.get(reverse("user-retrieve")).status_code, 401)
+
+    def test_token_without_claims_uses_user_cache(self):
+        token = str(AccessToken.for_user(self.user))
+        with self.assertNumQueries(1):
+            self.authenticate(token)
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+        self.assertEqual(user.email, "reader@example.com")
+
+    def test_refresh_carries_current_claims(self):
+        self.user.is_staff = True
+        self.user.save()
+        refresh = self.client.post(
+            reverse("token_obtain_pair"),
+            {"username": "reader", "password": "password"},
+        ).json()["refresh"]
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.client.post(reverse("token_refresh"), {"refresh": refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(AccessToken(response.json()["access"])["is_staff"], False)
+        self.assertFalse(self.authenticate(response.json()["access"]).is_staff)
+
+    def test_cache_is_invalidated_on_save(self):
+        get_cached_user(self.user.pk)
+        self.user.email = "changed@example.com"
+        self.user.save()
+        self.assertEqual(get_cached_user(self.user.pk).email, "changed@example.com")
+
+
+class TokenBlacklistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="reader@example.com", username="reader", password="password"
+        )
+
+    def setUp(self):
+        clear_user_cache()
+        blacklist_index.reset()
+        self.addCleanup(blacklist_index.reset)
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post(reverse("token_refresh"), {"refresh": str(token)})
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"jti-{i}")
+        self.assertTrue(all(f"jti-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+    def test_refresh_does_not_query_the_blacklist(self):
+        token = RefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refresh(token).status_code, 200)
+
+    def test_blacklisted_token_is_rejected(self):
+        token = RefreshToken.for_user(self.user)
+        self.refresh(token)
+        token.blacklist()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refresh(token).status_code, 401)
+
+    @override_settings(TOKEN_BLACKLIST={"SYNC_INTERVAL": 0})
+    def test_blacklist_written_elsewhere_is_picked_up(self):
+        token = RefreshToken.for_user(self.user)
+        self.refresh(token)
+        # bulk_create sends no signals, like a write from another process.
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(token=OutstandingToken.objects.get(jti=token["jti"]))]
+        )
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    @override_settings(TOKEN_BLACKLIST={"SYNC_INTERVAL": 0})
+    def test_blacklist_committed_out_of_id_order_is_picked_up(self):
+        early, late = RefreshToken.for_user(self.user), RefreshToken.for_user(self.user)
+        outstanding = OutstandingToken.objects.in_bulk(
+            [early["jti"], late["jti"]], field_name="jti"
+        )
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(id=1000, token=outstanding[late["jti"]])]
+        )
+        self.assertEqual(self.refresh(late).status_code, 401)
+        # A transaction that took a lower id commits after the sync above.
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(id=999, token=outstanding[early["jti"]])]
+        )
+        self.assertEqual(self.refresh(early).status_code, 401)
+
+    def test_rebuild_does_not_hold_up_other_requests(self):
+        blacklist_index.might_contain("jti")
+        blacklist_index.built_at -= blacklist_setting("REBUILD_INTERVAL") + 1
+        # Another thread is rebuilding; this one keeps the old filter.
+        with blacklist_index.rebuild_lock, self.assertNumQueries(0):
+            self.assertFalse(blacklist_index.might_contain("jti"))
+        with self.assertNumQueries(2):
+            self.assertFalse(blacklist_index.might_contain("jti"))
+
+    def test_jtis_added_during_a_rebuild_are_kept(self):
+        now = timezone.now
+
+        def add_during_scan():
+            blacklist_index.add("added-elsewhere")
+            return now()
+
+        with mock.patch("users.tokens.timezone.now", add_during_scan):
+            blacklist_index.refresh()
+        self.assertTrue(blacklist_index.might_contain("added-elsewhere"))
+
+    def test_rotation_blacklists_the_old_token(self):
+        token = RefreshToken.for_user(self.user)
+        with mock.patch.object(api_settings, "ROTATE_REFRESH_TOKENS", True):
+            response = self.refresh(token)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.refresh(token).status_code, 401)
+            self.assertEqual(self.refresh(response.json()["refresh"]).status_code, 200)
+
+    def test_prune_tokens(self):
+        expired = timezone.now() - datetime.timedelta(days=1)
+        tokens = OutstandingToken.objects.bulk_create(
+            OutstandingToken(
+                jti=f"expired-{i}", token="x", user=self.user, expires_at=expired
+            )
+            for i in range(5)
+        )
+        BlacklistedToken.objects.bulk_create(
+            BlacklistedToken(token=token) for token in tokens[:3]
+        )
+        live = RefreshToken.for_user(self.user)
+        out = io.StringIO()
+        call_command("prune_tokens", "--chunk-size", "2", "--pause", "0", stdout=out)
+        self.assertIn("Deleted 5 expired tokens.", out.getvalue())
+        self.assertEqual(
+            list(OutstandingToken.objects.values_list("jti", flat=True)), [live["jti"]]
+        )
+        self.assertFalse(BlacklistedToken.objects.exists())
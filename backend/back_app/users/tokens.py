@@ -0,0 +1,187 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+BLACKLIST_KEY = "users:blacklisted:{}"
+
+DEFAULTS = {
+    "SYNC_INTERVAL": 1,
+    "REBUILD_INTERVAL": 10 * 60,
+    "SYNC_LOOKBACK": 100,
+    "FALSE_POSITIVE_RATE": 0.001,
+    "MIN_CAPACITY": 100000,
+}
+
+
+def blacklist_setting(name):
+    return getattr(settings, "TOKEN_BLACKLIST", {}).get(name, DEFAULTS[name])
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(value)
+        )
+
+
+class BlacklistIndex:
+    """
+    A per-process bloom filter of the jtis of unexpired blacklisted tokens.
+    A miss means the token is not blacklisted, so most checks never leave
+    the process; a hit is confirmed through the cache and then the database.
+
+    Rows blacklisted by other processes are picked up every
+    ``SYNC_INTERVAL`` seconds with a primary key range query, whose cost
+    does not depend on the table size. The range starts ``SYNC_LOOKBACK`` ids
+    below the highest one seen, because transactions do not commit in id
+    order: a row that shows up after a higher id is still found while fewer
+    than that many rows were blacklisted in between. The filter is rebuilt
+    from scratch every ``REBUILD_INTERVAL`` seconds, dropping expired tokens.
+
+    A rebuild scans the table outside ``lock``, one thread at a time, while
+    the other requests keep using and syncing the old filter; jtis added in
+    the meantime are carried over when the new filter is swapped in. Only
+    the first build, with no filter to fall back on, makes callers wait.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rebuild_lock = threading.Lock()
+        self.filter = None
+        self.added = None
+
+    def needs_rebuild(self):
+        return (
+            self.filter is None
+            or time.monotonic() - self.built_at > blacklist_setting("REBUILD_INTERVAL")
+            or self.filter.count > self.filter.capacity
+        )
+
+    def rebuild(self):
+        started = time.monotonic()
+        with self.lock:
+            self.added = []
+        now = timezone.now()
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+        capacity = max(rows.count() * 2, blacklist_setting("MIN_CAPACITY"))
+        bloom = BloomFilter(capacity, blacklist_setting("FALSE_POSITIVE_RATE"))
+        last_id = 0
+        for row_id, jti in rows.values_list("id", "token__jti").iterator(
+            chunk_size=10000
+        ):
+            bloom.add(jti)
+            last_id = max(last_id, row_id)
+        with self.lock:
+            for jti in self.added:
+                bloom.add(jti)
+            self.filter, self.last_id, self.added = bloom, last_id, None
+            # Rows committed during the scan are picked up by the next sync.
+            self.synced_at = self.built_at = started
+
+    def sync(self):
+        since = self.last_id - blacklist_setting("SYNC_LOOKBACK")
+        new_rows = BlacklistedToken.objects.filter(id__gt=since).values_list(
+            "id", "token__jti"
+        )
+        for row_id, jti in new_rows:
+            # Rows read again keep the count, which decides the rebuilds.
+            if jti not in self.filter:
+                self.add_locked(jti)
+            self.last_id = max(self.last_id, row_id)
+        self.synced_at = time.monotonic()
+
+    def refresh(self):
+        if self.needs_rebuild() and self.rebuild_lock.acquire(
+            blocking=self.filter is None
+        ):
+            try:
+                if self.needs_rebuild():
+                    self.rebuild()
+            finally:
+                self.rebuild_lock.release()
+        with self.lock:
+            if (
+                self.filter is not None
+                and time.monotonic() - self.synced_at
+                > blacklist_setting("SYNC_INTERVAL")
+            ):
+                self.sync()
+
+    def add_locked(self, jti):
+        if self.filter is not None:
+            self.filter.add(jti)
+        if self.added is not None:
+            self.added.append(jti)
+
+    def add(self, jti):
+        with self.lock:
+            self.add_locked(jti)
+
+    def might_contain(self, jti):
+        self.refresh()
+        return jti in self.filter
+
+    def reset(self):
+        with self.lock:
+            self.filter = None
+
+
+blacklist_index = BlacklistIndex()
+
+
+def remember_blacklisted(jti, expires_at):
+    blacklist_index.add(jti)
+    timeout = (expires_at - timezone.now()).total_seconds()
+    if timeout > 0:
+        cache.set(BLACKLIST_KEY.format(jti), True, timeout)
+
+
+def is_blacklisted(jti):
+    if not blacklist_index.might_contain(jti):
+        return False
+    if cache.get(BLACKLIST_KEY.format(jti)):
+        return True
+    row = (
+        BlacklistedToken.objects.filter(token__jti=jti)
+        .values_list("token__expires_at", flat=True)
+        .first()
+    )
+    if row is None:
+        return False
+    remember_blacklisted(jti, row)
+    return True
+
+
+class RefreshToken(BaseRefreshToken):
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
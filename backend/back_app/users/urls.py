@@ -1,5 +1,7 @@
+from core.async_views import select_view
 from django.urls import path
 from users.views import (
+    AsyncPasswordResetRequestView,
     PasswordResetConfirmView,
     PasswordResetRequestView,
     UserRegistrationView,
@@ -9,7 +11,11 @@ from users.views import (
 
 urlpatterns = [
     path("info/", UserRetrieveView.as_view(), name="user-retrieve"),
-    path("reset-password/", PasswordResetRequestView.as_view(), name="password-reset"),
+    path(
+        "reset-password/",
+        select_view(PasswordResetRequestView, AsyncPasswordResetRequestView).as_view(),
+        name="password-reset",
+    ),
     path(
         "reset-password-confirm/<str:uidb64>/<str:token>/",
         PasswordResetConfirmView.as_view(),
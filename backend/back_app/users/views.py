@@ -1,15 +1,17 @@
 import uuid
 
-from core.settings import URL_NGROK_HOST
+from asgiref.sync import sync_to_async
+from core.async_views import AsyncViewMixin
+from core.utils import get_public_url
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
 from django.shortcuts import get_object_or_404
 from django.utils.encoding import force_bytes
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, mixins, status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from users.mail import aenqueue_mail, enqueue_mail
 from users.models import User
 from users.permissions import IsOwnerOrAdmin
 from users.serializers import (
@@ -31,6 +33,7 @@ class UserRetrieveView(generics.RetrieveAPIView):
 class PasswordResetRequestView(mixins.CreateModelMixin, generics.GenericAPIView):
     serializer_class = PasswordResetRequestSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    throttle_cost = 5
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -38,23 +41,39 @@ class PasswordResetRequestView(mixins.CreateModelMixin, generics.GenericAPIView)
 
         email = serializer.validated_data["email"]
         user = User.objects.get(email=email)
+        enqueue_mail(**self.get_reset_mail(user))
+        return self.sent_response()
 
+    def get_reset_mail(self, user):
         token = default_token_generator.make_token(user)
         uid = urlsafe_base64_encode(force_bytes(user.pk))
 
-        reset_url = f"{URL_NGROK_HOST}/users/reset-password-confirm/{uid}/{token}/"
-        send_mail(
-            subject="Password Reset Request",
-            message=f"Use the link to reset your password: {reset_url}",
-            from_email=None,
-            recipient_list=[email],
-        )
+        reset_url = f"{get_public_url()}/users/reset-password-confirm/{uid}/{token}/"
+        return {
+            "subject": "Password Reset Request",
+            "message": f"Use the link to reset your password: {reset_url}",
+            "from_email": None,
+            "recipient_list": [user.email],
+        }
 
+    def sent_response(self):
         return Response(
             {"detail": "Password reset link sent."}, status=status.HTTP_200_OK
         )
 
 
+class AsyncPasswordResetRequestView(AsyncViewMixin, PasswordResetRequestView):
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        user = await User.objects.aget(email=serializer.validated_data["email"])
+        # The public URL may be looked up over the network on first use.
+        mail = await sync_to_async(self.get_reset_mail, thread_sensitive=False)(user)
+        await aenqueue_mail(**mail)
+        return self.sent_response()
+
+
 class PasswordResetConfirmView(mixins.UpdateModelMixin, generics.GenericAPIView):
     serializer_class = PasswordResetConfirmSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
@@ -89,6 +108,7 @@ class PasswordResetConfirmView(mixins.UpdateModelMixin, generics.GenericAPIView)
 class UserRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
     permission_classes = [AllowAny]
+    throttle_cost = 10
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)